@@ -0,0 +1,550 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the backend.
+
+Each benchmark copies the database (db/db.sqlite, created by create_db.py) to a
+temporary directory, fills it with generated data, starts a uvicorn server on it
+and measures the requests made by the frontend.
+
+Usage (from the backend directory):
+    python benchmark.py concurrency [--passages 50000] [--workers 1]
+    python benchmark.py profile [--passages 2000] [--opened 20]
+    python benchmark.py stock [--purchases 400] [--clients 16] [--workers 4]
+    python benchmark.py compression [--passages 50000]
+    python benchmark.py serialization [--passages 50000]
+    python benchmark.py import [--rows 100000] [--clients 1000]
+    python benchmark.py search [--clients 100000] [--produits 10000]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DB = os.path.join(BACKEND_DIR, "db", "db.sqlite")
+
+
+def seed_database(work_dir, passages):
+    """Copy the database to work_dir/db/db.sqlite and add generated bons de passage."""
+    os.makedirs(os.path.join(work_dir, "db"), exist_ok=True)
+    db_path = os.path.join(work_dir, "db", "db.sqlite")
+    shutil.copyfile(SOURCE_DB, db_path)
+
+    conn = sqlite3.connect(db_path)
+    contrats = conn.execute("SELECT id, client_id FROM Contrat_Forfait").fetchall()
+    random.seed(42)
+
+    rows = []
+    for _ in range(passages):
+        contrat_id, client_id = random.choice(contrats)
+        date = "%d-%02d-%02d" % (random.randint(2020, 2024), random.randint(1, 12), random.randint(1, 28))
+        poids = random.randint(1, 300)
+        rows.append((date, poids * 10, max(0, poids - 100), poids, client_id, contrat_id))
+
+    conn.executemany("""
+        INSERT INTO Bon_Passage_Forfait (date, montant, exces_poids, poids_collecte, client_id, contrat_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def seed_versements(db_path, versements):
+    """Add generated versements forfait."""
+    conn = sqlite3.connect(db_path)
+    contrats = conn.execute("SELECT id, client_id FROM Contrat_Forfait").fetchall()
+    random.seed(43)
+    rows = []
+    for _ in range(versements):
+        contrat_id, client_id = random.choice(contrats)
+        date = "%d-%02d-%02d" % (random.randint(2020, 2024), random.randint(1, 12), random.randint(1, 28))
+        rows.append((date, random.randint(1, 500) * 100, client_id, contrat_id))
+    conn.executemany(
+        "INSERT INTO Versement_Forfait (date, montant, client_id, contrat_id) VALUES (?, ?, ?, ?)", rows
+    )
+    conn.commit()
+    conn.close()
+
+
+def seed_bon_lines(db_path, client_id):
+    """Add produit and service lines to the bons de passage of a client."""
+    conn = sqlite3.connect(db_path)
+    bons = [row[0] for row in conn.execute(
+        "SELECT id FROM Bon_Passage_Forfait WHERE client_id = ?", (client_id,))]
+    # The produit lines consume stock: put enough in stock before them
+    conn.executemany(
+        "INSERT INTO Mouvement_Stock (date, produit, type, qte, prix) VALUES ('2000-01-01', ?, 'Achat', ?, 150)",
+        [(produit, 2 * len(bons)) for produit in ("Sac 100L", "Conteneur")]
+    )
+    conn.executemany(
+        "INSERT INTO Bon_Passage_Forfait_Produits (produit, qte, prix, bon_passage_id) VALUES (?, ?, ?, ?)",
+        [(produit, 2, 150, bon_id) for bon_id in bons for produit in ("Sac 100L", "Conteneur")]
+    )
+    conn.executemany(
+        "INSERT INTO Bon_Passage_Forfait_Services (service, qte, bon_passage_id) VALUES (?, ?, ?)",
+        [("Collecte", 1, bon_id) for bon_id in bons]
+    )
+    conn.commit()
+    conn.close()
+    return bons
+
+
+def free_port():
+    """Find a free TCP port for the server."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """A uvicorn server running main:app on a seeded database."""
+
+    def __init__(self, work_dir, workers=1, env=None):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+                   "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning"]
+        if workers > 1:
+            command += ["--workers", str(workers)]
+        server_env = dict(os.environ)
+        server_env.update(env or {})
+        # The server runs in work_dir so the default db/db.sqlite path is the seeded database
+        self.process = subprocess.Popen(command, cwd=work_dir, env=server_env)
+
+    def __enter__(self):
+        # Wait for the server to accept requests
+        for _ in range(100):
+            try:
+                get(self.base_url + "/api/agents")
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.process.terminate()
+        raise RuntimeError("The server did not start")
+
+    def __exit__(self, *args):
+        self.process.terminate()
+        self.process.wait()
+
+
+def get(url, headers=None):
+    """GET a url and return (status, body, duration in ms)."""
+    request = urllib.request.Request(url, headers=headers or {})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        body = response.read()
+        status = response.status
+    return status, body, (time.perf_counter() - start) * 1000
+
+
+def send(method, url, body=None):
+    """Send a JSON request and return (status, decoded body, duration in ms)."""
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            status, body = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, body = e.code, e.read()
+    return status, json.loads(body or "null"), (time.perf_counter() - start) * 1000
+
+
+def summary(durations):
+    """Format latency percentiles of a list of durations (ms)."""
+    durations = sorted(durations)
+    p95 = durations[min(len(durations) - 1, int(round((len(durations) - 1) * 0.95)))]
+    return "n=%d  p50=%.1f ms  p95=%.1f ms  max=%.1f ms" % (
+        len(durations), statistics.median(durations), p95, durations[-1])
+
+
+def bench_concurrency(args):
+    """Latency of small requests while slow list requests run at the same time."""
+    work_dir = tempfile.mkdtemp()
+    try:
+        seed_database(work_dir, args.passages)
+        with Server(work_dir, workers=args.workers) as server:
+            fast_url = server.base_url + "/api/agents"
+            slow_url = server.base_url + "/api/bon-passage-forfait"
+
+            # 1. Small requests alone
+            alone = [get(fast_url)[2] for _ in range(args.requests)]
+
+            # 2. The same small requests while slow requests keep running in parallel
+            stop = threading.Event()
+            slow_durations = []
+
+            def slow_loop():
+                while not stop.is_set():
+                    slow_durations.append(get(slow_url)[2])
+
+            threads = [threading.Thread(target=slow_loop) for _ in range(args.slow_clients)]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.5)
+            loaded = [get(fast_url)[2] for _ in range(args.requests)]
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        print(f"Bons de passage: {args.passages}, slow clients: {args.slow_clients}, workers: {args.workers}")
+        print("GET /api/agents alone:              " + summary(alone))
+        print("GET /api/agents during slow lists:  " + summary(loaded))
+        print("GET /api/bon-passage-forfait:       " + summary(slow_durations))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def bench_profile(args):
+    """Loading the ClientProfile page: the separate requests against /api/clients/{id}/profile."""
+    work_dir = tempfile.mkdtemp()
+    try:
+        db_path = seed_database(work_dir, args.passages)
+        client_id = 1
+        bons = seed_bon_lines(db_path, client_id)
+        opened = bons[:args.opened]
+
+        with Server(work_dir) as server:
+            api = server.base_url + "/api"
+            # The requests made by the page before the profile endpoint, one after the other
+            page_urls = [
+                f"{api}/clients/{client_id}",
+                f"{api}/agents?fields=id,nom",
+                f"{api}/produits?fields=id,designation",
+                f"{api}/services?fields=id,designation",
+                f"{api}/clients/{client_id}/bon-passage-forfait",
+                f"{api}/clients/{client_id}/contrats-forfait",
+                f"{api}/clients/{client_id}/versements-forfait",
+            ]
+            # Then opening bons: two requests per bon
+            line_urls = []
+            for bon_id in opened:
+                line_urls.append(f"{api}/bon-passage-forfait/{bon_id}/produits")
+                line_urls.append(f"{api}/bon-passage-forfait/{bon_id}/services")
+
+            def run(urls):
+                start = time.perf_counter()
+                for url in urls:
+                    get(url)
+                return (time.perf_counter() - start) * 1000
+
+            results = [
+                (f"separate requests ({len(page_urls)})", page_urls),
+                ("profile?catalogs=true", [f"{api}/clients/{client_id}/profile?catalogs=true"]),
+                (f"separate + {len(opened)} bons opened ({len(page_urls) + len(line_urls)})", page_urls + line_urls),
+                ("profile?catalogs=true&lines=true", [f"{api}/clients/{client_id}/profile?catalogs=true&lines=true"]),
+            ]
+            for _ in range(3):  # Warm up the caches
+                for _, urls in results:
+                    run(urls)
+            durations = [(label, [run(urls) for _ in range(args.repeat)]) for label, urls in results]
+
+        print(f"Bons de passage: {args.passages} ({len(bons)} for client {client_id}), repeat: {args.repeat}")
+        for label, values in durations:
+            print(f"{label:<42} " + summary(values))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def bench_stock(args):
+    """Parallel purchases of the same produit: the final stock must count all of them."""
+    work_dir = tempfile.mkdtemp()
+    try:
+        db_path = seed_database(work_dir, 0)
+        conn = sqlite3.connect(db_path)
+        bon_ids = [row[0] for row in conn.execute("SELECT id FROM Bon_Achats")]
+        conn.close()
+        produit = "Stress test"
+        random.seed(42)
+        quantities = [random.randint(1, 10) for _ in range(args.purchases)]
+
+        with Server(work_dir, workers=args.workers) as server:
+            api = server.base_url + "/api"
+
+            def purchase(index):
+                """Add a line, and remove every 4th one again (an exit of the stock)."""
+                bon_id = bon_ids[index % len(bon_ids)]
+                url = f"{api}/bon-achats/{bon_id}/produits"
+                line = {"produit": produit, "qte": quantities[index], "prix": 100 + index % 7, "bon_achat_id": bon_id}
+                status, line, duration = send("POST", url, line)
+                durations = [duration]
+                if status != 200:
+                    return status, 0, durations
+                if index % 4 == 3:
+                    status, _, duration = send("DELETE", f"{url}/{line['id']}")
+                    durations.append(duration)
+                    return status, 0, durations
+                return status, quantities[index], durations
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.clients) as executor:
+                results = list(executor.map(purchase, range(args.purchases)))
+            elapsed = time.perf_counter() - start
+
+            _, inventaire, _ = send("GET", f"{api}/inventaire")
+            _, stock_today, _ = send("GET", f"{api}/inventaire/stock")
+
+        failed = [status for status, _, _ in results if status != 200]
+        expected = sum(qte for _, qte, _ in results)
+        stored = next((row["qte"] for row in inventaire if row["produit"] == produit), 0)
+        from_movements = next((row["qte"] for row in stock_today if row["produit"] == produit), 0)
+        print(f"Purchases: {args.purchases} ({args.purchases // 4} removed), clients: {args.clients}, "
+              f"workers: {args.workers}, {elapsed:.2f} s")
+        print("Requests:           " + summary([d for _, _, durations in results for d in durations]))
+        print(f"Failed requests:    {len(failed)} {sorted(set(failed))}")
+        print(f"Expected stock:     {expected}")
+        print(f"Inventaire.qte:     {stored}")
+        print(f"Sum of movements:   {from_movements}")
+        if failed or stored != expected or from_movements != expected:
+            raise SystemExit("FAILED: the stock does not count all the purchases")
+        print("OK")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def bench_compression(args):
+    """Bytes saved against CPU time of each encoding and level, on the large lists."""
+    import compression
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        db_path = seed_database(work_dir, args.passages)
+        seed_versements(db_path, args.passages // 4)
+        paths = ["/api/bon-passage-forfait", "/api/versements-forfait", "/api/contrats-forfait", "/api/clients"]
+        levels = [("gzip", level) for level in (1, 6, 9)]
+        if compression.brotli is not None:
+            levels += [("br", level) for level in (1, 4, 5, 11)]
+        else:
+            print("brotli is not installed: gzip only")
+
+        with Server(work_dir) as server:
+            bodies = {path: get(server.base_url + path, {"Accept-Encoding": "identity"})[1] for path in paths}
+
+            # CPU time of each encoding and level, in this process
+            print(f"{'endpoint':<28} {'encoding':<8} {'size':>10} {'ratio':>6} {'ms':>8} {'MB/s':>7}")
+            for path, body in bodies.items():
+                print(f"{path:<28} {'identity':<8} {len(body):>10}")
+                for encoding, level in levels:
+                    durations = []
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        compressed = compression.compress(body, encoding, level)
+                        durations.append((time.perf_counter() - start) * 1000)
+                    duration = statistics.median(durations)
+                    print(f"{'':<28} {f'{encoding}-{level}':<8} {len(compressed):>10} "
+                          f"{len(body) / len(compressed):>6.1f} {duration:>8.2f} {len(body) / 1000 / duration:>7.1f}")
+
+            # The server with the levels of compression.LEVELS: bytes sent and latency
+            print()
+            for path in paths:
+                for accept in ("identity", ", ".join(compression.ENCODINGS)):
+                    results = [get(server.base_url + path, {"Accept-Encoding": accept}) for _ in range(args.repeat)]
+                    print(f"{path:<28} Accept-Encoding: {accept:<10} {len(results[0][1]):>10} bytes  "
+                          + summary([duration for _, _, duration in results]))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def bench_serialization(args):
+    """The list endpoints with the trusted JSON path against the response_model validation."""
+    work_dir = tempfile.mkdtemp()
+    try:
+        db_path = seed_database(work_dir, args.passages)
+        seed_versements(db_path, args.passages // 4)
+        paths = [
+            "/api/bon-passage-forfait",
+            "/api/bon-passage-forfait?limit=100",
+            "/api/versements-forfait",
+            "/api/clients/1/bon-passage-forfait",
+            "/api/contrats-forfait",
+            "/api/clients",
+            "/api/inventaire/mouvements",
+        ]
+        durations = {}
+        for label, env in (("validated", {"API_VALIDATE_OUTPUT": "1"}), ("trusted", {})):
+            with Server(work_dir, env=env) as server:
+                for path in paths:
+                    get(server.base_url + path)  # Warm up
+                    # identity: the time of the compression is not measured
+                    durations[label, path] = [
+                        get(server.base_url + path, {"Accept-Encoding": "identity"})[2] for _ in range(args.repeat)
+                    ]
+
+        print(f"Bons de passage: {args.passages}, repeat: {args.repeat}")
+        print(f"{'endpoint':<40} {'validated p50':>14} {'trusted p50':>12} {'speedup':>8}")
+        for path in paths:
+            validated = statistics.median(durations["validated", path])
+            trusted = statistics.median(durations["trusted", path])
+            print(f"{path:<40} {validated:>11.1f} ms {trusted:>9.1f} ms {validated / trusted:>7.1f}x")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def post_file(url, content):
+    """POST a file as the body of the request, return (status, decoded body, duration in ms)."""
+    request = urllib.request.Request(url, data=content, method="POST", headers={"Content-Type": "text/csv"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            status, body = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, body = e.code, e.read()
+    return status, json.loads(body), (time.perf_counter() - start) * 1000
+
+
+def bench_import(args):
+    """Bulk import of clients, contrats and bons de passage, against one POST per bon."""
+    work_dir = tempfile.mkdtemp()
+    try:
+        db_path = seed_database(work_dir, 0)
+        conn = sqlite3.connect(db_path)
+        agents = [row[0] for row in conn.execute("SELECT nom FROM Agents")]
+        conn.close()
+        random.seed(42)
+
+        noms = [f"Client import {i}" for i in range(args.clients)]
+        files = [
+            ("clients", "nom;tel;mode;agent;specialite\n" + "".join(
+                f"{nom};05{i:08d};{random.choice((30, 60, 90))};{random.choice(agents)};Santé\n"
+                for i, nom in enumerate(noms))),
+            # Half of the contracts count the threshold per month: their periods are recomputed
+            ("contrats", "client;date_debut;date_fin;montant;prix_exces_poids;poids_forfait;seuil_periode\n" + "".join(
+                f"{nom};01/01/2025;31/12/2025;50000;100;200;{'Mois' if i % 2 else 'Passage'}\n"
+                for i, nom in enumerate(noms))),
+            ("bons-passage", "client;date;poids_collecte;montant\n" + "".join(
+                f"{random.choice(noms)};{random.randint(1, 28):02d}/{random.randint(1, 12):02d}/2025;"
+                f"{random.randint(1, 300)};{random.randint(0, 50) * 100}\n"
+                for _ in range(args.rows))),
+        ]
+
+        with Server(work_dir) as server:
+            print(f"{'import':<14} {'rows':>8} {'imported':>9} {'errors':>7} {'time':>10} {'rows/s':>9}")
+            for kind, content in files:
+                status, report, duration = post_file(f"{server.base_url}/api/import/{kind}", content.encode())
+                if status != 200:
+                    raise SystemExit(f"FAILED: {kind} import answered {status}: {report}")
+                print(f"{kind:<14} {report['lignes']:>8} {report['importees']:>9} {report['nb_erreurs']:>7} "
+                      f"{duration / 1000:>8.2f} s {report['lignes'] / duration * 1000:>9.0f}")
+
+            # The same bons, one POST each
+            _, clients, _ = send("GET", f"{server.base_url}/api/clients?fields=id,nom")
+            client_ids = [client["id"] for client in clients if client["nom"] in noms]
+            durations = []
+            for _ in range(args.baseline):
+                bon = {"date": f"{random.randint(1, 28):02d}/06/2025", "client_id": random.choice(client_ids),
+                       "poids_collecte": random.randint(1, 300), "montant": 0}
+                _, _, duration = send("POST", f"{server.base_url}/api/bon-passage-forfait", bon)
+                durations.append(duration)
+            print(f"{'one POST each':<14} {args.baseline:>8} {'':>9} {'':>7} "
+                  f"{sum(durations) / 1000:>8.2f} s {args.baseline / sum(durations) * 1000:>9.0f}")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def bench_search(args):
+    """The full-text search of /api/search, against loading /api/clients to filter it in the browser."""
+    work_dir = tempfile.mkdtemp()
+    try:
+        db_path = seed_database(work_dir, 0)
+        conn = sqlite3.connect(db_path)
+        agents = [row[0] for row in conn.execute("SELECT nom FROM Agents")]
+        random.seed(42)
+        syllables = ["al", "ger", "tel", "com", "ma", "ghreb", "sa", "ni", "té", "clin", "ique", "éco",
+                     "vert", "bou", "med", "ène", "ra", "ka", "di", "zi", "nour", "el"]
+        specialites = ["Santé", "Presse", "Transport", "Hôtellerie", "Industrie", "Commerce", "Éducation"]
+
+        def word():
+            return "".join(random.choice(syllables) for _ in range(random.randint(2, 4))).capitalize()
+
+        # The rows are indexed by the triggers of create_db.py, as when they are written by the API
+        conn.executemany(
+            "INSERT INTO Client_Forfait (nom, specialite, tel, mode, agent) VALUES (?, ?, ?, 30, ?)",
+            [(f"{word()} {word()}", random.choice(specialites), f"0{random.randint(0, 10 ** 9 - 1):09d}",
+              random.choice(agents)) for _ in range(args.clients)]
+        )
+        conn.executemany("INSERT INTO Produit (designation) VALUES (?)",
+                         [(f"{word()} {i}",) for i in range(args.produits)])
+        conn.commit()
+        conn.close()
+
+        queries = ["al", "alg", "algerte", "sante", "sa cl", "clinique", "0555", "bou med"]
+        with Server(work_dir) as server:
+            print(f"Clients: {args.clients}, produits: {args.produits}, repeat: {args.repeat}")
+            for q in queries:
+                url = f"{server.base_url}/api/search?" + urllib.parse.urlencode({"q": q})
+                _, body, _ = get(url)  # Warm up
+                durations = [get(url, {"Accept-Encoding": "identity"})[2] for _ in range(args.repeat)]
+                print(f"search {q!r:<12} {len(json.loads(body)):>3} results  {summary(durations)}")
+            url = f"{server.base_url}/api/clients?fields=id,nom"
+            _, body, _ = get(url)
+            durations = [get(url, {"Accept-Encoding": "identity"})[2] for _ in range(args.repeat)]
+            print(f"all the clients     {len(body) // 1024:>5} kB  {summary(durations)}")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    concurrency = subparsers.add_parser("concurrency", help=bench_concurrency.__doc__)
+    concurrency.add_argument("--passages", type=int, default=50000)
+    concurrency.add_argument("--requests", type=int, default=50)
+    concurrency.add_argument("--slow-clients", type=int, default=2)
+    concurrency.add_argument("--workers", type=int, default=1)
+    concurrency.set_defaults(func=bench_concurrency)
+
+    profile = subparsers.add_parser("profile", help=bench_profile.__doc__)
+    profile.add_argument("--passages", type=int, default=2000)
+    profile.add_argument("--opened", type=int, default=20)
+    profile.add_argument("--repeat", type=int, default=30)
+    profile.set_defaults(func=bench_profile)
+
+    stock = subparsers.add_parser("stock", help=bench_stock.__doc__)
+    stock.add_argument("--purchases", type=int, default=400)
+    stock.add_argument("--clients", type=int, default=16)
+    stock.add_argument("--workers", type=int, default=4)
+    stock.set_defaults(func=bench_stock)
+
+    compress = subparsers.add_parser("compression", help=bench_compression.__doc__)
+    compress.add_argument("--passages", type=int, default=50000)
+    compress.add_argument("--repeat", type=int, default=5)
+    compress.set_defaults(func=bench_compression)
+
+    serialization = subparsers.add_parser("serialization", help=bench_serialization.__doc__)
+    serialization.add_argument("--passages", type=int, default=50000)
+    serialization.add_argument("--repeat", type=int, default=5)
+    serialization.set_defaults(func=bench_serialization)
+
+    bulk = subparsers.add_parser("import", help=bench_import.__doc__)
+    bulk.add_argument("--rows", type=int, default=100000)
+    bulk.add_argument("--clients", type=int, default=1000)
+    bulk.add_argument("--baseline", type=int, default=500)
+    bulk.set_defaults(func=bench_import)
+
+    search = subparsers.add_parser("search", help=bench_search.__doc__)
+    search.add_argument("--clients", type=int, default=100000)
+    search.add_argument("--produits", type=int, default=10000)
+    search.add_argument("--repeat", type=int, default=20)
+    search.set_defaults(func=bench_search)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
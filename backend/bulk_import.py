@@ -0,0 +1,618 @@
+"""Bulk import of clients, contrats, bons de passage and achats from a CSV or XLSX file.
+
+Creating the rows one POST at a time costs a transaction, the existence checks
+and a MAX(id) query per row. The import reads the file as a stream and handles
+it by batches of BATCH_SIZE rows, each in its own write transaction:
+- the rows are validated with the models of the API (same rules and messages);
+- the references (client, agent, produit, the active contract of a client) are
+  resolved with one IN (...) query per batch;
+- the valid rows are written with one executemany per table, the ids that are
+  needed before the insert (a bon d'achat for its lines) numbered from MAX(id).
+When the database refuses a row of the batch (a CHECK, a trigger rule), the batch
+is written again one row at a time in savepoints, so only the refused rows are
+missing. The invalid rows are skipped and listed in the report, with their line
+in the file. A dry run checks the whole file and writes nothing.
+
+The kinds of file (IMPORTERS) and their columns, named on the first line:
+- clients: nom, tel, mode, agent (nom of an agent), specialite;
+- contrats: client (nom) or client_id, date_debut, date_fin, montant,
+  prix_exces_poids, poids_forfait, seuil_periode. The contract is created 'Actif';
+- bons-passage: client (nom) or client_id, date, poids_collecte, montant. The bon
+  goes to the active contract of the client, its excess weight is computed as in
+  the API (exces_poids.py);
+- achats: date, fournisseur, produit (designation), qte, prix, bon. The lines of a
+  bon d'achat follow each other and share date and fournisseur, the optional `bon`
+  column separates two bons of the same day and fournisseur. A bon with an
+  invalid line is not imported.
+The dates are dd/mm/yyyy, as in the API. yyyy-mm-dd and the dates of Excel are
+accepted too, as well as the decimal comma.
+
+Only the standard library is used: csv for CSV files (utf-8, else cp1252 as saved
+by Excel; separated by ',', ';' or tabs) and zipfile with ElementTree for the first
+sheet of an XLSX file, read row by row.
+"""
+
+import codecs
+import functools
+import csv
+import io
+import itertools
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zipfile
+from datetime import date, timedelta
+from xml.etree import ElementTree
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+
+import exces_poids
+from database import API_DATE_FORMAT, to_db_date
+from models import BonAchats, BonPassageForfaitModel, ClientModel, ContratForfaitModel, ProduitBonAchatLigne
+
+# Rows validated and written in one transaction
+BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "1000"))
+# Errors listed in the report (all of them are counted)
+MAX_ERRORS = int(os.environ.get("IMPORT_MAX_ERRORS", "1000"))
+# An uploaded file is kept in memory up to this size (in bytes), on disk above
+SPOOL_SIZE = int(os.environ.get("IMPORT_SPOOL_SIZE", str(8 * 1024 * 1024)))
+# Keys of one IN (...) lookup, at most the SQLite limit of parameters
+LOOKUP_CHUNK = 1000
+
+CSV_DELIMITERS = ",;\t"
+XLSX_SIGNATURE = b"PK\x03\x04"
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+# Day 0 of the dates of Excel (which counts 1900 as a leap year)
+EXCEL_EPOCH = date(1899, 12, 30)
+
+AGENTS_SQL = "SELECT nom FROM Agents WHERE nom IN ({})"
+PRODUITS_SQL = "SELECT designation FROM Produit WHERE designation IN ({})"
+CLIENTS_BY_ID_SQL = "SELECT id FROM Client_Forfait WHERE id IN ({})"
+CLIENTS_BY_NOM_SQL = "SELECT id, nom FROM Client_Forfait WHERE nom IN ({})"
+OPEN_CONTRATS_SQL = "SELECT client_id FROM Contrat_Forfait WHERE client_id IN ({}) AND etat IN ('Actif', 'Pause')"
+ACTIVE_CONTRATS_SQL = "SELECT * FROM Contrat_Forfait WHERE client_id IN ({}) AND etat = 'Actif'"
+
+
+# The rows of a file share a few hundred dates: each one is converted once
+db_date = functools.lru_cache(maxsize=4096)(to_db_date)
+
+
+class RowError(Exception):
+    """A row that cannot be imported, with the message of the report."""
+
+
+def lookup(cursor, sql, keys):
+    """Run a SELECT ... IN ({}) for all the keys, return the rows."""
+    keys = list(keys)
+    rows = []
+    for start in range(0, len(keys), LOOKUP_CHUNK):
+        chunk = keys[start:start + LOOKUP_CHUNK]
+        cursor.execute(sql.format(", ".join("?" * len(chunk))), chunk)
+        rows.extend(cursor.fetchall())
+    return rows
+
+
+def parse(model, values):
+    """Validate the values of a row with a model of the API."""
+    try:
+        return model(**values)
+    except HTTPException as e:
+        # The validators of models.py raise the HTTPException of the endpoints
+        raise RowError(e.detail)
+    except ValidationError as e:
+        raise RowError("; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+        ))
+
+
+def api_date(value):
+    """A date of the file in the dd/mm/yyyy format of the API."""
+    if re.fullmatch(r"\d+(\.\d+)?", value):
+        # A date of Excel: the number of days since EXCEL_EPOCH
+        return (EXCEL_EPOCH + timedelta(days=int(float(value)))).strftime(API_DATE_FORMAT)
+    if re.match(r"\d{4}-\d{2}-\d{2}", value):
+        return f"{value[8:10]}/{value[5:7]}/{value[:4]}"
+    return value
+
+
+def number(value):
+    """A number of the file as Python writes it: no thousands separator, decimal point."""
+    value = value.replace(" ", "").replace("\u00a0", "").replace(",", ".")
+    try:
+        as_float = float(value)
+    except ValueError:
+        return value  # Reported by the validation
+    # The numbers of an XLSX file can be written 30.0
+    return str(int(as_float)) if as_float.is_integer() else value
+
+
+class Importer:
+    """The import of one kind of rows.
+
+    prepare() validates a batch of rows and resolves their references, write()
+    inserts the valid rows. Both run in the transaction of the batch.
+    """
+    columns = []  # Required columns
+    date_columns = []
+    number_columns = []
+    client_reference = False  # The rows name a client by `client` (nom) or `client_id`
+
+    def check_header(self, header):
+        missing = [column for column in self.columns if column not in header]
+        if self.client_reference and "client" not in header and "client_id" not in header:
+            missing.insert(0, "client")
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Colonnes manquantes dans le fichier: {', '.join(missing)}")
+
+    def normalize(self, values):
+        for column in self.date_columns:
+            if column in values:
+                values[column] = api_date(values[column])
+        for column in self.number_columns:
+            if column in values:
+                values[column] = number(values[column])
+        return values
+
+    def group_key(self, values):
+        """Rows with the same key are written together, None when each row is written alone."""
+        return None
+
+    def prepare(self, cursor, rows, errors):
+        """Return the valid rows of a batch as (lines, item), add the others to errors as (line, message)."""
+        raise NotImplementedError
+
+    def write(self, cursor, items):
+        """Insert the items returned by prepare()."""
+        raise NotImplementedError
+
+
+def resolve_clients(cursor, rows, errors):
+    """Return the rows whose client exists, with its id in `client_id`."""
+    ids = {int(values["client_id"]) for _, values in rows if values.get("client_id", "").isdigit()}
+    noms = {values["client"] for _, values in rows if "client_id" not in values and "client" in values}
+    known_ids = {row["id"] for row in lookup(cursor, CLIENTS_BY_ID_SQL, ids)}
+    ids_by_nom = {row["nom"]: row["id"] for row in lookup(cursor, CLIENTS_BY_NOM_SQL, noms)}
+
+    resolved = []
+    for line, values in rows:
+        if "client_id" in values:
+            client_id = int(values["client_id"]) if values["client_id"].isdigit() else None
+            if client_id not in known_ids:
+                errors.append((line, f"Client_Forfait avec ID {values['client_id']} non trouvé"))
+                continue
+        elif "client" in values:
+            client_id = ids_by_nom.get(values["client"])
+            if client_id is None:
+                errors.append((line, f"Client '{values['client']}' non trouvé"))
+                continue
+        else:
+            errors.append((line, "Le client n'est pas renseigné"))
+            continue
+        resolved.append((line, {**values, "client_id": client_id}))
+    return resolved
+
+
+class ClientImporter(Importer):
+    columns = ["nom", "tel", "mode", "agent"]
+    number_columns = ["mode"]
+
+    def __init__(self):
+        self.noms = set()  # Clients of the file, its duplicates are refused
+
+    def prepare(self, cursor, rows, errors):
+        clients = []
+        for line, values in rows:
+            try:
+                clients.append((line, parse(ClientModel, values)))
+            except RowError as e:
+                errors.append((line, str(e)))
+
+        agents = {row["nom"] for row in lookup(cursor, AGENTS_SQL, {client.agent for _, client in clients})}
+        existing = {row["nom"] for row in lookup(cursor, CLIENTS_BY_NOM_SQL, {client.nom for _, client in clients})}
+        valid = []
+        for line, client in clients:
+            if client.agent not in agents:
+                errors.append((line, f"Agent '{client.agent}' non trouvé"))
+            elif client.nom in existing or client.nom in self.noms:
+                errors.append((line, f"Un client avec le nom '{client.nom}' existe déjà"))
+            else:
+                self.noms.add(client.nom)
+                valid.append(([line], client))
+        return valid
+
+    def write(self, cursor, items):
+        cursor.execute("SELECT MAX(id) FROM Client_Forfait")
+        next_id = (cursor.fetchone()[0] or 0) + 1
+        cursor.executemany("""
+            INSERT INTO Client_Forfait (id, nom, specialite, tel, mode, agent, etat_contrat, debut_contrat, fin_contrat)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (next_id + i, client.nom, client.specialite, client.tel, client.mode, client.agent,
+             client.etat_contrat, db_date(client.debut_contrat), db_date(client.fin_contrat))
+            for i, (_, client) in enumerate(items)
+        ])
+
+
+class ContratImporter(Importer):
+    columns = ["date_debut", "date_fin", "montant", "prix_exces_poids", "poids_forfait"]
+    date_columns = ["date_debut", "date_fin"]
+    number_columns = ["montant", "prix_exces_poids", "poids_forfait"]
+    client_reference = True
+
+    def __init__(self):
+        self.clients = set()  # Clients given a contract by the file
+
+    def prepare(self, cursor, rows, errors):
+        contrats = []
+        for line, values in resolve_clients(cursor, rows, errors):
+            try:
+                # The contract is created 'Actif', as by the API
+                contrats.append((line, parse(ContratForfaitModel, {**values, "etat": "Actif"})))
+            except RowError as e:
+                errors.append((line, str(e)))
+
+        open_clients = {
+            row["client_id"] for row in lookup(cursor, OPEN_CONTRATS_SQL, {contrat.client_id for _, contrat in contrats})
+        }
+        valid = []
+        for line, contrat in contrats:
+            if contrat.client_id in open_clients or contrat.client_id in self.clients:
+                errors.append((line, "Un contrat actif ou en pause existe déjà pour ce client"))
+            else:
+                self.clients.add(contrat.client_id)
+                valid.append(([line], contrat))
+        return valid
+
+    def write(self, cursor, items):
+        cursor.executemany("""
+            INSERT INTO Contrat_Forfait (date_debut, date_fin, montant, prix_exces_poids, poids_forfait, seuil_periode, client_id, etat)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 'Actif')
+        """, [
+            (db_date(contrat.date_debut), db_date(contrat.date_fin), contrat.montant,
+             contrat.prix_exces_poids, contrat.poids_forfait, contrat.seuil_periode, contrat.client_id)
+            for _, contrat in items
+        ])
+        # The client shows its current contract, as after create_contrat_forfait
+        cursor.executemany("""
+            UPDATE Client_Forfait SET etat_contrat = 'Actif', debut_contrat = ?, fin_contrat = ? WHERE id = ?
+        """, [(db_date(contrat.date_debut), db_date(contrat.date_fin), contrat.client_id) for _, contrat in items])
+
+
+class BonPassageImporter(Importer):
+    columns = ["date", "poids_collecte"]
+    date_columns = ["date"]
+    number_columns = ["poids_collecte", "montant"]
+    client_reference = True
+
+    def prepare(self, cursor, rows, errors):
+        bons = []
+        for line, values in resolve_clients(cursor, rows, errors):
+            try:
+                # The excess weight and its price are computed, never taken from the file
+                bons.append((line, parse(BonPassageForfaitModel, {
+                    key: value for key, value in values.items()
+                    if key not in ("exces_poids", "prix_exces_poids", "contrat_id")
+                })))
+            except RowError as e:
+                errors.append((line, str(e)))
+
+        contrats = {
+            row["client_id"]: row for row in lookup(cursor, ACTIVE_CONTRATS_SQL, {bon.client_id for _, bon in bons})
+        }
+        valid = []
+        for line, bon in bons:
+            contrat = contrats.get(bon.client_id)
+            if contrat is None:
+                errors.append((line, "Aucun contrat actif trouvé pour ce client"))
+            else:
+                valid.append(([line], (bon, contrat)))
+        return valid
+
+    def write(self, cursor, items):
+        cursor.execute("SELECT MAX(id) FROM Bon_Passage_Forfait")
+        next_id = (cursor.fetchone()[0] or 0) + 1
+        rows = []
+        periodes = {}  # (contrat id, periode) -> contrat, the periods of a cumulative threshold
+        for i, (_, (bon, contrat)) in enumerate(items):
+            bon_date = db_date(bon.date)
+            periode = exces_poids.periode_of(contrat, bon_date)
+            if periode is None:
+                exces, prix = exces_poids.excess(0, bon.poids_collecte, contrat["poids_forfait"]), contrat["prix_exces_poids"]
+            else:
+                # Computed below with the other passages of the period, which only
+                # updates the passages above the threshold
+                exces, prix = 0, contrat["prix_exces_poids"]
+                periodes[contrat["id"], periode] = contrat
+            rows.append((next_id + i, bon_date, bon.client_id, bon.montant + exces * prix, exces, prix,
+                         bon.poids_collecte, contrat["id"]))
+
+        cursor.executemany("""
+            INSERT INTO Bon_Passage_Forfait (id, date, client_id, montant, exces_poids, prix_exces_poids, poids_collecte, contrat_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        # Once per period, however many passages of the batch it has
+        exces_poids.recompute_periodes(cursor, periodes)
+
+
+class AchatImporter(Importer):
+    columns = ["date", "fournisseur", "produit", "qte"]
+    date_columns = ["date"]
+    number_columns = ["qte", "prix"]
+
+    def group_key(self, values):
+        return values.get("bon"), values.get("date"), values.get("fournisseur")
+
+    def prepare(self, cursor, rows, errors):
+        groups = {}
+        for line, values in rows:
+            groups.setdefault(self.group_key(values), []).append((line, values))
+        designations = {row["designation"] for row in lookup(
+            cursor, PRODUITS_SQL, {values["produit"] for _, values in rows if "produit" in values}
+        )}
+
+        valid = []
+        for group in groups.values():
+            bon, produits, refused = None, [], []
+            for line, values in group:
+                try:
+                    bon = parse(BonAchats, {key: values[key] for key in ("date", "fournisseur") if key in values})
+                    produit = parse(ProduitBonAchatLigne, values)
+                    if produit.produit not in designations:
+                        raise RowError(f"Produit '{produit.produit}' non trouvé")
+                    produits.append(produit)
+                except RowError as e:
+                    refused.append((line, str(e)))
+            if refused:
+                errors.extend(refused)
+                refused_lines = {line for line, _ in refused}
+                errors.extend(
+                    (line, f"Bon d'achat non importé: erreur à la ligne {refused[0][0]}")
+                    for line, _ in group if line not in refused_lines
+                )
+            else:
+                valid.append(([line for line, _ in group], (bon, produits)))
+        return valid
+
+    def write(self, cursor, items):
+        cursor.execute("SELECT MAX(id) FROM Bon_Achats")
+        next_bon = (cursor.fetchone()[0] or 0) + 1
+        cursor.execute("SELECT MAX(id) FROM Produits_Bon_Achat")
+        next_ligne = (cursor.fetchone()[0] or 0) + 1
+        bons, lignes = [], []
+        for i, (_, (bon, produits)) in enumerate(items):
+            # The total is computed from the lines, as by write_bon_achat_document
+            montant_total = sum(produit.qte * produit.prix for produit in produits if produit.prix)
+            bons.append((next_bon + i, db_date(bon.date), bon.fournisseur, montant_total))
+            for produit in produits:
+                lignes.append((next_ligne + len(lignes), produit.produit, produit.qte, produit.prix, next_bon + i))
+
+        cursor.executemany(
+            "INSERT INTO Bon_Achats (id, date, fournisseur, montant_total) VALUES (?, ?, ?, ?)", bons
+        )
+        # The trigger records each purchase in the stock movements (see stock.py)
+        cursor.executemany(
+            "INSERT INTO Produits_Bon_Achat (id, produit, qte, prix, bon_achat_id) VALUES (?, ?, ?, ?, ?)", lignes
+        )
+
+
+IMPORTERS = {
+    "clients": ClientImporter,
+    "contrats": ContratImporter,
+    "bons-passage": BonPassageImporter,
+    "achats": AchatImporter,
+}
+
+
+def csv_encoding(file):
+    """utf-8 when the whole file is valid utf-8, else cp1252 (the CSV of Excel on Windows)."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            decoder.decode(chunk)
+        decoder.decode(b"", final=True)
+        encoding = "utf-8-sig"  # Also removes the BOM written by Excel
+    except UnicodeDecodeError:
+        encoding = "cp1252"
+    file.seek(0)
+    return encoding
+
+
+def csv_rows(file):
+    """Yield (line, values) for the rows of a CSV file."""
+    text = io.TextIOWrapper(file, encoding=csv_encoding(file), errors="replace", newline="")
+    try:
+        header = text.readline()
+        delimiter = max(CSV_DELIMITERS, key=header.count)
+        reader = csv.reader(itertools.chain([header], text), delimiter=delimiter)
+        for values in reader:
+            yield reader.line_num, values
+    finally:
+        text.detach()  # The file belongs to the caller
+
+
+def xlsx_sheet(archive):
+    """The path of the first sheet of a workbook."""
+    workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    rel_id = workbook.find(f"{MAIN_NS}sheets/{MAIN_NS}sheet").get(f"{REL_NS}id")
+    relationships = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    target = next(rel.get("Target") for rel in relationships if rel.get("Id") == rel_id)
+    return target[1:] if target.startswith("/") else "xl/" + target
+
+
+def xlsx_strings(archive):
+    """The shared strings of a workbook, referenced by index from the cells."""
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    with archive.open("xl/sharedStrings.xml") as file:
+        for _, element in ElementTree.iterparse(file):
+            if element.tag == f"{MAIN_NS}si":
+                strings.append("".join(text.text or "" for text in element.iter(f"{MAIN_NS}t")))
+                element.clear()
+    return strings
+
+
+def column_index(reference):
+    """The index (from 0) of the column of a cell reference such as 'AB12'."""
+    index = 0
+    for letter in itertools.takewhile(str.isalpha, reference):
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def column_letters(index):
+    """The letters of the column of index `index` (from 0): A, B, ..., Z, AA, AB, ..."""
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def xlsx_rows(file):
+    """Yield (line, values) for the rows of the first sheet of an XLSX file."""
+    try:
+        archive = zipfile.ZipFile(file)
+        sheet_path = xlsx_sheet(archive)
+    except (zipfile.BadZipFile, KeyError, AttributeError, StopIteration, ElementTree.ParseError):
+        raise HTTPException(status_code=400, detail="Le fichier n'est pas un classeur XLSX valide")
+
+    with archive:
+        strings = xlsx_strings(archive)
+        with archive.open(sheet_path) as sheet:
+            line = 0
+            for _, element in ElementTree.iterparse(sheet):
+                if element.tag != f"{MAIN_NS}row":
+                    continue
+                line = int(element.get("r", line + 1))
+                values = []
+                for cell in element.iter(f"{MAIN_NS}c"):
+                    # The empty cells are not written, the reference gives the column
+                    index = column_index(cell.get("r")) if cell.get("r") else len(values)
+                    values.extend([""] * (index - len(values)))
+                    if cell.get("t") == "inlineStr":
+                        values.append("".join(text.text or "" for text in cell.iter(f"{MAIN_NS}t")))
+                    elif cell.get("t") == "s":
+                        values.append(strings[int(cell.findtext(f"{MAIN_NS}v"))])
+                    else:
+                        values.append(cell.findtext(f"{MAIN_NS}v") or "")
+                element.clear()  # Only the current row is kept in memory
+                yield line, values
+
+
+def read_file(file):
+    """Return the columns of a CSV or XLSX file, and an iterator of (line, values) of its rows.
+
+    The names of the columns are lowercased, the empty cells are left out of the values.
+    """
+    is_xlsx = file.read(len(XLSX_SIGNATURE)) == XLSX_SIGNATURE
+    file.seek(0)
+    rows = xlsx_rows(file) if is_xlsx else csv_rows(file)
+    _, header = next(rows, (0, []))
+    header = [name.strip().lower() for name in header]
+
+    def values_by_column():
+        for line, values in rows:
+            values = {name: value.strip() for name, value in zip(header, values) if name and value.strip()}
+            if values:
+                yield line, values
+
+    return header, values_by_column()
+
+
+def batches(rows, size, group_key):
+    """Cut the rows in lists of about `size` rows, never between two rows of the same group."""
+    batch = []
+    for line, values in rows:
+        if len(batch) >= size and (group_key(values) is None or group_key(values) != group_key(batch[-1][1])):
+            yield batch
+            batch = []
+        batch.append((line, values))
+    if batch:
+        yield batch
+
+
+def write_batch(cursor, importer, items, errors):
+    """Write the valid rows of a batch, return the rows written.
+
+    A refused row makes executemany fail: the batch is then written again one
+    row at a time, each in a savepoint, and the refused rows are reported.
+    """
+    cursor.execute("SAVEPOINT batch")
+    try:
+        importer.write(cursor, items)
+        cursor.execute("RELEASE batch")
+        return items
+    except sqlite3.Error:
+        cursor.execute("ROLLBACK TO batch")
+        cursor.execute("RELEASE batch")
+
+    written = []
+    for lines, item in items:
+        cursor.execute("SAVEPOINT item")
+        try:
+            importer.write(cursor, [(lines, item)])
+            written.append((lines, item))
+        except sqlite3.Error as e:
+            cursor.execute("ROLLBACK TO item")
+            errors.extend((line, str(e)) for line in lines)
+        cursor.execute("RELEASE item")
+    return written
+
+
+def run_import(conn, kind, file, dry_run=False):
+    """Import a CSV or XLSX file (a binary file object) and return the report.
+
+    Each batch is committed on its own (rolled back for a dry run): a long import
+    lets the other requests write between its batches.
+    """
+    start = time.perf_counter()
+    importer = IMPORTERS[kind]()
+    header, rows = read_file(file)
+    report = {"kind": kind, "dry_run": dry_run, "lignes": 0, "importees": 0, "nb_erreurs": 0, "erreurs": []}
+    try:
+        importer.check_header(header)
+        cursor = conn.cursor()
+        for batch in batches(rows, BATCH_SIZE, importer.group_key):
+            errors = []
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                items = importer.prepare(cursor, [(line, importer.normalize(values)) for line, values in batch], errors)
+                written = write_batch(cursor, importer, items, errors)
+                if dry_run:
+                    conn.rollback()
+                else:
+                    conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+            report["lignes"] += len(batch)
+            report["importees"] += sum(len(lines) for lines, _ in written)
+            report["nb_erreurs"] += len(errors)
+            errors.sort()
+            room = MAX_ERRORS - len(report["erreurs"])
+            report["erreurs"].extend({"ligne": line, "erreur": message} for line, message in errors[:room])
+    finally:
+        rows.close()  # Stop reading the file while it is still open
+
+    report["duree_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return report
+
+
+async def request_file(request: Request):
+    """The body of the request, in a temporary file.
+
+    Used as a dependency before get_db: the file is received before a connection
+    of the pool is taken, a slow upload does not hold one.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as file:
+        async for chunk in request.stream():
+            file.write(chunk)
+        file.seek(0)
+        yield file
@@ -0,0 +1,81 @@
+"""Cache of the reference catalogs: agents, produits, services and fournisseurs.
+
+These small tables are read by nearly every page and rarely change. The cache
+keeps the JSON body of their GET list endpoints (one per table and ?fields=), so a
+hit costs one primary key lookup and no query of the table nor JSON encoding.
+
+Every write to a catalog table bumps its row of Table_Version, with a trigger (see
+create_db.py). A cached body is stored with the version it was read at and is only
+served while the version is the same: a write made by another worker process, or
+directly in the database, is seen by the next request. The write endpoints also
+drop the bodies of their table right away (invalidate()).
+"""
+
+import threading
+
+from fastapi.responses import Response
+
+from database import row_to_dict
+from fields import encode_json
+
+# The cached tables, with a row in Table_Version
+TABLES = ["Agents", "Produit", "Service", "Fournisseur"]
+
+VERSION_SQL = "SELECT version FROM Table_Version WHERE name = ?"
+
+
+class CatalogCache:
+    """The JSON bodies of the catalog lists, with the hit statistics."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}  # (table, columns) -> (version, JSON body)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def response(self, conn, table, sql, columns):
+        """Return the rows of `sql` (a SELECT of a catalog table) as a JSON Response."""
+        key = (table, tuple(columns) if columns else None)
+        cursor = conn.cursor()
+        # One read transaction: the rows are read at the version they are stored with
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute(VERSION_SQL, (table,))
+            version = cursor.fetchone()["version"]
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] == version:
+                    self.hits += 1
+                    return Response(content=entry[1], media_type="application/json")
+
+            cursor.execute(sql)
+            body = encode_json([row_to_dict(row) for row in cursor.fetchall()])
+            with self.lock:
+                self.misses += 1
+                self.entries[key] = (version, body)
+            return Response(content=body, media_type="application/json")
+        finally:
+            conn.rollback()
+
+    def invalidate(self, table):
+        """Drop the cached bodies of a table, after a write to it."""
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == table]:
+                del self.entries[key]
+            self.invalidations += 1
+
+    def stats(self):
+        """Return the cache statistics."""
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 4) if requests else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+cache = CatalogCache()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+"""
+Check that the queries of the API are served by an index.
+
+Runs EXPLAIN QUERY PLAN for every query shape used by the API (and for the
+lookups SQLite makes to enforce the foreign keys and ON DELETE CASCADE) and
+fails if one of them falls back to a full table SCAN. Only the queries that
+list a whole table on purpose are allowed to scan it.
+
+The queries of main.py are read from its source (see code_queries), a new one
+is checked without being listed. QUERIES holds the queries allowed to scan,
+and the queries built at run time: the shapes of pagination.ListQuery and the
+SQL of the other modules. A query of main.py built from other values than
+select_list() fails the check, its SQL goes in a constant of a module and its
+shapes in QUERIES (as export.py or ledger.py).
+
+Usage (from the backend directory):
+    python check_query_plans.py [path/to/db.sqlite]
+"""
+import ast
+import os
+import re
+import sqlite3
+import sys
+
+import dashboard
+import exces_poids
+import ledger
+import stock
+import bulk_import
+import catalog
+import export
+import search
+import valuation
+from database import DB_PATH
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+# The string literals read as SQL by code_queries
+SQL_START = re.compile(r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b")
+
+# (query, allow_scan): the queries allowed to scan and the queries built at run time,
+# the other queries of main.py are read from its source. The parameters are all
+# bound to NULL, only the plan matters.
+QUERIES = [
+    # Agents, produits, services, fournisseurs: the lists read the whole table
+    ("SELECT * FROM Agents ORDER BY id", True),
+    ("SELECT * FROM Produit ORDER BY id", True),
+    ("SELECT * FROM Service ORDER BY id", True),
+    ("SELECT * FROM Fournisseur ORDER BY id", True),
+    # The catalogs sent with a client profile (?catalogs=true)
+    ("SELECT * FROM Agents", True),
+    ("SELECT * FROM Produit", True),
+    ("SELECT * FROM Service", True),
+    # A fournisseur with ?fields=
+    ("SELECT id, nom, telephone, adresse FROM Fournisseur WHERE id = ?", False),
+
+    # Bons d'achat, their produits and versements, inventaire
+    ("SELECT * FROM Bon_Achats ORDER BY date DESC, id DESC", True),
+    ("SELECT * FROM Bon_Achats WHERE date >= ? AND date <= ? ORDER BY date DESC, id DESC", False),
+    ("SELECT produit, qte FROM Produits_Bon_Achat WHERE bon_achat_id = ?", False),
+    ("SELECT * FROM Inventaire ORDER BY produit", True),
+    ("SELECT id, qte, prix_dernier FROM Inventaire WHERE produit = ?", False),
+
+    # Clients and contracts
+    ("SELECT * FROM Client_Forfait ORDER BY nom", True),
+    ("SELECT * FROM Contrat_Forfait", True),
+    ("SELECT COUNT(*) FROM Contrat_Forfait WHERE client_id = ? AND (etat = 'Actif' OR etat = 'Pause') AND id != ?", False),
+
+    # Bons de passage and their lines
+    ("SELECT * FROM Bon_Passage_Forfait ORDER BY date DESC, id DESC", True),
+    ("SELECT * FROM Bon_Passage_Forfait WHERE date >= ? AND date <= ? ORDER BY date DESC, id DESC", False),
+
+    # Versements forfait
+    ("SELECT * FROM Versement_Forfait ORDER BY date DESC, id DESC", True),
+    ("SELECT * FROM Versement_Forfait WHERE date >= ? AND date <= ? ORDER BY date DESC, id DESC", False),
+
+    # Keyset pagination (?limit=&after=)
+    ("SELECT * FROM Client_Forfait WHERE (nom, id) > (?, ?) ORDER BY nom, id LIMIT ?", False),
+    ("SELECT * FROM Inventaire WHERE (produit) > (?) ORDER BY produit LIMIT ?", False),
+    ("SELECT * FROM Contrat_Forfait WHERE (id) > (?) ORDER BY id LIMIT ?", False),
+    ("SELECT * FROM Bon_Achats WHERE (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?", False),
+    ("SELECT * FROM Bon_Passage_Forfait WHERE (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?", False),
+    ("SELECT * FROM Versement_Forfait WHERE (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?", False),
+    ("SELECT * FROM Inventaire WHERE (produit, id) > (?, ?) ORDER BY produit ASC, id ASC LIMIT ?", False),
+
+    # List filters and sorts (pagination.ListQuery), with their COUNT(*)
+    ("SELECT * FROM Client_Forfait WHERE agent = ? ORDER BY nom ASC, id ASC LIMIT ?", False),
+    ("SELECT * FROM Client_Forfait WHERE etat_contrat = ? ORDER BY nom DESC, id DESC LIMIT ?", False),
+    ("SELECT * FROM Client_Forfait WHERE agent = ? AND etat_contrat = ? ORDER BY nom ASC, id ASC LIMIT ?", False),
+    ("SELECT COUNT(*) FROM Client_Forfait WHERE agent = ?", False),
+    ("SELECT COUNT(*) FROM Client_Forfait WHERE etat_contrat = ?", False),
+    ("SELECT * FROM Bon_Achats WHERE fournisseur = ? AND date >= ? AND date <= ? ORDER BY date DESC, id DESC LIMIT ?", False),
+    ("SELECT * FROM Bon_Achats WHERE fournisseur = ? AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?", False),
+    ("SELECT * FROM Bon_Achats WHERE fournisseur = ? ORDER BY id ASC LIMIT ?", False),
+    ("SELECT COUNT(*) FROM Bon_Achats WHERE fournisseur = ?", False),
+    ("SELECT COUNT(*) FROM Bon_Achats WHERE date >= ? AND date <= ?", False),
+    ("SELECT * FROM Contrat_Forfait WHERE etat = ? ORDER BY id ASC LIMIT ?", False),
+    ("SELECT * FROM Contrat_Forfait WHERE client_id = ? AND etat = ? ORDER BY date_debut DESC, id DESC LIMIT ?", False),
+    ("SELECT * FROM Contrat_Forfait WHERE (date_debut, id) > (?, ?) ORDER BY date_debut ASC, id ASC LIMIT ?", False),
+    ("SELECT COUNT(*) FROM Contrat_Forfait WHERE etat = ?", False),
+    ("SELECT * FROM Bon_Passage_Forfait WHERE client_id = ? AND date >= ? AND date <= ? ORDER BY date DESC, id DESC LIMIT ?", False),
+    ("SELECT * FROM Bon_Passage_Forfait WHERE contrat_id = ? AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?", False),
+    ("SELECT * FROM Bon_Passage_Forfait WHERE client_id = ? ORDER BY id DESC LIMIT ?", False),
+    ("SELECT COUNT(*) FROM Bon_Passage_Forfait WHERE client_id = ? AND date >= ? AND date <= ?", False),
+    ("SELECT COUNT(*) FROM Bon_Passage_Forfait WHERE date >= ? AND date <= ?", False),
+    ("SELECT * FROM Versement_Forfait WHERE client_id = ? AND date >= ? AND date <= ? ORDER BY date DESC, id DESC LIMIT ?", False),
+    ("SELECT * FROM Versement_Forfait WHERE contrat_id = ? AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?", False),
+    ("SELECT COUNT(*) FROM Versement_Forfait WHERE client_id = ?", False),
+    ("SELECT COUNT(*) FROM Versement_Forfait WHERE date >= ? AND date <= ?", False),
+
+    # Excess weight engine (exces_poids.py)
+    ("SELECT date, poids_collecte FROM Bon_Passage_Forfait WHERE id = ?", False),
+    ("SELECT poids_collecte, derniere_date FROM Poids_Periode_Forfait WHERE contrat_id = ? AND periode = ?", False),
+    (exces_poids.PERIODES_SQL.format("(?, ?, ?, ?), (?, ?, ?, ?)"), False),
+    ("DELETE FROM Poids_Periode_Forfait WHERE contrat_id = ? AND periode = ?", False),
+    ("SELECT DISTINCT substr(date, 1, ?) AS periode FROM Bon_Passage_Forfait WHERE contrat_id = ?", False),
+    ("DELETE FROM Poids_Periode_Forfait WHERE contrat_id = ?", False),
+    (exces_poids.SET_EXCES_SQL, False),
+
+    # Bulk import (bulk_import.py)
+    (bulk_import.AGENTS_SQL.format("?, ?"), False),
+    (bulk_import.PRODUITS_SQL.format("?, ?"), False),
+    (bulk_import.CLIENTS_BY_ID_SQL.format("?, ?"), False),
+    (bulk_import.CLIENTS_BY_NOM_SQL.format("?, ?"), False),
+    (bulk_import.OPEN_CONTRATS_SQL.format("?, ?"), False),
+    (bulk_import.ACTIVE_CONTRATS_SQL.format("?, ?"), False),
+    ("SELECT MAX(id) FROM Bon_Passage_Forfait", False),
+    ("SELECT MAX(id) FROM Produits_Bon_Achat", False),
+
+    # Streaming exports (export.py), the whole table without a date range
+    (export.BONS_PASSAGE_SQL.format(where=""), True),
+    (export.BONS_PASSAGE_SQL.format(where="WHERE bon.date >= ? AND bon.date <= ?"), False),
+    (export.VERSEMENTS_SQL.format(where=""), True),
+    (export.VERSEMENTS_SQL.format(where="WHERE versement.date >= ? AND versement.date <= ?"), False),
+    (export.ACHATS_SQL.format(where=""), True),
+    (export.ACHATS_SQL.format(where="WHERE bon.date >= ? AND bon.date <= ?"), False),
+
+    # Full-text search (search.py), the matches are read from the FTS5 indexes
+    (search.build_sql(list(search.SOURCES)), False),
+
+    # Client ledger and balances (ledger.py)
+    (ledger.CONTRACT_TOTALS_SQL, False),
+    (f"SELECT * FROM ({ledger.LEDGER_SQL}) WHERE (date, rang, reference) > (:date, :rang, :reference) "
+     "ORDER BY date, rang, reference LIMIT :limit", False),
+    (ledger.BALANCES_SQL, True),
+
+    # Dashboard KPI store (dashboard.py), the rebuild reads the whole tables
+    ("SELECT contrats_actifs, dette_fournisseurs, valeur_stock FROM Dashboard_Totaux WHERE id = ?", False),
+    (f"SELECT {', '.join(dashboard.MONTH_COLUMNS)} FROM Dashboard_Mois WHERE mois = ?", False),
+
+    # Stock movements and the stock at a date (stock.py and the triggers of create_db.py)
+    ("SELECT * FROM Mouvement_Stock WHERE produit = ? AND date >= ? AND date <= ? ORDER BY date DESC, id DESC LIMIT ?", False),
+    ("SELECT * FROM Mouvement_Stock WHERE date >= ? AND date <= ? ORDER BY date DESC, id DESC LIMIT ?", False),
+    (stock.STOCK_AS_OF_SQL, False),
+    ("SELECT qte FROM Inventaire WHERE produit = ?", False),
+    ("SELECT date FROM Mouvement_Stock WHERE bon_achat_id = ? AND ligne_id = ? ORDER BY id DESC LIMIT 1", False),
+    ("SELECT date FROM Mouvement_Stock WHERE bon_passage_id = ? AND ligne_id = ? ORDER BY id DESC LIMIT 1", False),
+    ("SELECT DISTINCT date, ?, ? FROM Stock_Snapshot WHERE date >= ?", False),
+    ("SELECT MAX(date) FROM Stock_Snapshot", False),
+    ("SELECT MIN(date) FROM Mouvement_Stock", False),
+
+    # Catalog cache (catalog.py), ETags (etag.py) and the triggers bumping the versions
+    (catalog.VERSION_SQL, False),
+    ("SELECT name, version FROM Table_Version WHERE name IN (?, ?) ORDER BY name", False),
+    ("UPDATE Table_Version SET version = version + 1 WHERE name = ?", False),
+
+    # Stock valuation (valuation.py)
+    (valuation.MOVEMENTS_SQL.format(produits="?, ?"), False),
+    (valuation.NEW_MOVEMENTS_SQL, False),
+    (valuation.CHANGED_SQL, False),
+    ("SELECT COALESCE(MAX(id), 0) FROM Mouvement_Stock", False),
+] + [(sql, True) for sql in dashboard.REBUILD_SQL + stock.REBUILD_INVENTAIRE_SQL]
+
+
+def foreign_key_queries(conn):
+    """The lookups SQLite makes in the child tables when a parent row is deleted."""
+    queries = []
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    for table in tables:
+        for foreign_key in conn.execute(f"PRAGMA foreign_key_list({table})"):
+            column = foreign_key[3]
+            queries.append((f"SELECT 1 FROM {table} WHERE {column} = ?", False))
+    return queries
+
+
+def full_scans(conn, query):
+    """Return the full table scans in the plan of a query."""
+    if ":" in query:
+        parameters = {name: None for name in re.findall(r":(\w+)", query)}
+    else:
+        parameters = [None] * query.count("?")
+    plan = conn.execute("EXPLAIN QUERY PLAN " + query, parameters).fetchall()
+    # The CTEs computed first (for example a VALUES list), their own plan is checked on its lines
+    materialized = {row[3][len("MATERIALIZE "):] for row in plan if row[3].startswith("MATERIALIZE ")}
+    scans = []
+    for row in plan:
+        detail = row[3]
+        # "SCAN table USING INDEX ..." walks an index in order (a sorted list),
+        # a bare "SCAN table" reads every row of the table. "SCAN (subquery-1)"
+        # reads the rows of a subquery, "SCAN 2 CONSTANT ROWS" the rows of VALUES.
+        # "SCAN fts VIRTUAL TABLE INDEX 0:M1" reads the matches of an FTS5 MATCH
+        # in its index (without "M", the whole FTS5 table is read).
+        if (detail.startswith("SCAN ") and " USING " not in detail and not detail.startswith("SCAN (")
+                and not detail.endswith(" CONSTANT ROWS") and detail[len("SCAN "):] not in materialized
+                and not re.search(r" VIRTUAL TABLE INDEX \d+:M", detail)):
+            scans.append(detail)
+    return scans
+
+
+def code_queries(path=MAIN_PATH):
+    """Return the SQL written in a source file, and the lines of the SQL built at run time.
+
+    The SQL is every string literal starting with SELECT, INSERT, UPDATE, DELETE
+    or WITH. An f-string whose fields are all select_list(...) is read with the
+    widest column list, "*". The other f-strings cannot be checked, their line
+    numbers are returned.
+    """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+
+    # The literal parts of an f-string are strings too, they are read with it
+    parts = {id(value) for node in ast.walk(tree) if isinstance(node, ast.JoinedStr) for value in node.values}
+
+    queries = []
+    built = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and id(node) not in parts:
+            text = node.value
+        elif isinstance(node, ast.JoinedStr):
+            text = "".join(
+                value.value if isinstance(value, ast.Constant) else
+                "*" if is_select_list(value) else "{}"
+                for value in node.values
+            )
+            if SQL_START.match(text) and "{}" in text:
+                built.append(node.lineno)
+                continue
+        else:
+            continue
+        query = " ".join(text.split())
+        if SQL_START.match(text) and query not in queries:
+            queries.append(query)
+    return queries, sorted(built)
+
+
+def is_select_list(value):
+    """Whether a field of an f-string is a call to select_list()."""
+    call = value.value
+    return isinstance(call, ast.Call) and isinstance(call.func, ast.Name) and call.func.id == "select_list"
+
+
+def check(conn, path=MAIN_PATH):
+    """Return the checked queries as (query, scans, allow_scan), and the lines of main.py built at run time."""
+    listed = {" ".join(query.split()) for query, _ in QUERIES}
+    queries, built = code_queries(path)
+    results = []
+    for query, allow_scan in (QUERIES + [(query, False) for query in queries if query not in listed]
+                              + foreign_key_queries(conn)):
+        results.append((" ".join(query.split()), full_scans(conn, query), allow_scan))
+    return results, built
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    conn = sqlite3.connect(db_path)
+
+    failures = 0
+    results, built = check(conn)
+    for query, scans, allow_scan in results:
+        if scans and not allow_scan:
+            failures += 1
+            print(f"FAIL  {query}\n      {'; '.join(scans)}")
+        else:
+            print(f"ok    {query}")
+    for line in built:
+        failures += 1
+        print(f"FAIL  main.py:{line} query built at run time, its shapes cannot be checked")
+
+    conn.close()
+    if failures:
+        print(f"\n{failures} quer{'y' if failures == 1 else 'ies'} not served by an index")
+        sys.exit(1)
+    print("\nAll the queries are served by an index")
+
+
+if __name__ == "__main__":
+    main()
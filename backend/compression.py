@@ -0,0 +1,139 @@
+"""Compression of the responses, negotiated with Accept-Encoding.
+
+The JSON lists compress 5 to 10 times, which matters on the slow links of the
+offices. CompressionMiddleware compresses a response when:
+- the client accepts gzip, or br when the optional brotli package is installed
+  (pip install brotli), br being preferred at the same q-value;
+- its content type is in LEVELS, which gives the level of each encoding for it
+  (measured with `python benchmark.py compression`);
+- its body is at least MIN_SIZE bytes: below that, the gain does not pay for the
+  headers and the CPU time.
+A body of OFFLOAD_SIZE bytes or more is compressed in a thread, so the event loop
+keeps serving the other requests meanwhile.
+
+A streamed response (several body messages) is sent as is. The ETag of a
+compressed response gets the encoding as a suffix ("...-gzip"): a strong ETag
+must differ between two representations. etag.py matches it in If-None-Match and
+puts it back on the ETag of the 304.
+"""
+
+import gzip
+import os
+
+from anyio import CapacityLimiter, to_thread
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smallest body compressed, in bytes
+MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+# Bodies from this size (in bytes) are compressed in a thread
+OFFLOAD_SIZE = int(os.environ.get("COMPRESSION_OFFLOAD_SIZE", str(64 * 1024)))
+# Threads compressing the large bodies, separate from the threads of the endpoints
+COMPRESSION_THREADS = int(os.environ.get("COMPRESSION_THREADS", "4"))
+
+# Compression level of each encoding, by content type (without its parameters).
+# gzip: 1 (fast) to 9 (small), br: 0 (fast) to 11 (small).
+LEVELS = {
+    "application/json": {"br": 4, "gzip": 6},
+    "text/csv": {"br": 5, "gzip": 6},
+    "text/plain": {"br": 5, "gzip": 6},
+    "text/html": {"br": 5, "gzip": 6},
+}
+
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate(accept_encoding):
+    """Return the encoding to use for an Accept-Encoding header, None for no compression."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body, encoding, level):
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    # mtime=0: the same body always gives the same bytes
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing the responses (see the module docstring)."""
+
+    def __init__(self, app):
+        self.app = app
+        self.limiter = None  # Created in the event loop, at the first large body
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None  # The http.response.start message, held until the body is known
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                # The rest of a streamed response, already started
+                await send(message)
+                return
+
+            headers = MutableHeaders(scope=start)
+            body = message.get("body", b"")
+            content_type = headers.get("content-type", "").split(";")[0].strip()
+            levels = LEVELS.get(content_type)
+            if levels is not None:
+                headers.add_vary_header("Accept-Encoding")
+
+            if (levels is None or message.get("more_body", False) or len(body) < MIN_SIZE
+                    or "content-encoding" in headers):
+                await send(start)
+                start = None
+                await send(message)
+                return
+
+            if len(body) >= OFFLOAD_SIZE:
+                if self.limiter is None:
+                    self.limiter = CapacityLimiter(COMPRESSION_THREADS)
+                body = await to_thread.run_sync(compress, body, encoding, levels[encoding], limiter=self.limiter)
+            else:
+                body = compress(body, encoding, levels[encoding])
+
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            etag = headers.get("etag")
+            if etag is not None and etag.endswith('"'):
+                headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+            await send(start)
+            start = None
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,63 @@
+"""Dashboard KPIs (GET /api/dashboard).
+
+The KPIs are read from two summary tables, kept up to date by SQLite triggers on
+every write to the tables they summarize (see create_db.py). Reading the dashboard
+costs two primary key lookups, whatever the size of the data:
+- Dashboard_Totaux, a single row: active contracts, supplier debt, stock value.
+- Dashboard_Mois, one row per month (yyyy-mm): the bons de passage and the
+  versements forfait of the month.
+
+rebuild() recomputes both tables from the data. It is used by create_db.py to fill
+them and by rebuild_dashboard.py to repair a drift (rows written while the
+triggers were missing, rounding of the REAL amounts of the bons d'achat, ...).
+"""
+
+# The columns of Dashboard_Mois, all zero for a month without activity
+MONTH_COLUMNS = ["nb_passages", "poids_collecte", "exces_poids", "montant_exces", "montant_passages", "versements"]
+
+REBUILD_SQL = [
+    "DELETE FROM Dashboard_Totaux",
+    """
+    INSERT INTO Dashboard_Totaux (id, contrats_actifs, dette_fournisseurs, valeur_stock)
+    VALUES (
+        1,
+        (SELECT COUNT(*) FROM Contrat_Forfait WHERE etat = 'Actif'),
+        (SELECT COALESCE(SUM(montant_total - montant_verse), 0) FROM Bon_Achats),
+        (SELECT COALESCE(SUM(qte * prix_dernier), 0) FROM Inventaire)
+    )
+    """,
+    "DELETE FROM Dashboard_Mois",
+    """
+    INSERT INTO Dashboard_Mois (mois, nb_passages, poids_collecte, exces_poids, montant_exces, montant_passages)
+    SELECT substr(date, 1, 7), COUNT(*), SUM(poids_collecte), SUM(exces_poids),
+        SUM(exces_poids * prix_exces_poids), SUM(montant)
+    FROM Bon_Passage_Forfait
+    GROUP BY substr(date, 1, 7)
+    """,
+    """
+    INSERT INTO Dashboard_Mois (mois, versements)
+    SELECT substr(date, 1, 7), SUM(montant) FROM Versement_Forfait
+    GROUP BY substr(date, 1, 7)
+    ON CONFLICT (mois) DO UPDATE SET versements = excluded.versements
+    """,
+]
+
+
+def rebuild(cursor):
+    """Recompute the summary tables from the data."""
+    for sql in REBUILD_SQL:
+        cursor.execute(sql)
+
+
+def read_dashboard(cursor, mois):
+    """Return the KPIs, with the activity of the month `mois` (yyyy-mm)."""
+    cursor.execute("SELECT contrats_actifs, dette_fournisseurs, valeur_stock FROM Dashboard_Totaux WHERE id = 1")
+    totals = cursor.fetchone()
+    cursor.execute(f"SELECT {', '.join(MONTH_COLUMNS)} FROM Dashboard_Mois WHERE mois = ?", (mois,))
+    month = cursor.fetchone()
+
+    result = dict(totals) if totals else {"contrats_actifs": 0, "dette_fournisseurs": 0, "valeur_stock": 0}
+    result["mois"] = mois
+    for column in MONTH_COLUMNS:
+        result[column] = month[column] if month else 0
+    return result
@@ -0,0 +1,352 @@
+"""SQLite connection pool shared by all the API endpoints.
+
+Opening a SQLite connection is cheap but not free: the file has to be opened,
+the PRAGMAs applied and the page cache is lost every time the connection is
+closed. The pool keeps a small number of connections open for the whole life
+of the FastAPI application and hands them out to the requests.
+"""
+
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from anyio import CapacityLimiter, to_thread
+from fastapi import HTTPException
+
+
+# Database configuration (can be overridden with environment variables)
+DB_PATH = os.environ.get("DB_PATH", "db/db.sqlite")
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+# Maximum time (in seconds) a request waits for a free connection
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+# A connection idle for longer than this (in seconds) is checked before being reused
+POOL_HEALTHCHECK_INTERVAL = float(os.environ.get("DB_POOL_HEALTHCHECK_INTERVAL", "30"))
+# Number of worker threads running the endpoints (and so the database work).
+# The endpoints are regular functions: FastAPI runs them in a thread pool so a slow
+# query never blocks the event loop. By default there is one thread per connection.
+WORKER_THREADS = int(os.environ.get("DB_WORKER_THREADS", str(POOL_SIZE)))
+# Number of threads waiting for a free connection (see get_db). More requests
+# wait without a thread, in the order they came.
+ACQUIRE_THREADS = int(os.environ.get("DB_ACQUIRE_THREADS", "64"))
+
+# SQLite tuning, all the settings the server needs to run with several workers.
+# WAL lets readers and a writer work at the same time, a writer waits up to
+# BUSY_TIMEOUT_MS for the lock instead of failing with "database is locked".
+JOURNAL_MODE = os.environ.get("DB_JOURNAL_MODE", "WAL")
+SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+# Page cache per connection, in KiB
+CACHE_SIZE_KIB = int(os.environ.get("DB_CACHE_SIZE_KIB", "20000"))
+# Size of the memory mapped part of the database file, in bytes (0 disables it)
+MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# When SQLite still answers SQLITE_BUSY after the busy timeout, the statement is
+# retried this many times, waiting BUSY_BACKOFF seconds, then twice as long, etc.
+BUSY_RETRIES = int(os.environ.get("DB_BUSY_RETRIES", "5"))
+BUSY_BACKOFF = float(os.environ.get("DB_BUSY_BACKOFF", "0.05"))
+
+# PRAGMAs applied once, when a connection is opened
+CONNECTION_PRAGMAS = [
+    "PRAGMA foreign_keys = ON",
+    f"PRAGMA journal_mode = {JOURNAL_MODE}",
+    f"PRAGMA synchronous = {SYNCHRONOUS}",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    f"PRAGMA cache_size = -{CACHE_SIZE_KIB}",
+    f"PRAGMA mmap_size = {MMAP_SIZE}",
+]
+
+
+def is_busy_error(error):
+    """Check if an sqlite3 error means the database is locked by another connection."""
+    message = str(error).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+def run_with_retry(conn, function, *args):
+    """Run a statement, retrying with backoff while the database is busy.
+
+    A statement is only retried when no transaction is open: the failed statement
+    was the one starting the transaction, so nothing has been written yet.
+    """
+    attempt = 0
+    while True:
+        try:
+            return function(*args)
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or conn.in_transaction or attempt >= BUSY_RETRIES:
+                raise
+            time.sleep(BUSY_BACKOFF * (2 ** attempt) * (0.5 + random.random()))
+            attempt += 1
+
+
+class RetryingCursor(sqlite3.Cursor):
+    """Cursor retrying its statements when the database is busy."""
+
+    def execute(self, sql, parameters=()):
+        return run_with_retry(self.connection, super().execute, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        # executemany consumes its parameters, make a list so a retry sees them again
+        return run_with_retry(self.connection, super().executemany, sql, list(parameters))
+
+
+class RetryingConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute) retry busy statements."""
+
+    def cursor(self, factory=RetryingCursor):
+        return super().cursor(factory)
+
+
+class ConnectionPool:
+    """A fixed size pool of SQLite connections.
+
+    Connections are created lazily, up to `size`. When all connections are in
+    use, a request waits until another request gives its connection back.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 healthcheck_interval=POOL_HEALTHCHECK_INTERVAL):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+
+        # Idle connections, stored as (connection, time it was given back)
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.discarded = 0
+
+    def _open_connection(self):
+        """Open a new connection and apply the per-connection PRAGMAs."""
+        # check_same_thread=False allows a connection to be reused by the different
+        # threads of the server, the pool makes sure only one request uses it at a time
+        # isolation_level="IMMEDIATE" makes write transactions take the write lock when
+        # they start, so two workers never deadlock trying to upgrade a read lock
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=RetryingConnection,
+                               timeout=BUSY_TIMEOUT_MS / 1000, isolation_level="IMMEDIATE")
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        conn.row_factory = sqlite3.Row  # This enables column access by name
+        return conn
+
+    def _is_healthy(self, conn):
+        """Check that a connection still works."""
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        """Close a connection and free its slot in the pool."""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+            self.discarded += 1
+
+    def _reuse(self, conn, released_at):
+        """Check an idle connection before handing it out again."""
+        # Connections idle for a long time are checked before being reused
+        if time.monotonic() - released_at > self.healthcheck_interval and not self._is_healthy(conn):
+            self._discard(conn)
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def acquire(self):
+        """Get a connection from the pool, opening a new one if needed."""
+        if self._closed:
+            raise HTTPException(status_code=503, detail="Le pool de connexions est fermé")
+
+        while True:
+            # 1. Reuse an idle connection if there is one
+            try:
+                conn, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+
+            if conn is not None:
+                if self._reuse(conn, released_at):
+                    return conn
+                continue
+
+            # 2. Open a new connection if the pool is not full yet
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+                    self.misses += 1
+            if can_open:
+                try:
+                    return self._open_connection()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+
+            # 3. Otherwise wait for another request to give a connection back
+            start = time.monotonic()
+            try:
+                conn, released_at = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise HTTPException(status_code=503, detail="Aucune connexion à la base de données disponible")
+            finally:
+                with self._lock:
+                    self.waits += 1
+                    self.wait_time += time.monotonic() - start
+            if self._reuse(conn, released_at):
+                return conn
+
+    def release(self, conn):
+        """Give a connection back to the pool."""
+        # Never give back a connection with a transaction still open
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        if self._closed:
+            self._discard(conn)
+            return
+
+        self._idle.put((conn, time.monotonic()))
+
+    def close(self):
+        """Close all the idle connections. Connections in use are closed when released."""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        """Return the pool statistics."""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "size": self.size,
+                "opened": self._opened,
+                "idle": self._idle.qsize(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 4) if requests else 0.0,
+                "waits": self.waits,
+                "wait_time_total_ms": round(self.wait_time * 1000, 3),
+                "wait_time_avg_ms": round(self.wait_time * 1000 / self.waits, 3) if self.waits else 0.0,
+                "discarded": self.discarded,
+            }
+
+
+# Dates are stored as ISO text (yyyy-mm-dd) so they sort chronologically and can be
+# served by an index. The API keeps accepting and returning dd/mm/yyyy.
+API_DATE_FORMAT = "%d/%m/%Y"
+DB_DATE_FORMAT = "%Y-%m-%d"
+
+# Columns holding a date, converted when a row is sent to the API
+DATE_COLUMNS = {"date", "date_debut", "date_fin", "debut_contrat", "fin_contrat"}
+
+
+def to_db_date(value):
+    """Convert a dd/mm/yyyy date from the API to the yyyy-mm-dd format stored in the database."""
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, API_DATE_FORMAT).strftime(DB_DATE_FORMAT)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Format de date invalide. Utilisez le format dd/mm/yyyy")
+
+
+def to_api_date(value):
+    """Convert a yyyy-mm-dd date from the database to the dd/mm/yyyy format of the API."""
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, DB_DATE_FORMAT).strftime(API_DATE_FORMAT)
+    except ValueError:
+        # Not an ISO date (for example a row written before the dates were converted)
+        return value
+
+
+def row_to_dict(row):
+    """Convert a database row to a dict for the API, formatting the date columns."""
+    result = dict(row)
+    for column in DATE_COLUMNS:
+        if column in result:
+            result[column] = to_api_date(result[column])
+    return result
+
+
+def add_date_range(conditions, params, column, date_from, date_to):
+    """Add the `from`/`to` filters of a list endpoint to a WHERE clause.
+
+    Both bounds are inclusive and given in the API format (dd/mm/yyyy). Comparing
+    ISO dates lets SQLite use the index on the date column.
+    """
+    if date_from:
+        conditions.append(f"{column} >= ?")
+        params.append(to_db_date(date_from))
+    if date_to:
+        conditions.append(f"{column} <= ?")
+        params.append(to_db_date(date_to))
+
+
+# The pool used by the application, created when the application starts
+pool = None
+acquire_limiter = None
+
+
+def open_pool():
+    """Create the application pool. Called when the FastAPI application starts."""
+    global pool, acquire_limiter
+    if not os.path.exists(DB_PATH):
+        raise RuntimeError(f"Database file not found: {DB_PATH}")
+    pool = ConnectionPool(DB_PATH)
+    acquire_limiter = CapacityLimiter(ACQUIRE_THREADS)
+    return pool
+
+
+def close_pool():
+    """Close the application pool. Called when the FastAPI application stops."""
+    global pool
+    if pool is not None:
+        pool.close()
+        pool = None
+
+
+# Database connection setup
+async def get_db():
+    """Get a database connection from the pool."""
+    # Keep a reference to the pool, the global can be reset while the request runs
+    current_pool = pool
+    if current_pool is None:
+        raise HTTPException(status_code=500, detail="La base de données n'est pas initialisée")
+
+    # Wait for a connection in a thread of acquire_limiter, not of the thread pool
+    # running the endpoints: when the requests waiting for a connection took all the
+    # endpoint threads, the requests holding the connections could not run to give
+    # them back, and every request waited POOL_TIMEOUT before failing with a 503.
+    conn = await to_thread.run_sync(current_pool.acquire, limiter=acquire_limiter)
+    try:
+        yield conn
+    finally:
+        current_pool.release(conn)
@@ -0,0 +1,112 @@
+"""Conditional GETs: ETag and If-None-Match.
+
+Every write to a table bumps its row of Table_Version, with a trigger (see
+create_db.py). A GET endpoint declares the tables it reads with
+`dependencies=[conditional("Agents", ...)]`. Its ETag is computed from the
+request (path and query string), the versions of these tables and the date of
+the day (some endpoints default to today), without running the query nor
+encoding the response. When the ETag is the one sent in If-None-Match, the
+request is answered with a 304 before the endpoint runs.
+
+The versions are read before the endpoint reads its data: a write made in
+between gives a response newer than its ETag, which is only a useless 200 at the
+next request, never a stale 304.
+
+ETagMiddleware adds the ETag to the 200 responses. A compressed 200 carries the
+ETag with the encoding as a suffix (see compression.py): its 304 sends back the
+same suffixed ETag, as a 304 must send the validator the 200 would have.
+"""
+
+import hashlib
+from datetime import date
+
+from fastapi import Depends, Request
+from fastapi.responses import Response
+
+from compression import negotiate
+from database import get_db
+
+
+class NotModified(Exception):
+    """Raised by a conditional GET whose data did not change, answered with a 304."""
+
+    def __init__(self, etag, encoding=None):
+        self.etag = etag
+        self.encoding = encoding  # Encoding suffix of the matched ETag, None without one
+
+
+def conditional(*tables):
+    """Dependency of a GET endpoint reading `tables`."""
+    sql = f"SELECT name, version FROM Table_Version WHERE name IN ({', '.join('?' * len(tables))}) ORDER BY name"
+
+    def check(request: Request, conn = Depends(get_db)):
+        cursor = conn.cursor()
+        cursor.execute(sql, tables)
+        versions = ",".join(f"{row['name']}:{row['version']}" for row in cursor.fetchall())
+        key = f"{request.url.path}?{request.url.query}|{versions}|{date.today().isoformat()}"
+        etag = '"' + hashlib.blake2b(key.encode(), digest_size=12).hexdigest() + '"'
+
+        if_none_match = parse_if_none_match(request.headers.get("if-none-match"))
+        if ("*", None) in if_none_match:
+            raise NotModified(etag)
+        # A suffixed ETag matches when the response would be compressed the same way
+        encoding = negotiate(request.headers.get("accept-encoding"))
+        for tag, tag_encoding in if_none_match:
+            if tag == etag and tag_encoding in (None, encoding):
+                raise NotModified(etag, tag_encoding)
+        request.state.etag = etag
+
+    return Depends(check)
+
+
+def parse_if_none_match(header):
+    """The (ETag, encoding) of the tags of an If-None-Match header (weak ETags compared as strong ones).
+
+    The suffix added to the ETag of a compressed response (see compression.py) is
+    split from the ETag, the encoding is None for a tag without suffix.
+    """
+    if not header:
+        return []
+    tags = []
+    for tag in header.split(","):
+        tag = tag.strip().removeprefix("W/")
+        encoding = None
+        for name in ("gzip", "br"):
+            if tag.endswith(f'-{name}"'):
+                tag, encoding = tag[:-len(name) - 2] + '"', name
+        tags.append((tag, encoding))
+    return tags
+
+
+def not_modified_response(request, error):
+    """Exception handler of NotModified: the ETag of the 200, with its encoding suffix."""
+    headers = {"ETag": error.etag, "Cache-Control": "no-cache"}
+    if error.encoding is not None:
+        headers["ETag"] = f'{error.etag[:-1]}-{error.encoding}"'
+        headers["Vary"] = "Accept-Encoding"
+    return Response(status_code=304, headers=headers)
+
+
+class ETagMiddleware:
+    """ASGI middleware adding the ETag computed by conditional() to the 200 responses."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_etag(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                etag = scope.get("state", {}).get("etag")
+                if etag:
+                    # no-cache: the browser cache must ask the server before reusing a response
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"etag", etag.encode()),
+                        (b"cache-control", b"no-cache"),
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
@@ -0,0 +1,213 @@
+"""Excess weight (exces de poids) of the bons de passage.
+
+The poids_forfait of a contract is a threshold, counted over a period chosen by
+its `seuil_periode`:
+- 'Passage': each passage may collect poids_forfait kg, the excess is
+  max(0, poids_collecte - poids_forfait).
+- 'Mois' / 'Année': the passages of a calendar month / year share poids_forfait kg.
+  The passages are counted in (date, id) order, a passage pays for the kg it adds
+  above the threshold: max(0, cumul - seuil) - max(0, cumul before it - seuil).
+
+For the cumulative thresholds, Poids_Periode_Forfait keeps the running totals of
+each contract and period. A new passage, the last of its period (the usual case),
+is priced from these totals without reading the other passages. A passage added
+before the last one of its period, changed or removed, changes the excess of the
+passages after it: its period is recomputed.
+
+Each bon keeps the prix_exces_poids its excess was priced with, and its montant
+includes exces_poids * prix_exces_poids. When the excess or the price of a bon
+changes, only this part of the montant changes.
+
+The functions take a cursor and do not commit: they run in the transaction of
+the caller. `contrat` is a Contrat_Forfait row.
+"""
+
+# Length of the date prefix (yyyy-mm-dd) naming the period of a cumulative threshold
+PERIODES = {"Mois": 7, "Année": 4}
+SEUIL_PERIODES = ["Passage"] + list(PERIODES)
+
+# Set the excess and price of a bon, the montant follows the change of its excess cost.
+# The right side of SET reads the values before the update.
+SET_EXCES_SQL = """
+    UPDATE Bon_Passage_Forfait
+    SET montant = montant - exces_poids * prix_exces_poids + :exces_poids * :prix,
+        exces_poids = :exces_poids, prix_exces_poids = :prix
+    WHERE id = :id
+"""
+
+
+# The passages of several periods with their running total in each period, the
+# periods given as VALUES (contrat_id, periode, first date, last date)
+PERIODES_SQL = """
+    WITH periodes (contrat_id, periode, first_date, last_date) AS (VALUES {})
+    SELECT periodes.contrat_id, periodes.periode, bon.id, bon.date, bon.poids_collecte,
+        bon.exces_poids, bon.prix_exces_poids,
+        SUM(bon.poids_collecte) OVER (
+            PARTITION BY periodes.contrat_id, periodes.periode
+            ORDER BY bon.date, bon.id ROWS UNBOUNDED PRECEDING
+        ) AS cumul
+    FROM periodes
+    JOIN Bon_Passage_Forfait bon
+        ON bon.contrat_id = periodes.contrat_id AND bon.date BETWEEN periodes.first_date AND periodes.last_date
+    ORDER BY periodes.contrat_id, periodes.periode, bon.date, bon.id
+"""
+# Periods read by one query of recompute_periodes (4 parameters each)
+PERIODES_CHUNK = 200
+
+
+def periode_of(contrat, date):
+    """The period of a date (yyyy-mm-dd) for the threshold of a contract, None per passage."""
+    length = PERIODES.get(contrat["seuil_periode"])
+    return date[:length] if length else None
+
+
+def periode_bounds(periode):
+    """The first and last dates (yyyy-mm-dd) of a month (yyyy-mm) or a year (yyyy)."""
+    if len(periode) == 7:
+        return periode + "-01", periode + "-31"
+    return periode + "-01-01", periode + "-12-31"
+
+
+def excess(cumul_before, poids, seuil):
+    """The kg above the threshold added by a passage of `poids` kg."""
+    return max(0, cumul_before + poids - seuil) - max(0, cumul_before - seuil)
+
+
+def _set_exces(cursor, bon_id, exces_poids, prix):
+    cursor.execute(SET_EXCES_SQL, {"id": bon_id, "exces_poids": exces_poids, "prix": prix})
+
+
+def passage_added(cursor, contrat, bon_id):
+    """Compute the excess of a new bon de passage and update the running totals."""
+    cursor.execute("SELECT date, poids_collecte FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
+    bon = cursor.fetchone()
+    seuil = contrat["poids_forfait"]
+    prix = contrat["prix_exces_poids"]
+
+    periode = periode_of(contrat, bon["date"])
+    if periode is None:
+        _set_exces(cursor, bon_id, excess(0, bon["poids_collecte"], seuil), prix)
+        return
+
+    cursor.execute(
+        "SELECT poids_collecte, derniere_date FROM Poids_Periode_Forfait WHERE contrat_id = ? AND periode = ?",
+        (contrat["id"], periode)
+    )
+    totals = cursor.fetchone()
+    if totals is not None and bon["date"] < totals["derniere_date"]:
+        # Passages after this one already counted the kg before them
+        recompute_periode(cursor, contrat, periode)
+        return
+
+    cumul = totals["poids_collecte"] if totals else 0
+    exces_poids = excess(cumul, bon["poids_collecte"], seuil)
+    _set_exces(cursor, bon_id, exces_poids, prix)
+    cursor.execute("""
+        INSERT INTO Poids_Periode_Forfait (contrat_id, periode, poids_collecte, exces_poids, derniere_date)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (contrat_id, periode) DO UPDATE SET
+            poids_collecte = poids_collecte + excluded.poids_collecte,
+            exces_poids = exces_poids + excluded.exces_poids,
+            derniere_date = excluded.derniere_date
+    """, (contrat["id"], periode, bon["poids_collecte"], exces_poids, bon["date"]))
+
+
+def passage_changed(cursor, contrat, bon_id, old_date, old_poids):
+    """Update the excess after the date or poids_collecte of a bon changed."""
+    cursor.execute("SELECT date, poids_collecte FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
+    bon = cursor.fetchone()
+    if (bon["date"], bon["poids_collecte"]) == (old_date, old_poids):
+        return
+
+    periode = periode_of(contrat, bon["date"])
+    if periode is None:
+        _set_exces(cursor, bon_id, excess(0, bon["poids_collecte"], contrat["poids_forfait"]),
+                   contrat["prix_exces_poids"])
+        return
+
+    recompute_periode(cursor, contrat, periode)
+    old_periode = periode_of(contrat, old_date)
+    if old_periode != periode:
+        recompute_periode(cursor, contrat, old_periode)
+
+
+def passage_removed(cursor, contrat, date):
+    """Update the excess of the other passages after a bon of `date` was deleted."""
+    periode = periode_of(contrat, date)
+    if periode is not None:
+        recompute_periode(cursor, contrat, periode)
+
+
+def recompute_periode(cursor, contrat, periode):
+    """Recompute the excess of the passages of a period and its running totals."""
+    recompute_periodes(cursor, {(contrat["id"], periode): contrat})
+
+
+def recompute_periodes(cursor, periodes):
+    """Recompute the excess of the passages of several periods and their running totals.
+
+    `periodes` maps (contrat id, periode) to the contract. The passages of all the
+    periods are read with one query (per PERIODES_CHUNK periods), which keeps a bulk
+    import touching hundreds of periods per batch from running a query for each.
+    """
+    keys = list(periodes)
+    for start in range(0, len(keys), PERIODES_CHUNK):
+        chunk = keys[start:start + PERIODES_CHUNK]
+        parameters = []
+        for contrat_id, periode in chunk:
+            parameters.extend([contrat_id, periode, *periode_bounds(periode)])
+        cursor.execute(PERIODES_SQL.format(", ".join(["(?, ?, ?, ?)"] * len(chunk))), parameters)
+        bons_by_periode = {}
+        for bon in cursor.fetchall():
+            bons_by_periode.setdefault((bon["contrat_id"], bon["periode"]), []).append(bon)
+
+        changes, totals, empty = [], [], []
+        for contrat_id, periode in chunk:
+            contrat = periodes[contrat_id, periode]
+            bons = bons_by_periode.get((contrat_id, periode))
+            if not bons:
+                empty.append((contrat_id, periode))
+                continue
+
+            seuil = contrat["poids_forfait"]
+            prix = contrat["prix_exces_poids"]
+            total_exces = 0
+            for bon in bons:
+                exces_poids = excess(bon["cumul"] - bon["poids_collecte"], bon["poids_collecte"], seuil)
+                total_exces += exces_poids
+                if (bon["exces_poids"], bon["prix_exces_poids"]) != (exces_poids, prix):
+                    changes.append({"id": bon["id"], "exces_poids": exces_poids, "prix": prix})
+            totals.append((contrat_id, periode, bons[-1]["cumul"], total_exces, bons[-1]["date"]))
+
+        cursor.executemany(SET_EXCES_SQL, changes)
+        cursor.executemany(
+            "DELETE FROM Poids_Periode_Forfait WHERE contrat_id = ? AND periode = ?", empty
+        )
+        cursor.executemany("""
+            INSERT OR REPLACE INTO Poids_Periode_Forfait (contrat_id, periode, poids_collecte, exces_poids, derniere_date)
+            VALUES (?, ?, ?, ?, ?)
+        """, totals)
+
+
+def recompute_contrat(cursor, contrat):
+    """Recompute the excess of all the passages of a contract and its running totals.
+
+    Used when the poids_forfait, prix_exces_poids or seuil_periode of the contract change.
+    """
+    cursor.execute("DELETE FROM Poids_Periode_Forfait WHERE contrat_id = ?", (contrat["id"],))
+
+    if contrat["seuil_periode"] not in PERIODES:
+        cursor.execute("""
+            UPDATE Bon_Passage_Forfait
+            SET montant = montant - exces_poids * prix_exces_poids + MAX(0, poids_collecte - :seuil) * :prix,
+                exces_poids = MAX(0, poids_collecte - :seuil), prix_exces_poids = :prix
+            WHERE contrat_id = :contrat_id
+        """, {"seuil": contrat["poids_forfait"], "prix": contrat["prix_exces_poids"], "contrat_id": contrat["id"]})
+        return
+
+    length = PERIODES[contrat["seuil_periode"]]
+    cursor.execute(
+        "SELECT DISTINCT substr(date, 1, ?) AS periode FROM Bon_Passage_Forfait WHERE contrat_id = ?",
+        (length, contrat["id"])
+    )
+    recompute_periodes(cursor, {(contrat["id"], row["periode"]): contrat for row in cursor.fetchall()})
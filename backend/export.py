@@ -0,0 +1,327 @@
+"""Exports of the bons de passage, versements forfait and bons d'achat, as CSV or XLSX.
+
+A year of bons de passage does not fit the list endpoints, which build the whole
+list in memory. An export is streamed: its query is read FETCH_SIZE rows at a time
+from a cursor kept open for the whole response, each batch is written and sent
+before the next one is read. The memory used does not grow with the number of
+rows. The rows are read in one read transaction, so the file is consistent even
+when the tables are written meanwhile.
+
+- CSV: utf-8 with a BOM and ';' as separator, which Excel opens as is in French;
+  the dates are dd/mm/yyyy as in the API.
+- XLSX: written by xlsx_chunks() with zipfile on a write-only stream. The cells
+  are inline strings (no shared strings table to keep), the dates are real dates
+  of Excel and the numbers real numbers.
+The files can be imported back with bulk_import.py where the kind exists.
+"""
+
+import csv
+import io
+import os
+import re
+import zipfile
+from datetime import date
+from xml.sax.saxutils import escape
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from bulk_import import EXCEL_EPOCH, column_letters
+from database import add_date_range, to_api_date
+
+# Rows read from the cursor, written and sent at a time
+FETCH_SIZE = int(os.environ.get("EXPORT_FETCH_SIZE", "500"))
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# The lines of a bon on one cell: "Sac 100L x2 à 150, Conteneur x1 à 900"
+BONS_PASSAGE_SQL = """
+    SELECT bon.id, bon.date, client.nom AS client, client.agent, bon.contrat_id,
+        contrat.date_debut AS contrat_debut, contrat.date_fin AS contrat_fin,
+        bon.poids_collecte, bon.exces_poids, bon.prix_exces_poids, bon.montant,
+        (SELECT group_concat(produit || ' x' || printf('%g', qte) || ' à ' || prix, ', ')
+         FROM Bon_Passage_Forfait_Produits WHERE bon_passage_id = bon.id) AS produits,
+        (SELECT group_concat(service || COALESCE(' x' || printf('%g', qte), ''), ', ')
+         FROM Bon_Passage_Forfait_Services WHERE bon_passage_id = bon.id) AS services
+    FROM Bon_Passage_Forfait bon
+    JOIN Client_Forfait client ON client.id = bon.client_id
+    JOIN Contrat_Forfait contrat ON contrat.id = bon.contrat_id
+    {where}
+    ORDER BY bon.date, bon.id
+"""
+
+VERSEMENTS_SQL = """
+    SELECT versement.id, versement.date, client.nom AS client, versement.contrat_id,
+        contrat.date_debut AS contrat_debut, contrat.date_fin AS contrat_fin, versement.montant
+    FROM Versement_Forfait versement
+    JOIN Client_Forfait client ON client.id = versement.client_id
+    JOIN Contrat_Forfait contrat ON contrat.id = versement.contrat_id
+    {where}
+    ORDER BY versement.date, versement.id
+"""
+
+ACHATS_SQL = """
+    SELECT bon.id, bon.date, bon.fournisseur, bon.montant_total, bon.montant_verse,
+        COALESCE(bon.montant_total, 0) - bon.montant_verse AS reste,
+        (SELECT group_concat(produit || ' x' || qte || COALESCE(' à ' || printf('%g', prix), ''), ', ')
+         FROM Produits_Bon_Achat WHERE bon_achat_id = bon.id) AS produits
+    FROM Bon_Achats bon
+    {where}
+    ORDER BY bon.date, bon.id
+"""
+
+
+class Export:
+    """An export: its query, the column filtered by the date range and the columns of the file.
+
+    `columns` are (column of the query, title in the file, type), the type being
+    text, number or date (a yyyy-mm-dd date of the database).
+    """
+
+    def __init__(self, sql, date_column, columns):
+        self.sql = sql
+        self.date_column = date_column
+        self.columns = columns
+
+
+EXPORTS = {
+    "bons-passage": Export(BONS_PASSAGE_SQL, "bon.date", [
+        ("id", "N° bon", "number"),
+        ("date", "Date", "date"),
+        ("client", "Client", "text"),
+        ("agent", "Agent", "text"),
+        ("contrat_id", "N° contrat", "number"),
+        ("contrat_debut", "Début du contrat", "date"),
+        ("contrat_fin", "Fin du contrat", "date"),
+        ("poids_collecte", "Poids collecté (kg)", "number"),
+        ("exces_poids", "Excès de poids (kg)", "number"),
+        ("prix_exces_poids", "Prix de l'excès (DA/kg)", "number"),
+        ("montant", "Montant (DA)", "number"),
+        ("produits", "Produits", "text"),
+        ("services", "Services", "text"),
+    ]),
+    "versements-forfait": Export(VERSEMENTS_SQL, "versement.date", [
+        ("id", "N° versement", "number"),
+        ("date", "Date", "date"),
+        ("client", "Client", "text"),
+        ("contrat_id", "N° contrat", "number"),
+        ("contrat_debut", "Début du contrat", "date"),
+        ("contrat_fin", "Fin du contrat", "date"),
+        ("montant", "Montant (DA)", "number"),
+    ]),
+    "achats": Export(ACHATS_SQL, "bon.date", [
+        ("id", "N° bon", "number"),
+        ("date", "Date", "date"),
+        ("fournisseur", "Fournisseur", "text"),
+        ("montant_total", "Montant total (DA)", "number"),
+        ("montant_verse", "Montant versé (DA)", "number"),
+        ("reste", "Reste à payer (DA)", "number"),
+        ("produits", "Produits", "text"),
+    ]),
+}
+
+
+def fetch_batches(conn, cursor):
+    """Yield the rows of an executed query, FETCH_SIZE at a time, then end its read transaction."""
+    try:
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.rollback()
+
+
+def csv_value(value, kind):
+    if value is None:
+        return ""
+    if kind == "date":
+        return to_api_date(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def csv_chunks(batches, columns):
+    """Yield a CSV file by chunks, one per batch of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    # The BOM makes Excel read the file as utf-8
+    buffer.write("\ufeff")
+    writer.writerow([title for _, title, _ in columns])
+    for rows in batches:
+        for row in rows:
+            writer.writerow([csv_value(row[column], kind) for column, _, kind in columns])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+# The parts of a workbook of one sheet, besides the sheet itself
+XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '<Relationship Id="rId2" Target="styles.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+        '</Relationships>'
+    ),
+    # Styles: 0 normal, 1 bold (the titles), 2 date (format 14, the short date of the user)
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+# The title row stays visible when scrolling
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0">'
+    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    '</sheetView></sheetViews><sheetData>'
+)
+SHEET_END = '</sheetData></worksheet>'
+
+# Characters XML does not allow, even escaped
+XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def xlsx_cell(reference, value, kind, style=0):
+    if value is None:
+        return ""
+    if kind == "date":
+        try:
+            days = (date.fromisoformat(value) - EXCEL_EPOCH).days
+            return f'<c r="{reference}" s="2"><v>{days}</v></c>'
+        except ValueError:
+            pass  # Not an ISO date, written as text
+    if kind == "number" and isinstance(value, (int, float)):
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    text = escape(XML_INVALID.sub("", str(value)))
+    style = f' s="{style}"' if style else ""
+    return f'<c r="{reference}" t="inlineStr"{style}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+class _Stream:
+    """A write-only file collecting what zipfile writes, taken by chunks."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def xlsx_chunks(batches, columns):
+    """Yield an XLSX file by chunks, one per batch of rows.
+
+    zipfile writes to a stream it cannot seek: the sizes of each part follow its
+    data instead of preceding it, and the sheet is compressed as it is written.
+    """
+    letters = [column_letters(index) for index in range(len(columns))]
+    stream = _Stream()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            titles = "".join(
+                xlsx_cell(f"{letter}1", title, "text", style=1) for letter, (_, title, _) in zip(letters, columns)
+            )
+            sheet.write(f'{SHEET_START}<row r="1">{titles}</row>'.encode("utf-8"))
+            line = 1
+            for rows in batches:
+                xml = []
+                for row in rows:
+                    line += 1
+                    cells = "".join(
+                        xlsx_cell(f"{letter}{line}", row[column], kind)
+                        for letter, (column, _, kind) in zip(letters, columns)
+                    )
+                    xml.append(f'<row r="{line}">{cells}</row>')
+                sheet.write("".join(xml).encode("utf-8"))
+                yield stream.take()
+            sheet.write(SHEET_END.encode("utf-8"))
+    yield stream.take()
+
+
+def export_response(conn, kind, file_format, date_from, date_to):
+    """Return the StreamingResponse of an export, between two dates (dd/mm/yyyy, inclusive)."""
+    if file_format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Format invalide: {file_format} (csv ou xlsx)")
+    export = EXPORTS[kind]
+    conditions, params = [], []
+    add_date_range(conditions, params, export.date_column, date_from, date_to)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    cursor = conn.cursor()
+    # One read transaction for the whole file, ended by fetch_batches. The query is
+    # started here so an error is answered before the response begins.
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute(export.sql.format(where=where), params)
+    except BaseException:
+        conn.rollback()
+        raise
+
+    batches = fetch_batches(conn, cursor)
+    chunks = xlsx_chunks(batches, export.columns) if file_format == "xlsx" else csv_chunks(batches, export.columns)
+    name = "_".join([kind] + [bound.replace("/", "-") for bound in (date_from, date_to) if bound])
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[file_format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{file_format}"'},
+    )
@@ -0,0 +1,81 @@
+"""Sparse fieldsets: the `?fields=` parameter of the GET endpoints.
+
+`GET /api/agents?fields=id,nom` only reads the `id` and `nom` columns from the
+database and only sends them. A dropdown needing a few columns of a table does
+not pay for the other columns: less rows to copy, less JSON to send.
+
+The responses of respond() are encoded to JSON bytes straight from the rows,
+without the validation by the response_model of the endpoint: the rows were
+validated when they were written, validating them again (dates, phone numbers,
+...) was most of the CPU time of a large list. The response_model still gives the
+schema of the OpenAPI documentation. API_VALIDATE_OUTPUT=1 makes the full
+responses validated again, to compare (see `python benchmark.py serialization`).
+orjson is used when it is installed, else the C encoder of the json module.
+"""
+
+import json
+import os
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Validate the full responses with the response_model (the slow path)
+VALIDATE_OUTPUT = os.environ.get("API_VALIDATE_OUTPUT", "0") == "1"
+
+
+def parse_fields(fields, model):
+    """Return the columns asked with `?fields=id,nom`, or None when all the columns are asked.
+
+    Only the fields of the response model (which are the columns of the table) are accepted,
+    so the names can be put in the SQL query.
+    """
+    if fields is None:
+        return None
+
+    allowed = list(model.__fields__)
+    columns = []
+    for name in fields.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in allowed:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Champ inconnu '{name}'. Champs acceptés: {', '.join(allowed)}"
+            )
+        if name not in columns:
+            columns.append(name)
+
+    if not columns:
+        raise HTTPException(status_code=400, detail="Le paramètre fields ne contient aucun champ")
+    return columns
+
+
+def select_list(columns):
+    """The column list of a SELECT for the columns returned by parse_fields."""
+    if columns is None:
+        return "*"
+    return ", ".join(columns)
+
+
+def encode_json(data):
+    """Encode data to JSON bytes, as compact as the JSONResponse of FastAPI."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def respond(data, columns):
+    """Return the data of a GET endpoint, as a JSON response of the rows as they are.
+
+    With API_VALIDATE_OUTPUT=1, all the columns are returned as is for FastAPI to
+    validate them with the response_model.
+    """
+    if columns is None and VALIDATE_OUTPUT:
+        return data
+    return Response(content=encode_json(data), media_type="application/json")
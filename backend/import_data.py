@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""
+Import clients, contrats, bons de passage or achats from a CSV or XLSX file.
+
+The same import as POST /api/import/{kind} (see bulk_import.py for the columns
+of each kind of file). The valid rows are imported by batches, the refused rows
+are printed with their line in the file. With --dry-run the file is only checked.
+
+Usage (from the backend directory):
+    python import_data.py {clients,contrats,bons-passage,achats} FILE [--dry-run] [--db path/to/db.sqlite]
+"""
+import argparse
+import sqlite3
+import sys
+
+from fastapi import HTTPException
+
+import bulk_import
+from database import DB_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a CSV or XLSX file")
+    parser.add_argument("kind", choices=list(bulk_import.IMPORTERS), help="kind of rows in the file")
+    parser.add_argument("file", help="CSV or XLSX file, with the names of the columns on the first line")
+    parser.add_argument("--dry-run", action="store_true", help="check the file without writing it")
+    parser.add_argument("--db", default=DB_PATH, help="database file")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    try:
+        with open(args.file, "rb") as file:
+            report = bulk_import.run_import(conn, args.kind, file, args.dry_run)
+    except HTTPException as e:
+        raise SystemExit(e.detail)
+    finally:
+        conn.close()
+
+    for error in report["erreurs"]:
+        print(f"ligne {error['ligne']}: {error['erreur']}")
+    if report["nb_erreurs"] > len(report["erreurs"]):
+        print(f"... {report['nb_erreurs'] - len(report['erreurs'])} more errors")
+    action = "checked" if args.dry_run else "imported"
+    print(f"{report['importees']} of {report['lignes']} row(s) {action}, "
+          f"{report['nb_erreurs']} error(s), in {report['duree_ms'] / 1000:.2f} s")
+    sys.exit(1 if report["nb_erreurs"] else 0)
+
+
+if __name__ == "__main__":
+    main()
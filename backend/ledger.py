@@ -0,0 +1,145 @@
+"""Account ledger of the forfait clients.
+
+A client is charged the montant of each contract (on its date_debut) and of each
+bon de passage (excess weight and consumables), and credited with each versement.
+The solde is debit - credit: a positive solde is what the client still owes.
+
+All the sums are computed by SQLite: the running solde of the ledger with window
+functions, the balances of all the clients with one GROUP BY per table. Every
+query takes an `as_of` date (yyyy-mm-dd) and ignores the entries after it.
+"""
+
+from database import to_api_date
+from pagination import DEFAULT_PAGE_SIZE, encode_cursor, decode_cursor
+
+# `as_of` used when no date is given: every entry is counted
+END_OF_TIME = "9999-12-31"
+
+# Type of an entry, by its `rang`. The rang also orders the entries of the same day:
+# the contract first, then the bons de passage, then the versements.
+ENTRY_TYPES = ("Contrat", "Bon de passage", "Versement")
+
+# One row per contract, bon de passage and versement of a client
+ENTRIES_SQL = """
+    SELECT date_debut AS date, 0 AS rang, id AS reference, id AS contrat_id, montant AS debit, 0 AS credit
+    FROM Contrat_Forfait WHERE client_id = :client_id AND date_debut <= :as_of
+    UNION ALL
+    SELECT date, 1, id, contrat_id, montant, 0
+    FROM Bon_Passage_Forfait WHERE client_id = :client_id AND date <= :as_of
+    UNION ALL
+    SELECT date, 2, id, contrat_id, 0, montant
+    FROM Versement_Forfait WHERE client_id = :client_id AND date <= :as_of
+"""
+
+# The entries with the running solde of the client and of the contract of the entry.
+# (date, rang, reference) is unique, it orders the ledger and is the key of the pages.
+LEDGER_SQL = f"""
+    SELECT date, rang, reference, contrat_id, debit, credit,
+        SUM(debit - credit) OVER (
+            ORDER BY date, rang, reference ROWS UNBOUNDED PRECEDING
+        ) AS solde,
+        SUM(debit - credit) OVER (
+            PARTITION BY contrat_id ORDER BY date, rang, reference ROWS UNBOUNDED PRECEDING
+        ) AS solde_contrat
+    FROM ({ENTRIES_SQL})
+"""
+
+# The totals of each contract, with the totals of the client on every row
+CONTRACT_TOTALS_SQL = f"""
+    SELECT contrat_id, SUM(debit) AS debit, SUM(credit) AS credit, SUM(debit - credit) AS solde,
+        SUM(SUM(debit)) OVER () AS total_debit,
+        SUM(SUM(credit)) OVER () AS total_credit,
+        SUM(COUNT(*)) OVER () AS row_count
+    FROM ({ENTRIES_SQL})
+    GROUP BY contrat_id
+    ORDER BY contrat_id
+"""
+
+# The solde of every client, each table is read once
+BALANCES_SQL = """
+    SELECT c.id AS client_id, c.nom,
+        COALESCE(contrats.total, 0) + COALESCE(bons.total, 0) AS debit,
+        COALESCE(versements.total, 0) AS credit,
+        COALESCE(contrats.total, 0) + COALESCE(bons.total, 0) - COALESCE(versements.total, 0) AS solde
+    FROM Client_Forfait c
+    LEFT JOIN (
+        SELECT client_id, SUM(montant) AS total FROM Contrat_Forfait
+        WHERE date_debut <= :as_of GROUP BY client_id
+    ) contrats ON contrats.client_id = c.id
+    LEFT JOIN (
+        SELECT client_id, SUM(montant) AS total FROM Bon_Passage_Forfait
+        WHERE date <= :as_of GROUP BY client_id
+    ) bons ON bons.client_id = c.id
+    LEFT JOIN (
+        SELECT client_id, SUM(montant) AS total FROM Versement_Forfait
+        WHERE date <= :as_of GROUP BY client_id
+    ) versements ON versements.client_id = c.id
+    ORDER BY c.nom, c.id
+"""
+
+
+def _entry(row):
+    """Convert a ledger row for the API."""
+    return {
+        "date": to_api_date(row["date"]),
+        "type": ENTRY_TYPES[row["rang"]],
+        "reference": row["reference"],
+        "contrat_id": row["contrat_id"],
+        "debit": row["debit"],
+        "credit": row["credit"],
+        "solde": row["solde"],
+        "solde_contrat": row["solde_contrat"],
+    }
+
+
+def client_ledger(cursor, client_id, as_of=None, limit=None, after=None):
+    """Return the totals of a client and a page of its ledger, oldest entry first.
+
+    The running soldes of a page count all the entries before it, not only the
+    entries of the page.
+    """
+    params = {"client_id": client_id, "as_of": as_of or END_OF_TIME}
+
+    cursor.execute(CONTRACT_TOTALS_SQL, params)
+    contrats = cursor.fetchall()
+
+    conditions = ""
+    if after is not None:
+        params["date"], params["rang"], params["reference"] = decode_cursor(after, 3)
+        conditions = "WHERE (date, rang, reference) > (:date, :rang, :reference)"
+    # One more row than the page size is read to know if there is a next page
+    page_size = limit or DEFAULT_PAGE_SIZE
+    params["limit"] = page_size + 1
+
+    cursor.execute(
+        f"SELECT * FROM ({LEDGER_SQL}) {conditions} ORDER BY date, rang, reference LIMIT :limit",
+        params
+    )
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([last["date"], last["rang"], last["reference"]])
+
+    first = contrats[0] if contrats else None
+    return {
+        "client_id": client_id,
+        "debit": first["total_debit"] if first else 0,
+        "credit": first["total_credit"] if first else 0,
+        "solde": first["total_debit"] - first["total_credit"] if first else 0,
+        "contrats": [
+            {"contrat_id": row["contrat_id"], "debit": row["debit"], "credit": row["credit"], "solde": row["solde"]}
+            for row in contrats
+        ],
+        "items": [_entry(row) for row in rows],
+        "next_cursor": next_cursor,
+        "row_count": first["row_count"] if first else 0,
+    }
+
+
+def client_balances(cursor, as_of=None):
+    """Return the debit, credit and solde of every client."""
+    cursor.execute(BALANCES_SQL, {"as_of": as_of or END_OF_TIME})
+    return [dict(row) for row in cursor.fetchall()]
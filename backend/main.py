@@ -2,36 +2,51 @@
 
 import re
 import sqlite3
-import os
-from typing import Optional, List
-from fastapi import FastAPI, HTTPException, Depends
+from contextlib import asynccontextmanager
+from anyio import to_thread
+from typing import Optional, List, Union
+from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
 from models import (Agent, Produit, Service, Fournisseur, BonAchats, ProduitBonAchat, 
                     Inventaire, VersementBonAchat, ClientModel, ContratForfaitModel, 
                     BonPassageForfaitModel, BonPassageForfaitProduitModel,
-                    BonPassageForfaitServiceModel, VersementForfaitModel)
+                    BonPassageForfaitServiceModel, VersementForfaitModel, ClientPage,
+                    BonAchatsPage, InventairePage, ContratForfaitPage, BonPassageForfaitPage,
+                    VersementForfaitPage, BonAchatDocument, BonPassageForfaitDocument,
+                    ClientProfile, ClientLedger, ClientBalance, DashboardKPI,
+                    MouvementStock, MouvementStockPage, StockProduit, InventaireValuation,
+                    ImportRapport, ResultatRecherche)
 from pydantic import BaseModel, validator, Field
 from datetime import date, datetime
-
-# Database connection setup
-def get_db():
-    """Get a database connection."""
-    db_path = "db/db.sqlite"
-    if not os.path.exists(db_path):
-        raise HTTPException(status_code=500, detail=f"Database file not found: {db_path}")
-    
-    # Add check_same_thread=False to allow SQLite connections across different threads
-    conn = sqlite3.connect(db_path, check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute("PRAGMA foreign_keys = ON;")
-    conn.row_factory = sqlite3.Row  # This enables column access by name
-    
-    try:
-        yield conn
+import database
+import ledger
+import exces_poids
+import dashboard
+import stock
+import valuation
+import catalog
+import bulk_import
+import export
+import search
+from etag import conditional, NotModified, not_modified_response, ETagMiddleware
+from compression import CompressionMiddleware
+from database import get_db, row_to_dict, to_db_date, to_api_date
+from pagination import MAX_PAGE_SIZE, ListQuery
+from fields import parse_fields, select_list, respond
+
+@asynccontextmanager
+async def lifespan(app):
+    """Open the database connection pool on startup and close it on shutdown."""
+    # The endpoints using the database are regular (non async) functions, FastAPI
+    # runs them in this thread pool. Bound it so it matches the connection pool.
+    to_thread.current_default_thread_limiter().total_tokens = database.WORKER_THREADS
+    database.open_pool()
+    try:
+        yield
     finally:
-        conn.close()
+        database.close_pool()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Configuration CORS
 app.add_middleware(
@@ -40,50 +55,79 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # The frontend reads the ETag to send it back in If-None-Match (see etag.py)
+    expose_headers=["ETag"],
 )
-
-def recalculate_montant_verse(bon_id: int, cursor):
-    """Recalculate the total montant_verse for a bon d'achat based on versements"""
-    cursor.execute("SELECT SUM(montant) FROM Versement_Bon_Achat WHERE bon_achat_id = ?", (bon_id,))
-    total_versements = cursor.fetchone()[0]
-    total_versements = total_versements if total_versements is not None else 0
-    
-    # Update the montant_verse field
-    cursor.execute(
-        "UPDATE Bon_Achats SET montant_verse = ? WHERE id = ?",
-        (total_versements, bon_id)
+app.add_middleware(ETagMiddleware)
+# Added last, so it compresses the final response (see compression.py)
+app.add_middleware(CompressionMiddleware)
+app.add_exception_handler(NotModified, not_modified_response)
+
+# Bon_Achats.montant_verse is maintained by triggers on Versement_Bon_Achat (see
+# create_db.py), which also refuse a versement taking it above montant_total.
+# The endpoints check the rule first to give the amounts in the message, the
+# trigger message is the one of a write racing with them.
+OVERPAYMENT_ERROR = "Le montant versé ne peut pas dépasser le montant total du bon d'achat"
+
+# Messages of the triggers refusing a write that breaks a rule of the data
+TRIGGER_RULES = {OVERPAYMENT_ERROR, stock.STOCK_ERROR}
+
+def overpayment_error(montant_verse, montant_total):
+    """The 400 error of a versement taking montant_verse above montant_total"""
+    return HTTPException(
+        status_code=400,
+        detail=f"Le montant versé ({montant_verse} DA) ne peut pas dépasser le montant total ({montant_total} DA)"
     )
-    return total_versements
+
+def rule_violation(error):
+    """The 400 error of a write refused by a trigger rule, None for another sqlite3 error"""
+    if isinstance(error, sqlite3.IntegrityError) and str(error) in TRIGGER_RULES:
+        return HTTPException(status_code=400, detail=str(error))
+    return None
+
+# Database statistics endpoint
+@app.get("/api/db/stats")
+async def get_db_stats():
+    """Get the connection pool statistics (hits, misses, wait time)."""
+    if database.pool is None:
+        raise HTTPException(status_code=503, detail="La base de données n'est pas initialisée")
+    return database.pool.stats()
+
+@app.get("/api/catalogs/stats")
+async def get_catalog_stats():
+    """Get the statistics of the catalog cache (hits, misses, invalidations)."""
+    return catalog.cache.stats()
 
 # Agent endpoints
-@app.get("/api/agents", response_model=List[Agent])
-async def get_agents(conn = Depends(get_db)):
+@app.get("/api/agents", response_model=List[Agent], dependencies=[conditional("Agents")])
+def get_agents(fields: Optional[str] = None, conn = Depends(get_db)):
     """Get all agents."""
+    columns = parse_fields(fields, Agent)
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Agents")
-        agents = cursor.fetchall()
-        
-        # Convert to list of dicts for Pydantic model
-        return [dict(agent) for agent in agents]
+        # Served from the catalog cache while the table is unchanged (see catalog.py)
+        # ORDER BY id: the same order whatever the columns asked (a covering index
+        # could otherwise serve ?fields= in its own order)
+        sql = f"SELECT {select_list(columns)} FROM Agents ORDER BY id"
+        return catalog.cache.response(conn, "Agents", sql, columns)
     except Exception as e:
         # Log the error for server-side debugging
         print(f"Error fetching agents: {str(e)}")
         # Return a user-friendly error
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
-@app.get("/api/agents/{agent_id}", response_model=Agent)
-async def get_agent(agent_id: int, conn = Depends(get_db)):
+@app.get("/api/agents/{agent_id}", response_model=Agent, dependencies=[conditional("Agents")])
+def get_agent(agent_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Get a specific agent by ID."""
+    columns = parse_fields(fields, Agent)
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Agents WHERE id = ?", (agent_id,))
+        cursor.execute(f"SELECT {select_list(columns)} FROM Agents WHERE id = ?", (agent_id,))
         agent = cursor.fetchone()
         
         if agent is None:
             raise HTTPException(status_code=404, detail=f"Agent avec ID {agent_id} non trouvé")
         
-        return dict(agent)
+        return respond(row_to_dict(agent), columns)
     except HTTPException:
         raise
     except Exception as e:
@@ -91,7 +135,7 @@ async def get_agent(agent_id: int, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.post("/api/agents", response_model=Agent)
-async def create_agent(agent: Agent, conn = Depends(get_db)):
+def create_agent(agent: Agent, conn = Depends(get_db)):
     """Create a new agent."""
     try:
         cursor = conn.cursor()
@@ -116,6 +160,7 @@ async def create_agent(agent: Agent, conn = Depends(get_db)):
         ))
         
         conn.commit()
+        catalog.cache.invalidate("Agents")
         
         # Return the created agent with its ID
         return {**agent.dict(), "id": next_id}
@@ -124,7 +169,7 @@ async def create_agent(agent: Agent, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/agents/{agent_id}", response_model=Agent)
-async def update_agent(agent_id: int, agent: Agent, conn = Depends(get_db)):
+def update_agent(agent_id: int, agent: Agent, conn = Depends(get_db)):
     """Update an existing agent."""
     try:
         cursor = conn.cursor()
@@ -150,6 +195,7 @@ async def update_agent(agent_id: int, agent: Agent, conn = Depends(get_db)):
         ))
         
         conn.commit()
+        catalog.cache.invalidate("Agents")
         
         # Return the updated agent
         return {**agent.dict(), "id": agent_id}
@@ -160,7 +206,7 @@ async def update_agent(agent_id: int, agent: Agent, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/agents/{agent_id}")
-async def delete_agent(agent_id: int, conn = Depends(get_db)):
+def delete_agent(agent_id: int, conn = Depends(get_db)):
     """Delete an agent."""
     try:
         cursor = conn.cursor()
@@ -173,6 +219,7 @@ async def delete_agent(agent_id: int, conn = Depends(get_db)):
         # Delete the agent
         cursor.execute("DELETE FROM Agents WHERE id = ?", (agent_id,))
         conn.commit()
+        catalog.cache.invalidate("Agents")
         
         return {"message": f"Agent avec ID {agent_id} supprimé avec succès"}
     except HTTPException:
@@ -182,16 +229,16 @@ async def delete_agent(agent_id: int, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 # Product endpoints
-@app.get("/api/produits", response_model=List[Produit])
-async def get_produits(conn = Depends(get_db)):
+@app.get("/api/produits", response_model=List[Produit], dependencies=[conditional("Produit")])
+def get_produits(fields: Optional[str] = None, conn = Depends(get_db)):
     """Get all products."""
+    columns = parse_fields(fields, Produit)
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Produit")
-        produits = cursor.fetchall()
-        
-        # Convert to list of dicts for Pydantic model
-        return [dict(produit) for produit in produits]
+        # Served from the catalog cache while the table is unchanged (see catalog.py)
+        # ORDER BY id: the same order whatever the columns asked (a covering index
+        # could otherwise serve ?fields= in its own order)
+        sql = f"SELECT {select_list(columns)} FROM Produit ORDER BY id"
+        return catalog.cache.response(conn, "Produit", sql, columns)
     except Exception as e:
         # Log the error for server-side debugging
         print(f"Error fetching products: {str(e)}")
@@ -199,7 +246,7 @@ async def get_produits(conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.post("/api/produits", response_model=Produit)
-async def create_produit(produit: Produit, conn = Depends(get_db)):
+def create_produit(produit: Produit, conn = Depends(get_db)):
     """Create a new product."""
     try:
         cursor = conn.cursor()
@@ -224,6 +271,7 @@ async def create_produit(produit: Produit, conn = Depends(get_db)):
         ))
         
         conn.commit()
+        catalog.cache.invalidate("Produit")
         
         # Return the created product with its ID
         return {**produit.dict(), "id": next_id}
@@ -234,7 +282,7 @@ async def create_produit(produit: Produit, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/produits/{produit_id}", response_model=Produit)
-async def update_produit(produit_id: int, produit: Produit, conn = Depends(get_db)):
+def update_produit(produit_id: int, produit: Produit, conn = Depends(get_db)):
     """Update an existing product."""
     try:
         cursor = conn.cursor()
@@ -261,6 +309,7 @@ async def update_produit(produit_id: int, produit: Produit, conn = Depends(get_d
         ))
         
         conn.commit()
+        catalog.cache.invalidate("Produit")
         
         # Return the updated product
         return {**produit.dict(), "id": produit_id}
@@ -271,7 +320,7 @@ async def update_produit(produit_id: int, produit: Produit, conn = Depends(get_d
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/produits/{produit_id}")
-async def delete_produit(produit_id: int, conn = Depends(get_db)):
+def delete_produit(produit_id: int, conn = Depends(get_db)):
     """Delete a product."""
     try:
         cursor = conn.cursor()
@@ -284,6 +333,7 @@ async def delete_produit(produit_id: int, conn = Depends(get_db)):
         # Delete the product
         cursor.execute("DELETE FROM Produit WHERE id = ?", (produit_id,))
         conn.commit()
+        catalog.cache.invalidate("Produit")
         
         return {"message": f"Produit avec ID {produit_id} supprimé avec succès"}
     except HTTPException:
@@ -293,16 +343,16 @@ async def delete_produit(produit_id: int, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 # Service endpoints
-@app.get("/api/services", response_model=List[Service])
-async def get_services(conn = Depends(get_db)):
+@app.get("/api/services", response_model=List[Service], dependencies=[conditional("Service")])
+def get_services(fields: Optional[str] = None, conn = Depends(get_db)):
     """Get all services."""
+    columns = parse_fields(fields, Service)
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Service")
-        services = cursor.fetchall()
-        
-        # Convert to list of dicts for Pydantic model
-        return [dict(service) for service in services]
+        # Served from the catalog cache while the table is unchanged (see catalog.py)
+        # ORDER BY id: the same order whatever the columns asked (a covering index
+        # could otherwise serve ?fields= in its own order)
+        sql = f"SELECT {select_list(columns)} FROM Service ORDER BY id"
+        return catalog.cache.response(conn, "Service", sql, columns)
     except Exception as e:
         # Log the error for server-side debugging
         print(f"Error fetching services: {str(e)}")
@@ -310,7 +360,7 @@ async def get_services(conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.post("/api/services", response_model=Service)
-async def create_service(service: Service, conn = Depends(get_db)):
+def create_service(service: Service, conn = Depends(get_db)):
     """Create a new service."""
     try:
         cursor = conn.cursor()
@@ -336,6 +386,7 @@ async def create_service(service: Service, conn = Depends(get_db)):
         ))
         
         conn.commit()
+        catalog.cache.invalidate("Service")
         
         # Return the created service with its ID
         return {**service.dict(), "id": next_id}
@@ -346,7 +397,7 @@ async def create_service(service: Service, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/services/{service_id}", response_model=Service)
-async def update_service(service_id: int, service: Service, conn = Depends(get_db)):
+def update_service(service_id: int, service: Service, conn = Depends(get_db)):
     """Update an existing service."""
     try:
         cursor = conn.cursor()
@@ -374,6 +425,7 @@ async def update_service(service_id: int, service: Service, conn = Depends(get_d
         ))
         
         conn.commit()
+        catalog.cache.invalidate("Service")
         
         # Return the updated service
         return {**service.dict(), "id": service_id}
@@ -384,7 +436,7 @@ async def update_service(service_id: int, service: Service, conn = Depends(get_d
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/services/{service_id}")
-async def delete_service(service_id: int, conn = Depends(get_db)):
+def delete_service(service_id: int, conn = Depends(get_db)):
     """Delete a service."""
     try:
         cursor = conn.cursor()
@@ -397,6 +449,7 @@ async def delete_service(service_id: int, conn = Depends(get_db)):
         # Delete the service
         cursor.execute("DELETE FROM Service WHERE id = ?", (service_id,))
         conn.commit()
+        catalog.cache.invalidate("Service")
         
         return {"message": f"Service avec ID {service_id} supprimé avec succès"}
     except HTTPException:
@@ -406,45 +459,31 @@ async def delete_service(service_id: int, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 # Fournisseur endpoints
-@app.get("/api/fournisseurs", response_model=List[Fournisseur])
-async def get_fournisseurs(conn = Depends(get_db)):
+@app.get("/api/fournisseurs", response_model=List[Fournisseur], dependencies=[conditional("Fournisseur")])
+def get_fournisseurs(fields: Optional[str] = None, conn = Depends(get_db)):
     """Get all suppliers."""
+    columns = parse_fields(fields, Fournisseur)
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, nom, telephone, adresse FROM Fournisseur ORDER BY id")
-        rows = cursor.fetchall()
-        
-        fournisseurs = []
-        for row in rows:
-            fournisseurs.append({
-                "id": row[0],
-                "nom": row[1],
-                "telephone": row[2],
-                "adresse": row[3]
-            })
-        
-        return fournisseurs
+        # Served from the catalog cache while the table is unchanged (see catalog.py)
+        sql = f"SELECT {select_list(columns)} FROM Fournisseur ORDER BY id"
+        return catalog.cache.response(conn, "Fournisseur", sql, columns)
     except Exception as e:
         print(f"Error fetching suppliers: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
-@app.get("/api/fournisseurs/{fournisseur_id}", response_model=Fournisseur)
-async def get_fournisseur(fournisseur_id: int, conn = Depends(get_db)):
+@app.get("/api/fournisseurs/{fournisseur_id}", response_model=Fournisseur, dependencies=[conditional("Fournisseur")])
+def get_fournisseur(fournisseur_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Get a single supplier by ID."""
+    columns = parse_fields(fields, Fournisseur)
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT id, nom, telephone, adresse FROM Fournisseur WHERE id = ?", (fournisseur_id,))
+        cursor.execute(f"SELECT {select_list(columns)} FROM Fournisseur WHERE id = ?", (fournisseur_id,))
         row = cursor.fetchone()
         
         if row is None:
             raise HTTPException(status_code=404, detail=f"Fournisseur avec ID {fournisseur_id} non trouvé")
         
-        return {
-                    "id": row[0],
-                    "nom": row[1],
-                    "telephone": row[2],
-                    "adresse": row[3]
-                }
+        return respond(row_to_dict(row), columns)
     
     except HTTPException:
         raise
@@ -453,7 +492,7 @@ async def get_fournisseur(fournisseur_id: int, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.post("/api/fournisseurs", response_model=Fournisseur)
-async def create_fournisseur(fournisseur: Fournisseur, conn = Depends(get_db)):
+def create_fournisseur(fournisseur: Fournisseur, conn = Depends(get_db)):
     """Create a new supplier."""
     try:
         cursor = conn.cursor()
@@ -480,6 +519,7 @@ async def create_fournisseur(fournisseur: Fournisseur, conn = Depends(get_db)):
         ))
         
         conn.commit()
+        catalog.cache.invalidate("Fournisseur")
         
         # Return the created supplier with its ID
         return {**fournisseur.dict(), "id": next_id}
@@ -490,7 +530,7 @@ async def create_fournisseur(fournisseur: Fournisseur, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/fournisseurs/{fournisseur_id}", response_model=Fournisseur)
-async def update_fournisseur(fournisseur_id: int, fournisseur: Fournisseur, conn = Depends(get_db)):
+def update_fournisseur(fournisseur_id: int, fournisseur: Fournisseur, conn = Depends(get_db)):
     """Update an existing supplier."""
     try:
         cursor = conn.cursor()
@@ -519,6 +559,7 @@ async def update_fournisseur(fournisseur_id: int, fournisseur: Fournisseur, conn
         ))
         
         conn.commit()
+        catalog.cache.invalidate("Fournisseur")
         
         # Return the updated supplier
         return {**fournisseur.dict(), "id": fournisseur_id}
@@ -529,80 +570,93 @@ async def update_fournisseur(fournisseur_id: int, fournisseur: Fournisseur, conn
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/fournisseurs/{fournisseur_id}")
-async def delete_fournisseur(fournisseur_id: int, conn = Depends(get_db)):
+def delete_fournisseur(fournisseur_id: int, conn = Depends(get_db)):
     try:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM Fournisseur WHERE id = ?", (fournisseur_id,))
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Fournisseur non trouvé")
         conn.commit()
+        catalog.cache.invalidate("Fournisseur")
         return {"message": "Fournisseur supprimé avec succès"}
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Bon d'achats endpoints
-@app.get("/api/bon-achats", response_model=List[BonAchats])
-async def get_bon_achats(conn = Depends(get_db)):
-    """Get all bon d'achats"""
+@app.get(
+    "/api/bon-achats", response_model=Union[List[BonAchats], BonAchatsPage],
+    dependencies=[conditional("Bon_Achats")]
+)
+def get_bon_achats(
+    fournisseur: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    sort: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    count: bool = False,
+    fields: Optional[str] = None,
+    conn = Depends(get_db)
+):
+    """Get all bon d'achats, optionally of one fournisseur and between two dates (dd/mm/yyyy, inclusive).
+    Sorted with `sort` (date or id, "-" for descending), newest first by default.
+    Returns one page when `limit` or `after` is given, with the total row count when `count` is true."""
+    columns = parse_fields(fields, BonAchats)
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Bon_Achats ORDER BY date DESC")
-        bon_achats = cursor.fetchall()
-        return [dict(row) for row in bon_achats]
+
+        # Served by the indexes on Bon_Achats(date) and Bon_Achats(fournisseur, date)
+        query = ListQuery("Bon_Achats", sortable=["date", "id"], default_sort="-date")
+        query.where_equal("fournisseur", fournisseur)
+        query.where_date_range("date", date_from, date_to)
+        query.order_by(sort)
+        return respond(query.fetch(cursor, limit, after, count, columns), columns)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/bon-achats/{bon_id}", response_model=BonAchats)
-async def get_bon_achat(bon_id: int, conn = Depends(get_db)):
+@app.get("/api/bon-achats/{bon_id}", response_model=BonAchats, dependencies=[conditional("Bon_Achats")])
+def get_bon_achat(bon_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Get a specific bon d'achat by ID"""
+    columns = parse_fields(fields, BonAchats)
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Bon_Achats WHERE id = ?", (bon_id,))
+        cursor.execute(f"SELECT {select_list(columns)} FROM Bon_Achats WHERE id = ?", (bon_id,))
         bon = cursor.fetchone()
         if bon is None:
             raise HTTPException(status_code=404, detail="Bon d'achat non trouvé")
-        return dict(bon)
+        return respond(row_to_dict(bon), columns)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/bon-achats", response_model=BonAchats)
-async def create_bon_achat(bon: BonAchats, id: Optional[int] = None, conn = Depends(get_db)):
+def create_bon_achat(bon: BonAchats, id: Optional[int] = None, conn = Depends(get_db)):
     """Create a new bon d'achat with optional ID for recreating after deletion"""
     try:
         cursor = conn.cursor()
         
-        # Always start with montant_verse = 0 for new bons
-        montant_verse = 0
-        
+        # A new bon has no versements: montant_verse starts at 0 and is then
+        # maintained by the triggers of Versement_Bon_Achat
         if id:
-            # When recreating with specific ID, check if there are any versements
-            cursor.execute("SELECT SUM(montant) FROM Versement_Bon_Achat WHERE bon_achat_id = ?", (id,))
-            total_versements = cursor.fetchone()[0]
-            
-            # Update montant_verse if versements exist
-            if total_versements is not None:
-                montant_verse = total_versements
-            
             # When recreating with specific ID (for update via delete and recreate)
             cursor.execute(
-                "INSERT INTO Bon_Achats (id, date, fournisseur, montant_total, montant_verse) VALUES (?, ?, ?, ?, ?) RETURNING *",
-                (id, bon.date, bon.fournisseur, bon.montant_total, montant_verse)
+                "INSERT INTO Bon_Achats (id, date, fournisseur, montant_total) VALUES (?, ?, ?, ?) RETURNING *",
+                (id, to_db_date(bon.date), bon.fournisseur, bon.montant_total)
             )
         else:
             # Normal creation with auto-incremented ID
             cursor.execute(
-                "INSERT INTO Bon_Achats (date, fournisseur, montant_total, montant_verse) VALUES (?, ?, ?, ?) RETURNING *",
-                (bon.date, bon.fournisseur, bon.montant_total, montant_verse)
+                "INSERT INTO Bon_Achats (date, fournisseur, montant_total) VALUES (?, ?, ?) RETURNING *",
+                (to_db_date(bon.date), bon.fournisseur, bon.montant_total)
             )
             
         new_bon = cursor.fetchone()
         conn.commit()
-        return dict(new_bon)
+        return row_to_dict(new_bon)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/bon-achats/{bon_id}", response_model=BonAchats)
-async def update_bon_achat(bon_id: int, bon: BonAchats, conn = Depends(get_db)):
+def update_bon_achat(bon_id: int, bon: BonAchats, conn = Depends(get_db)):
     """Update a bon d'achat"""
     try:
         cursor = conn.cursor()
@@ -612,108 +666,244 @@ async def update_bon_achat(bon_id: int, bon: BonAchats, conn = Depends(get_db)):
         if cursor.fetchone() is None:
             raise HTTPException(status_code=404, detail="Bon d'achat non trouvé")
         
-        # Calculate the actual montant_verse based on versements
-        cursor.execute("SELECT SUM(montant) FROM Versement_Bon_Achat WHERE bon_achat_id = ?", (bon_id,))
-        total_versements = cursor.fetchone()[0]
-        total_versements = total_versements if total_versements is not None else 0
-        
-        # Ensure montant_verse matches the versements
-        montant_verse = total_versements
-            
-        # Update the bon d'achat
+        # Update the bon d'achat, montant_verse is kept by the versement triggers
         cursor.execute(
-            "UPDATE Bon_Achats SET date = ?, fournisseur = ?, montant_total = ?, montant_verse = ? WHERE id = ? RETURNING *",
-            (bon.date, bon.fournisseur, bon.montant_total, montant_verse, bon_id)
+            "UPDATE Bon_Achats SET date = ?, fournisseur = ?, montant_total = ? WHERE id = ? RETURNING *",
+            (to_db_date(bon.date), bon.fournisseur, bon.montant_total, bon_id)
         )
         updated_bon = cursor.fetchone()
         conn.commit()
         
-        return dict(updated_bon)
+        return row_to_dict(updated_bon)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/bon-achats/{bon_id}")
-async def delete_bon_achat(bon_id: int, conn = Depends(get_db)):
+def delete_bon_achat(bon_id: int, conn = Depends(get_db)):
     """Delete a bon d'achat"""
     try:
         cursor = conn.cursor()
         
-        # First, get all products associated with this bon d'achat
-        cursor.execute("SELECT produit, qte FROM Produits_Bon_Achat WHERE bon_achat_id = ?", (bon_id,))
-        products = cursor.fetchall()
-        
-        if not products:
-            # No products found, just delete the bon d'achat
-            cursor.execute("DELETE FROM Bon_Achats WHERE id = ?", (bon_id,))
-            if cursor.rowcount == 0:
-                raise HTTPException(status_code=404, detail="Bon d'achat non trouvé")
-        else:
-            # Update inventory for each product
-            for product in products:
-                produit_name = product[0]
-                qte_to_remove = product[1]
-                
-                # Get current inventory
-                cursor.execute("SELECT id, qte FROM Inventaire WHERE produit = ?", (produit_name,))
-                inventory_item = cursor.fetchone()
-                
-                if inventory_item:
-                    inventory_id = inventory_item[0]
-                    current_qte = inventory_item[1]
-                    
-                    # Calculate new quantity
-                    new_qte = current_qte - qte_to_remove
-                    
-                    if new_qte <= 0:
-                        # If new quantity would be zero or negative, delete the inventory item
-                        cursor.execute("DELETE FROM Inventaire WHERE id = ?", (inventory_id,))
-                    else:
-                        # Otherwise update the quantity
-                        cursor.execute("UPDATE Inventaire SET qte = ? WHERE id = ?", (new_qte, inventory_id))
-            
-            # Now delete the bon d'achat (cascade will delete its products)
-            cursor.execute("DELETE FROM Bon_Achats WHERE id = ?", (bon_id,))
-            if cursor.rowcount == 0:
-                raise HTTPException(status_code=404, detail="Bon d'achat non trouvé")
+        # The cascade deletes its products, whose stock movements are cancelled by the
+        # triggers (see stock.py). Refused if the stock was already consumed.
+        cursor.execute("DELETE FROM Bon_Achats WHERE id = ?", (bon_id,))
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Bon d'achat non trouvé")
         
         conn.commit()
         return {"message": "Bon d'achat supprimé avec succès"}
+    except sqlite3.Error as e:
+        raise rule_violation(e) or HTTPException(status_code=500, detail=str(e))
+
+# Bon d'achat document endpoints: the header, produits and versements of a bon
+# d'achat are read in one request and saved in one transaction
+def read_bon_achat_document(cursor, bon_id):
+    """Read a bon d'achat with its produits and versements, None if it does not exist."""
+    cursor.execute("SELECT * FROM Bon_Achats WHERE id = ?", (bon_id,))
+    bon = cursor.fetchone()
+    if bon is None:
+        return None
+
+    document = row_to_dict(bon)
+    cursor.execute("SELECT * FROM Produits_Bon_Achat WHERE bon_achat_id = ? ORDER BY id", (bon_id,))
+    document["produits"] = [row_to_dict(row) for row in cursor.fetchall()]
+    cursor.execute("SELECT * FROM Versement_Bon_Achat WHERE bon_achat_id = ? ORDER BY id", (bon_id,))
+    document["versements"] = [row_to_dict(row) for row in cursor.fetchall()]
+    return document
+
+def save_produits_bon_achat(cursor, bon_id, produits):
+    """Save the produits of a document: only the added, changed and removed lines are written.
+
+    The triggers record the stock movements of the written lines (see stock.py).
+    """
+    cursor.execute("SELECT id, produit, qte, prix FROM Produits_Bon_Achat WHERE bon_achat_id = ?", (bon_id,))
+    stored = {row["id"]: row for row in cursor.fetchall()}
+
+    inserts = []
+    updates = []
+    kept = set()
+
+    for line in produits:
+        if line.id is not None:
+            if line.id not in stored or line.id in kept:
+                raise HTTPException(status_code=400, detail=f"Produit {line.id} invalide pour ce bon d'achat")
+            kept.add(line.id)
+            old = stored[line.id]
+            if (old["produit"], old["qte"], old["prix"]) == (line.produit, line.qte, line.prix):
+                continue  # Unchanged line
+            updates.append((line.produit, line.qte, line.prix, line.id))
+        else:
+            inserts.append((line.produit, line.qte, line.prix, bon_id))
+
+    deletes = [(line_id,) for line_id in stored if line_id not in kept]
+
+    # The new and changed lines go first: the stock they add can cover a removed line
+    cursor.executemany(
+        "INSERT INTO Produits_Bon_Achat (produit, qte, prix, bon_achat_id) VALUES (?, ?, ?, ?)",
+        inserts
+    )
+    cursor.executemany("UPDATE Produits_Bon_Achat SET produit = ?, qte = ?, prix = ? WHERE id = ?", updates)
+    cursor.executemany("DELETE FROM Produits_Bon_Achat WHERE id = ?", deletes)
+
+def save_versements_bon_achat(cursor, bon_id, versements):
+    """Save the versements of a document: only the added, changed and removed lines are written."""
+    cursor.execute("SELECT id, montant, type FROM Versement_Bon_Achat WHERE bon_achat_id = ?", (bon_id,))
+    stored = {row["id"]: row for row in cursor.fetchall()}
+
+    inserts = []
+    updates = []
+    kept = set()
+    for line in versements:
+        if line.id is None:
+            inserts.append((line.montant, line.type, bon_id))
+            continue
+        if line.id not in stored or line.id in kept:
+            raise HTTPException(status_code=400, detail=f"Versement {line.id} invalide pour ce bon d'achat")
+        kept.add(line.id)
+        old = stored[line.id]
+        if (old["montant"], old["type"]) != (line.montant, line.type):
+            updates.append((line.montant - old["montant"], (line.montant, line.type, line.id)))
+
+    deletes = [(line_id,) for line_id in stored if line_id not in kept]
+
+    # The overpayment triggers check every write against montant_total: the writes
+    # lowering montant_verse go first, so the ones raising it never go above the
+    # final total, which the caller checked
+    updates.sort(key=lambda update: update[0])
+    cursor.executemany("DELETE FROM Versement_Bon_Achat WHERE id = ?", deletes)
+    cursor.executemany(
+        "UPDATE Versement_Bon_Achat SET montant = ?, type = ? WHERE id = ?",
+        [parameters for _, parameters in updates]
+    )
+    cursor.executemany(
+        "INSERT INTO Versement_Bon_Achat (montant, type, bon_achat_id) VALUES (?, ?, ?)",
+        inserts
+    )
+
+def write_bon_achat_document(cursor, bon_id, document):
+    """Write the header and lines of a document to the bon d'achat `bon_id`."""
+    # The totals are computed from the lines, never taken from the client
+    montant_total = sum(line.qte * line.prix for line in document.produits if line.prix)
+    montant_verse = sum(line.montant for line in document.versements)
+    if montant_verse > montant_total:
+        raise overpayment_error(montant_verse, montant_total)
+
+    # The new montant_total is written first: the versements are checked against it.
+    # montant_verse follows the versements through the triggers.
+    cursor.execute(
+        "UPDATE Bon_Achats SET date = ?, fournisseur = ?, montant_total = ? WHERE id = ?",
+        (to_db_date(document.date), document.fournisseur, montant_total, bon_id)
+    )
+    save_produits_bon_achat(cursor, bon_id, document.produits)
+    save_versements_bon_achat(cursor, bon_id, document.versements)
+
+@app.get(
+    "/api/bon-achats/{bon_id}/document", response_model=BonAchatDocument,
+    dependencies=[conditional("Bon_Achats", "Produits_Bon_Achat", "Versement_Bon_Achat")]
+)
+def get_bon_achat_document(bon_id: int, conn = Depends(get_db)):
+    """Get a bon d'achat with its produits and versements"""
+    try:
+        document = read_bon_achat_document(conn.cursor(), bon_id)
+        if document is None:
+            raise HTTPException(status_code=404, detail="Bon d'achat non trouvé")
+        return document
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/bon-achats/document", response_model=BonAchatDocument)
+def create_bon_achat_document(document: BonAchatDocument, conn = Depends(get_db)):
+    """Create a bon d'achat with its produits and versements in one transaction"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            "INSERT INTO Bon_Achats (date, fournisseur, montant_total) VALUES (?, ?, 0)",
+            (to_db_date(document.date), document.fournisseur)
+        )
+        bon_id = cursor.lastrowid
+        write_bon_achat_document(cursor, bon_id, document)
+
+        saved = read_bon_achat_document(cursor, bon_id)
+        conn.commit()
+        return saved
+    except HTTPException:
+        conn.rollback()
+        raise
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise rule_violation(e) or HTTPException(status_code=500, detail=str(e))
+
+@app.put("/api/bon-achats/{bon_id}/document", response_model=BonAchatDocument)
+def save_bon_achat_document(bon_id: int, document: BonAchatDocument, conn = Depends(get_db)):
+    """Save a bon d'achat with its produits and versements in one transaction.
+
+    The lines with an id are updated if they changed, the lines without an id are
+    added and the stored lines missing from the document are removed. Only these
+    lines make stock movements.
+    """
+    try:
+        cursor = conn.cursor()
+        # Take the write lock before reading the stored lines, so the changes are
+        # computed on the state they are applied to
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT id FROM Bon_Achats WHERE id = ?", (bon_id,))
+        if cursor.fetchone() is None:
+            raise HTTPException(status_code=404, detail="Bon d'achat non trouvé")
+
+        write_bon_achat_document(cursor, bon_id, document)
+
+        saved = read_bon_achat_document(cursor, bon_id)
+        conn.commit()
+        return saved
+    except HTTPException:
+        conn.rollback()
+        raise
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise rule_violation(e) or HTTPException(status_code=500, detail=str(e))
+
 # API Endpoints for Produits_Bon_Achat
-@app.get("/api/bon-achats/{bon_id}/produits", response_model=List[ProduitBonAchat])
-async def get_produits_bon_achat(bon_id: int, conn = Depends(get_db)):
+@app.get(
+    "/api/bon-achats/{bon_id}/produits", response_model=List[ProduitBonAchat],
+    dependencies=[conditional("Produits_Bon_Achat")]
+)
+def get_produits_bon_achat(bon_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Get all products for a specific bon d'achat"""
+    columns = parse_fields(fields, ProduitBonAchat)
     try:
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT * FROM Produits_Bon_Achat WHERE bon_achat_id = ? ORDER BY id",
+            f"SELECT {select_list(columns)} FROM Produits_Bon_Achat WHERE bon_achat_id = ? ORDER BY id",
             (bon_id,)
         )
         produits = cursor.fetchall()
-        return [dict(row) for row in produits]
+        return respond([row_to_dict(row) for row in produits], columns)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/bon-achats/{bon_id}/produits/{produit_id}", response_model=ProduitBonAchat)
-async def get_produit_bon_achat(bon_id: int, produit_id: int, conn = Depends(get_db)):
+@app.get(
+    "/api/bon-achats/{bon_id}/produits/{produit_id}", response_model=ProduitBonAchat,
+    dependencies=[conditional("Produits_Bon_Achat")]
+)
+def get_produit_bon_achat(bon_id: int, produit_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Get a specific product from a bon d'achat"""
+    columns = parse_fields(fields, ProduitBonAchat)
     try:
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT * FROM Produits_Bon_Achat WHERE id = ? AND bon_achat_id = ?",
+            f"SELECT {select_list(columns)} FROM Produits_Bon_Achat WHERE id = ? AND bon_achat_id = ?",
             (produit_id, bon_id)
         )
         produit = cursor.fetchone()
         if produit is None:
             raise HTTPException(status_code=404, detail="Produit non trouvé")
-        return dict(produit)
+        return respond(row_to_dict(produit), columns)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/bon-achats/{bon_id}/produits", response_model=ProduitBonAchat)
-async def create_produit_bon_achat(bon_id: int, produit: ProduitBonAchat, conn = Depends(get_db)):
+def create_produit_bon_achat(bon_id: int, produit: ProduitBonAchat, conn = Depends(get_db)):
     """Add a new product to a bon d'achat"""
     try:
         # Verify that the bon_achat exists
@@ -730,37 +920,16 @@ async def create_produit_bon_achat(bon_id: int, produit: ProduitBonAchat, conn =
             """,
             (produit.produit, produit.qte, produit.prix, bon_id)
         )
+        # The trigger records the purchase in the stock movements (see stock.py)
         new_produit = cursor.fetchone()
         
-        # Update inventory
-        # Check if product exists in inventory
-        cursor.execute("SELECT id, qte, prix_dernier FROM Inventaire WHERE produit = ?", (produit.produit,))
-        existing_product = cursor.fetchone()
-        
-        if existing_product:
-            # Product exists, update quantity and price
-            product_id = existing_product[0]
-            new_qte = existing_product[1] + produit.qte
-            
-            cursor.execute(
-                "UPDATE Inventaire SET qte = ?, prix_dernier = ? WHERE id = ?",
-                (new_qte, produit.prix or existing_product[2], product_id)
-            )
-        else:
-            # Product doesn't exist, add it to inventory
-            if produit.prix:  # Only add to inventory if price is provided
-                cursor.execute(
-                    "INSERT INTO Inventaire (produit, qte, prix_dernier) VALUES (?, ?, ?)",
-                    (produit.produit, produit.qte, produit.prix)
-                )
-        
         conn.commit()
-        return dict(new_produit)
+        return row_to_dict(new_produit)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/bon-achats/{bon_id}/produits/{produit_id}", response_model=ProduitBonAchat)
-async def update_produit_bon_achat(
+def update_produit_bon_achat(
     bon_id: int,
     produit_id: int,
     produit: ProduitBonAchat,
@@ -781,89 +950,158 @@ async def update_produit_bon_achat(
         updated_produit = cursor.fetchone()
         if updated_produit is None:
             raise HTTPException(status_code=404, detail="Produit non trouvé")
+        # The trigger cancels the old stock movement of the line and records the new one
         conn.commit()
-        return dict(updated_produit)
+        return row_to_dict(updated_produit)
     except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise rule_violation(e) or HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/bon-achats/{bon_id}/produits/{produit_id}")
-async def delete_produit_bon_achat(bon_id: int, produit_id: int, conn = Depends(get_db)):
+def delete_produit_bon_achat(bon_id: int, produit_id: int, conn = Depends(get_db)):
     """Delete a product from a bon d'achat"""
     try:
         cursor = conn.cursor()
         
-        # First get the product details
-        cursor.execute(
-            "SELECT produit, qte FROM Produits_Bon_Achat WHERE id = ? AND bon_achat_id = ?",
-            (produit_id, bon_id)
-        )
-        product = cursor.fetchone()
-        
-        if product is None:
-            raise HTTPException(status_code=404, detail="Produit non trouvé")
-            
-        produit_name = product[0]
-        qte_to_remove = product[1]
-        
-        # Update inventory
-        cursor.execute("SELECT id, qte FROM Inventaire WHERE produit = ?", (produit_name,))
-        inventory_item = cursor.fetchone()
-        
-        if inventory_item:
-            inventory_id = inventory_item[0]
-            current_qte = inventory_item[1]
-            
-            # Calculate new quantity
-            new_qte = current_qte - qte_to_remove
-            
-            if new_qte <= 0:
-                # If new quantity would be zero or negative, delete the inventory item
-                cursor.execute("DELETE FROM Inventaire WHERE id = ?", (inventory_id,))
-            else:
-                # Otherwise update the quantity
-                cursor.execute("UPDATE Inventaire SET qte = ? WHERE id = ?", (new_qte, inventory_id))
-        
-        # Now delete the product
+        # The trigger cancels its stock movement (see stock.py), refused if the
+        # stock was already consumed
         cursor.execute(
             "DELETE FROM Produits_Bon_Achat WHERE id = ? AND bon_achat_id = ?",
             (produit_id, bon_id)
         )
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Produit non trouvé")
         
         conn.commit()
         return {"message": "Produit supprimé avec succès"}
     except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise rule_violation(e) or HTTPException(status_code=500, detail=str(e))
 
 # Inventaire endpoint
-@app.get("/api/inventaire", response_model=List[Inventaire])
-async def get_inventaire(conn = Depends(get_db)):
-    """Get all inventory items"""
+@app.get(
+    "/api/inventaire", response_model=Union[List[Inventaire], InventairePage],
+    dependencies=[conditional("Inventaire")]
+)
+def get_inventaire(
+    sort: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    count: bool = False,
+    fields: Optional[str] = None,
+    conn = Depends(get_db)
+):
+    """Get all inventory items sorted by produit, or one page when `limit` or `after` is given"""
+    columns = parse_fields(fields, Inventaire)
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Inventaire ORDER BY produit")
-        items = cursor.fetchall()
-        return [dict(item) for item in items]
+
+        # Sorted on produit (unique), served by its automatic index
+        query = ListQuery("Inventaire", sortable=["produit", "id"], default_sort="produit")
+        query.order_by(sort)
+        return respond(query.fetch(cursor, limit, after, count, columns), columns)
     except sqlite3.Error as e:
         print(f"Error fetching inventory: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
-@app.get("/api/bon-achats/{bon_id}/versements", response_model=List[VersementBonAchat])
-async def get_versements_bon_achat(bon_id: int, conn = Depends(get_db)):
+@app.get(
+    "/api/inventaire/stock", response_model=List[StockProduit],
+    dependencies=[conditional("Mouvement_Stock", "Stock_Snapshot")]
+)
+def get_stock(as_of: Optional[str] = None, conn = Depends(get_db)):
+    """Get the stock of every produit at the end of the day `as_of` (dd/mm/yyyy), today by default.
+
+    Read from the last monthly snapshot before the date plus the movements after it (see stock.py).
+    """
+    try:
+        as_of = to_db_date(as_of) or date.today().isoformat()
+        return stock.stock_as_of(conn.cursor(), as_of)
+    except HTTPException:
+        raise
+    except sqlite3.Error as e:
+        print(f"Error computing the stock: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.get("/api/inventaire/valuation", response_model=InventaireValuation, dependencies=[conditional("Mouvement_Stock")])
+def get_valuation(method: str = "wac", as_of: Optional[str] = None, conn = Depends(get_db)):
+    """Get the value of the stock of every produit at the end of the day `as_of` (dd/mm/yyyy), today by default.
+
+    `method` is wac (weighted average cost) or fifo. Computed from the stock movements,
+    with the cost layers of the produits cached between the requests (see valuation.py).
+    """
+    try:
+        if method not in valuation.METHODS:
+            raise HTTPException(status_code=400, detail=f"Méthode invalide: {method} (wac ou fifo)")
+        as_of = to_db_date(as_of) or date.today().isoformat()
+
+        cursor = conn.cursor()
+        # One read transaction: the new movements are read from the same state
+        cursor.execute("BEGIN")
+        items = valuation.cache.valuation(cursor, method, as_of)
+        conn.rollback()
+        return {
+            "method": method,
+            "as_of": to_api_date(as_of),
+            "valeur_totale": round(sum(item["valeur"] for item in items), 2),
+            "items": items,
+        }
+    except HTTPException:
+        raise
+    except sqlite3.Error as e:
+        print(f"Error computing the stock valuation: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.get(
+    "/api/inventaire/mouvements", response_model=Union[List[MouvementStock], MouvementStockPage],
+    dependencies=[conditional("Mouvement_Stock")]
+)
+def get_mouvements_stock(
+    produit: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    sort: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    count: bool = False,
+    fields: Optional[str] = None,
+    conn = Depends(get_db)
+):
+    """Get the stock movements, optionally of one produit and between two dates (dd/mm/yyyy, inclusive).
+    Sorted with `sort` (date or id, "-" for descending), newest first by default.
+    Returns one page when `limit` or `after` is given, with the total row count when `count` is true."""
+    columns = parse_fields(fields, MouvementStock)
+    try:
+        cursor = conn.cursor()
+
+        # Served by the indexes on Mouvement_Stock(date) and Mouvement_Stock(produit, date)
+        query = ListQuery("Mouvement_Stock", sortable=["date", "id"], default_sort="-date")
+        query.where_equal("produit", produit)
+        query.where_date_range("date", date_from, date_to)
+        query.order_by(sort)
+        return respond(query.fetch(cursor, limit, after, count, columns), columns)
+    except sqlite3.Error as e:
+        print(f"Error fetching stock movements: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.get(
+    "/api/bon-achats/{bon_id}/versements", response_model=List[VersementBonAchat],
+    dependencies=[conditional("Versement_Bon_Achat")]
+)
+def get_versements_bon_achat(bon_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Get all payments for a specific bon d'achat"""
+    columns = parse_fields(fields, VersementBonAchat)
     try:
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT * FROM Versement_Bon_Achat WHERE bon_achat_id = ? ORDER BY id",
+            f"SELECT {select_list(columns)} FROM Versement_Bon_Achat WHERE bon_achat_id = ? ORDER BY id",
             (bon_id,)
         )
         versements = cursor.fetchall()
-        return [dict(row) for row in versements]
+        return respond([row_to_dict(row) for row in versements], columns)
     except sqlite3.Error as e:
         print(f"Error fetching versements: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/bon-achats/{bon_id}/versements", response_model=VersementBonAchat)
-async def create_versement_bon_achat(bon_id: int, versement: VersementBonAchat, conn = Depends(get_db)):
+def create_versement_bon_achat(bon_id: int, versement: VersementBonAchat, conn = Depends(get_db)):
     """Add a new payment to a bon d'achat"""
     try:
         # Verify that the bon_achat exists
@@ -882,12 +1120,9 @@ async def create_versement_bon_achat(bon_id: int, versement: VersementBonAchat,
         
         # Check if new payment exceeds total amount
         if new_montant_verse > montant_total:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Le montant versé ({new_montant_verse} DA) ne peut pas dépasser le montant total ({montant_total} DA)"
-            )
+            raise overpayment_error(new_montant_verse, montant_total)
         
-        # Insert the new payment
+        # Insert the new payment, the trigger adds it to montant_verse
         cursor.execute(
             """
             INSERT INTO Versement_Bon_Achat (montant, type, bon_achat_id)
@@ -897,17 +1132,14 @@ async def create_versement_bon_achat(bon_id: int, versement: VersementBonAchat,
         )
         new_versement = cursor.fetchone()
         
-        # Recalculate montant_verse
-        recalculate_montant_verse(bon_id, cursor)
-        
         conn.commit()
-        return dict(new_versement)
+        return row_to_dict(new_versement)
     except sqlite3.Error as e:
         print(f"Error creating versement: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise rule_violation(e) or HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/bon-achats/{bon_id}/versements/{versement_id}", response_model=VersementBonAchat)
-async def update_versement_bon_achat(
+def update_versement_bon_achat(
     bon_id: int,
     versement_id: int,
     versement: VersementBonAchat,
@@ -929,11 +1161,16 @@ async def update_versement_bon_achat(
         current_montant = current_versement[0]
         
         # Get the bon d'achat details
-        cursor.execute("SELECT montant_total FROM Bon_Achats WHERE id = ?", (bon_id,))
+        cursor.execute("SELECT montant_total, montant_verse FROM Bon_Achats WHERE id = ?", (bon_id,))
         bon_achat = cursor.fetchone()
-        montant_total = bon_achat[0]
+        montant_total = bon_achat[0] or 0
+        
+        # Check the new total before writing. Lowering a versement is always allowed.
+        new_montant_verse = bon_achat[1] - current_montant + versement.montant
+        if versement.montant > current_montant and new_montant_verse > montant_total:
+            raise overpayment_error(new_montant_verse, montant_total)
         
-        # Update the versement
+        # Update the versement, the trigger applies the change to montant_verse
         cursor.execute(
             """
             UPDATE Versement_Bon_Achat 
@@ -945,25 +1182,13 @@ async def update_versement_bon_achat(
         )
         updated_versement = cursor.fetchone()
         
-        # Recalculate the total versements for this bon d'achat
-        total_versements = recalculate_montant_verse(bon_id, cursor)
-        
-        # Check if new total exceeds montant_total
-        if total_versements > montant_total:
-            # Rollback the transaction
-            conn.rollback()
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Le montant versé ({total_versements} DA) ne peut pas dépasser le montant total ({montant_total} DA)"
-            )
-        
         conn.commit()
-        return dict(updated_versement)
+        return row_to_dict(updated_versement)
     except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise rule_violation(e) or HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/bon-achats/{bon_id}/versements/{versement_id}")
-async def delete_versement_bon_achat(bon_id: int, versement_id: int, conn = Depends(get_db)):
+def delete_versement_bon_achat(bon_id: int, versement_id: int, conn = Depends(get_db)):
     """Delete a payment from a bon d'achat"""
     try:
         cursor = conn.cursor()
@@ -978,49 +1203,143 @@ async def delete_versement_bon_achat(bon_id: int, versement_id: int, conn = Depe
         if versement is None:
             raise HTTPException(status_code=404, detail="Versement non trouvé")
             
-        # Delete the versement
+        # Delete the versement, the trigger removes it from montant_verse
         cursor.execute(
             "DELETE FROM Versement_Bon_Achat WHERE id = ? AND bon_achat_id = ?",
             (versement_id, bon_id)
         )
         
-        # Recalculate the montant_verse
-        recalculate_montant_verse(bon_id, cursor)
-        
         conn.commit()
         return {"message": "Versement supprimé avec succès"}
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Dashboard endpoint (see dashboard.py)
+@app.get(
+    "/api/dashboard", response_model=DashboardKPI,
+    dependencies=[conditional("Dashboard_Totaux", "Dashboard_Mois")]
+)
+def get_dashboard(mois: Optional[str] = None, conn = Depends(get_db)):
+    """Récupérer les indicateurs du tableau de bord, avec l'activité du mois (mm/yyyy, par défaut le mois en cours)"""
+    try:
+        if mois is None:
+            month = date.today().strftime("%Y-%m")
+        else:
+            match = re.fullmatch(r"(\d{2})/(\d{4})", mois)
+            if match is None or not 1 <= int(match.group(1)) <= 12:
+                raise HTTPException(status_code=400, detail=f"Mois invalide: {mois} (format attendu: mm/yyyy)")
+            month = f"{match.group(2)}-{match.group(1)}"
+
+        cursor = conn.cursor()
+        # One read transaction: the totals and the month are read from the same state
+        cursor.execute("BEGIN")
+        result = dashboard.read_dashboard(cursor, month)
+        conn.rollback()
+        result["mois"] = f"{month[5:]}/{month[:4]}"
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error reading the dashboard: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+# Client ledger endpoints (see ledger.py). /api/clients/balances is declared before
+# /api/clients/{client_id}, which would take "balances" for a client id.
+@app.get(
+    "/api/clients/balances", response_model=List[ClientBalance],
+    dependencies=[conditional("Client_Forfait", "Contrat_Forfait", "Bon_Passage_Forfait", "Versement_Forfait")]
+)
+def get_client_balances(as_of: Optional[str] = None, conn = Depends(get_db)):
+    """Récupérer le solde de tous les clients, à la date as_of (dd/mm/yyyy) si elle est donnée"""
+    try:
+        return ledger.client_balances(conn.cursor(), to_db_date(as_of))
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error computing client balances: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.get(
+    "/api/clients/{client_id}/ledger", response_model=ClientLedger,
+    dependencies=[conditional("Client_Forfait", "Contrat_Forfait", "Bon_Passage_Forfait", "Versement_Forfait")]
+)
+def get_client_ledger(
+    client_id: int,
+    as_of: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    conn = Depends(get_db)
+):
+    """Récupérer le compte d'un client: ses totaux, ceux de ses contrats et une page de ses écritures.
+
+    Chaque écriture donne le solde du client et celui de son contrat après elle.
+    """
+    try:
+        cursor = conn.cursor()
+        # One read transaction: the totals and the page see the same entries
+        cursor.execute("BEGIN")
+        cursor.execute("SELECT id FROM Client_Forfait WHERE id = ?", (client_id,))
+        if cursor.fetchone() is None:
+            raise HTTPException(status_code=404, detail=f"Client_Forfait avec ID {client_id} non trouvé")
+
+        result = ledger.client_ledger(cursor, client_id, to_db_date(as_of), limit, after)
+        result["as_of"] = as_of
+        conn.rollback()
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error computing the ledger of client {client_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
 # Client endpoints
-@app.get("/api/clients", response_model=List[ClientModel])
-async def get_clients(conn = Depends(get_db)):
-    """Get all clients."""
+@app.get(
+    "/api/clients", response_model=Union[List[ClientModel], ClientPage],
+    dependencies=[conditional("Client_Forfait")]
+)
+def get_clients(
+    agent: Optional[str] = None,
+    etat_contrat: Optional[str] = None,
+    sort: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    count: bool = False,
+    fields: Optional[str] = None,
+    conn = Depends(get_db)
+):
+    """Get all clients, optionally of one agent or with one contract state, sorted by name by default.
+    Returns one page of clients when `limit` or `after` is given."""
+    columns = parse_fields(fields, ClientModel)
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Client_Forfait ORDER BY nom")
-        clients = cursor.fetchall()
-        
-        # Convert to list of dicts for Pydantic model
-        return [dict(client) for client in clients]
+
+        # Served by the indexes on Client_Forfait(nom), (agent, nom) and (etat_contrat, nom)
+        query = ListQuery("Client_Forfait", sortable=["nom", "id"], default_sort="nom")
+        query.where_equal("agent", agent)
+        query.where_equal("etat_contrat", etat_contrat)
+        query.order_by(sort)
+        return respond(query.fetch(cursor, limit, after, count, columns), columns)
+    except HTTPException:
+        raise
     except Exception as e:
         # Log the error for server-side debugging
         print(f"Error fetching clients: {str(e)}")
         # Return a user-friendly error
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
-@app.get("/api/clients/{client_id}", response_model=ClientModel)
-async def get_client(client_id: int, conn = Depends(get_db)):
+@app.get("/api/clients/{client_id}", response_model=ClientModel, dependencies=[conditional("Client_Forfait")])
+def get_client(client_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Get a specific client by ID."""
+    columns = parse_fields(fields, ClientModel)
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Client_Forfait WHERE id = ?", (client_id,))
+        cursor.execute(f"SELECT {select_list(columns)} FROM Client_Forfait WHERE id = ?", (client_id,))
         client = cursor.fetchone()
         
         if client is None:
             raise HTTPException(status_code=404, detail=f"Client_Forfait avec ID {client_id} non trouvé")
         
-        return dict(client)
+        return respond(row_to_dict(client), columns)
     except HTTPException:
         raise
     except Exception as e:
@@ -1028,7 +1347,7 @@ async def get_client(client_id: int, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.post("/api/clients", response_model=ClientModel)
-async def create_client(client: ClientModel, conn = Depends(get_db)):
+def create_client(client: ClientModel, conn = Depends(get_db)):
     """Create a new client."""
     try:
         cursor = conn.cursor()
@@ -1055,8 +1374,8 @@ async def create_client(client: ClientModel, conn = Depends(get_db)):
             client.mode,
             client.agent,
             client.etat_contrat,
-            client.debut_contrat,
-            client.fin_contrat
+            to_db_date(client.debut_contrat),
+            to_db_date(client.fin_contrat)
         ))
         
         conn.commit()
@@ -1070,7 +1389,7 @@ async def create_client(client: ClientModel, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/clients/{client_id}", response_model=ClientModel)
-async def update_client(client_id: int, client: ClientModel, conn = Depends(get_db)):
+def update_client(client_id: int, client: ClientModel, conn = Depends(get_db)):
     """Update an existing client."""
     try:
         cursor = conn.cursor()
@@ -1100,8 +1419,8 @@ async def update_client(client_id: int, client: ClientModel, conn = Depends(get_
             client.mode,
             client.agent,
             client.etat_contrat,
-            client.debut_contrat,
-            client.fin_contrat,
+            to_db_date(client.debut_contrat),
+            to_db_date(client.fin_contrat),
             client_id
         ))
         
@@ -1111,7 +1430,7 @@ async def update_client(client_id: int, client: ClientModel, conn = Depends(get_
         cursor.execute("SELECT * FROM Client_Forfait WHERE id = ?", (client_id,))
         updated_client = cursor.fetchone()
         
-        return dict(updated_client)
+        return row_to_dict(updated_client)
     except HTTPException:
         raise
     except Exception as e:
@@ -1119,7 +1438,7 @@ async def update_client(client_id: int, client: ClientModel, conn = Depends(get_
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/clients/{client_id}")
-async def delete_client(client_id: int, conn = Depends(get_db)):
+def delete_client(client_id: int, conn = Depends(get_db)):
     """Delete a client."""
     try:
         cursor = conn.cursor()
@@ -1140,66 +1459,177 @@ async def delete_client(client_id: int, conn = Depends(get_db)):
         print(f"Error deleting client {client_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
+# Client profile endpoint: all the data of the ClientProfile page in one request
+def group_by_bon(rows):
+    """Group the lines of the bons de passage by bon_passage_id."""
+    lines = {}
+    for row in rows:
+        line = row_to_dict(row)
+        lines.setdefault(line["bon_passage_id"], []).append(line)
+    return lines
+
+@app.get(
+    "/api/clients/{client_id}/profile", response_model=ClientProfile,
+    dependencies=[conditional(
+        "Client_Forfait", "Contrat_Forfait", "Bon_Passage_Forfait", "Versement_Forfait",
+        "Bon_Passage_Forfait_Produits", "Bon_Passage_Forfait_Services", "Agents", "Produit",
+        "Service"
+    )]
+)
+def get_client_profile(client_id: int, lines: bool = False, catalogs: bool = False, conn = Depends(get_db)):
+    """Récupérer le profil d'un client: le client, ses contrats, ses bons de passage et ses versements.
+
+    Avec ?lines=true, chaque bon de passage contient ses produits et services.
+    Avec ?catalogs=true, les agents, produits et services (listes des formulaires) sont inclus.
+    """
+    try:
+        cursor = conn.cursor()
+        # One read transaction: all the queries see the same state of the database,
+        # even if a bon or a versement is saved while the profile is read
+        cursor.execute("BEGIN")
+        cursor.execute("SELECT * FROM Client_Forfait WHERE id = ?", (client_id,))
+        client = cursor.fetchone()
+        if client is None:
+            raise HTTPException(status_code=404, detail=f"Client_Forfait avec ID {client_id} non trouvé")
+
+        profile = {"client": row_to_dict(client)}
+
+        cursor.execute("SELECT * FROM Contrat_Forfait WHERE client_id = ?", (client_id,))
+        profile["contrats"] = [row_to_dict(row) for row in cursor.fetchall()]
+
+        cursor.execute(
+            "SELECT * FROM Bon_Passage_Forfait WHERE client_id = ? ORDER BY date DESC, id DESC",
+            (client_id,)
+        )
+        profile["bons_passage"] = [row_to_dict(row) for row in cursor.fetchall()]
+
+        cursor.execute(
+            "SELECT * FROM Versement_Forfait WHERE client_id = ? ORDER BY date DESC, id DESC",
+            (client_id,)
+        )
+        profile["versements"] = [row_to_dict(row) for row in cursor.fetchall()]
+
+        if lines:
+            # The lines of all the bons of the client are read with one query per table
+            cursor.execute("""
+                SELECT p.* FROM Bon_Passage_Forfait_Produits p
+                JOIN Bon_Passage_Forfait b ON b.id = p.bon_passage_id
+                WHERE b.client_id = ? ORDER BY p.id
+            """, (client_id,))
+            produits = group_by_bon(cursor.fetchall())
+            cursor.execute("""
+                SELECT s.* FROM Bon_Passage_Forfait_Services s
+                JOIN Bon_Passage_Forfait b ON b.id = s.bon_passage_id
+                WHERE b.client_id = ? ORDER BY s.id
+            """, (client_id,))
+            services = group_by_bon(cursor.fetchall())
+            for bon in profile["bons_passage"]:
+                bon["produits"] = produits.get(bon["id"], [])
+                bon["services"] = services.get(bon["id"], [])
+
+        if catalogs:
+            cursor.execute("SELECT * FROM Agents")
+            profile["agents"] = [row_to_dict(row) for row in cursor.fetchall()]
+            cursor.execute("SELECT * FROM Produit")
+            profile["produits"] = [row_to_dict(row) for row in cursor.fetchall()]
+            cursor.execute("SELECT * FROM Service")
+            profile["services"] = [row_to_dict(row) for row in cursor.fetchall()]
+
+        # Nothing was written, end the read transaction
+        conn.rollback()
+        return profile
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error fetching profile of client {client_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
 # Contrat Forfait Endpoints
-@app.get("/api/contrats-forfait", response_model=List[ContratForfaitModel])
-async def get_contrats_forfait(conn = Depends(get_db)):
+@app.get(
+    "/api/contrats-forfait", response_model=Union[List[ContratForfaitModel], ContratForfaitPage],
+    dependencies=[conditional("Contrat_Forfait")]
+)
+def get_contrats_forfait(
+    client_id: Optional[int] = None,
+    etat: Optional[str] = None,
+    sort: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    count: bool = False,
+    fields: Optional[str] = None,
+    conn = Depends(get_db)
+):
     """
-    Récupère tous les contrats forfait
+    Récupère tous les contrats forfait, éventuellement d'un client ou dans un état donné,
+    triés par id par défaut. Retourne une page de contrats si `limit` ou `after` est donné
     """
+    columns = parse_fields(fields, ContratForfaitModel)
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Contrat_Forfait")
-        contrats = cursor.fetchall()
-        
-        # Convertir les résultats en liste de dictionnaires
-        return [dict(contrat) for contrat in contrats]
+
+        # Servi par les index sur Contrat_Forfait(client_id, etat), (etat) et (date_debut)
+        query = ListQuery("Contrat_Forfait", sortable=["id", "date_debut"], default_sort="id")
+        query.where_equal("client_id", client_id)
+        query.where_equal("etat", etat)
+        query.order_by(sort)
+        return respond(query.fetch(cursor, limit, after, count, columns), columns)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching contrats forfait: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération des contrats forfait: {str(e)}")
 
-@app.get("/api/contrats-forfait/{contrat_id}", response_model=ContratForfaitModel)
-async def get_contrat_forfait(contrat_id: int, conn = Depends(get_db)):
+@app.get(
+    "/api/contrats-forfait/{contrat_id}", response_model=ContratForfaitModel,
+    dependencies=[conditional("Contrat_Forfait")]
+)
+def get_contrat_forfait(contrat_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """
     Récupère un contrat forfait spécifique par son ID
     """
+    columns = parse_fields(fields, ContratForfaitModel)
     try:
         cursor = conn.cursor()
         
         # Récupérer le contrat
-        cursor.execute("SELECT * FROM Contrat_Forfait WHERE id = ?", (contrat_id,))
+        cursor.execute(f"SELECT {select_list(columns)} FROM Contrat_Forfait WHERE id = ?", (contrat_id,))
         contrat = cursor.fetchone()
         
         if contrat is None:
             raise HTTPException(status_code=404, detail="Contrat forfait non trouvé")
         
         # Retourner le contrat
-        return dict(contrat)
+        return respond(row_to_dict(contrat), columns)
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
         print(f"Error fetching contrat forfait {contrat_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération du contrat forfait: {str(e)}")
 
-@app.get("/api/clients/{client_id}/contrats-forfait", response_model=List[ContratForfaitModel])
-async def get_contrats_forfait_by_client(client_id: int, conn = Depends(get_db)):
+@app.get(
+    "/api/clients/{client_id}/contrats-forfait", response_model=List[ContratForfaitModel],
+    dependencies=[conditional("Contrat_Forfait")]
+)
+def get_contrats_forfait_by_client(client_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """
     Récupère tous les contrats forfait d'un client spécifique
     """
+    columns = parse_fields(fields, ContratForfaitModel)
     try:
         cursor = conn.cursor()
         
         # Vérifier si le client existe
-        cursor.execute("SELECT * FROM Client_Forfait WHERE id = ?", (client_id,))
+        cursor.execute("SELECT id FROM Client_Forfait WHERE id = ?", (client_id,))
         client = cursor.fetchone()
         
         if client is None:
             raise HTTPException(status_code=404, detail="Client_Forfait non trouvé")
         
-        cursor.execute("SELECT * FROM Contrat_Forfait WHERE client_id = ?", (client_id,))
+        cursor.execute(f"SELECT {select_list(columns)} FROM Contrat_Forfait WHERE client_id = ?", (client_id,))
         contrats = cursor.fetchall()
         
         # Convertir les résultats en liste de dictionnaires
-        return [dict(contrat) for contrat in contrats]
+        return respond([row_to_dict(contrat) for contrat in contrats], columns)
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
@@ -1207,7 +1637,7 @@ async def get_contrats_forfait_by_client(client_id: int, conn = Depends(get_db))
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération des contrats forfait: {str(e)}")
 
 @app.post("/api/contrats-forfait", response_model=ContratForfaitModel)
-async def create_contrat_forfait(contrat: ContratForfaitModel, conn = Depends(get_db)):
+def create_contrat_forfait(contrat: ContratForfaitModel, conn = Depends(get_db)):
     """
     Crée un nouveau contrat forfait
     """
@@ -1230,9 +1660,9 @@ async def create_contrat_forfait(contrat: ContratForfaitModel, conn = Depends(ge
         
         # Insérer le nouveau contrat forfait (toujours actif par défaut)
         cursor.execute("""
-            INSERT INTO Contrat_Forfait (date_debut, date_fin, montant, prix_exces_poids, poids_forfait, client_id, etat)
-            VALUES (?, ?, ?, ?, ?, ?, 'Actif')
-        """, (contrat.date_debut, contrat.date_fin, contrat.montant, contrat.prix_exces_poids, contrat.poids_forfait, contrat.client_id))
+            INSERT INTO Contrat_Forfait (date_debut, date_fin, montant, prix_exces_poids, poids_forfait, seuil_periode, client_id, etat)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 'Actif')
+        """, (to_db_date(contrat.date_debut), to_db_date(contrat.date_fin), contrat.montant, contrat.prix_exces_poids, contrat.poids_forfait, contrat.seuil_periode, contrat.client_id))
         
         # Récupérer l'ID du contrat nouvellement créé
         contrat_id = cursor.lastrowid
@@ -1242,7 +1672,7 @@ async def create_contrat_forfait(contrat: ContratForfaitModel, conn = Depends(ge
             UPDATE Client_Forfait
             SET etat_contrat = 'Actif', debut_contrat = ?, fin_contrat = ?
             WHERE id = ?
-        """, (contrat.date_debut, contrat.date_fin, contrat.client_id))
+        """, (to_db_date(contrat.date_debut), to_db_date(contrat.date_fin), contrat.client_id))
         
         conn.commit()
         
@@ -1255,7 +1685,8 @@ async def create_contrat_forfait(contrat: ContratForfaitModel, conn = Depends(ge
             "prix_exces_poids": contrat.prix_exces_poids,
             "poids_forfait": contrat.poids_forfait,
             "client_id": contrat.client_id,
-            "etat": "Actif"
+            "etat": "Actif",
+            "seuil_periode": contrat.seuil_periode
         }
     except Exception as e:
         if isinstance(e, HTTPException):
@@ -1264,7 +1695,7 @@ async def create_contrat_forfait(contrat: ContratForfaitModel, conn = Depends(ge
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création du contrat forfait: {str(e)}")
 
 @app.put("/api/contrats-forfait/{contrat_id}", response_model=ContratForfaitModel)
-async def update_contrat_forfait(contrat_id: int, contrat: ContratForfaitModel, conn = Depends(get_db)):
+def update_contrat_forfait(contrat_id: int, contrat: ContratForfaitModel, conn = Depends(get_db)):
     """
     Met à jour un contrat forfait existant
     """
@@ -1298,10 +1729,17 @@ async def update_contrat_forfait(contrat_id: int, contrat: ContratForfaitModel,
         # Mettre à jour le contrat
         cursor.execute("""
             UPDATE Contrat_Forfait
-            SET date_debut = ?, date_fin = ?, montant = ?, prix_exces_poids = ?, poids_forfait = ?, client_id = ?, etat = ?
+            SET date_debut = ?, date_fin = ?, montant = ?, prix_exces_poids = ?, poids_forfait = ?, seuil_periode = ?,
+                client_id = ?, etat = ?
             WHERE id = ?
-        """, (contrat.date_debut, contrat.date_fin, contrat.montant, contrat.prix_exces_poids, 
-              contrat.poids_forfait, contrat.client_id, contrat.etat, contrat_id))
+        """, (to_db_date(contrat.date_debut), to_db_date(contrat.date_fin), contrat.montant, contrat.prix_exces_poids, 
+              contrat.poids_forfait, contrat.seuil_periode, contrat.client_id, contrat.etat, contrat_id))
+        
+        # Un nouveau seuil ou prix change l'excès de poids des bons de passage du contrat
+        old_seuil = (existing_contrat["poids_forfait"], existing_contrat["prix_exces_poids"], existing_contrat["seuil_periode"])
+        if old_seuil != (contrat.poids_forfait, contrat.prix_exces_poids, contrat.seuil_periode):
+            cursor.execute("SELECT * FROM Contrat_Forfait WHERE id = ?", (contrat_id,))
+            exces_poids.recompute_contrat(cursor, cursor.fetchone())
         
         # Mettre à jour les informations du client en fonction de l'état du contrat
         if contrat.etat == "Actif":
@@ -1310,7 +1748,7 @@ async def update_contrat_forfait(contrat_id: int, contrat: ContratForfaitModel,
                 UPDATE Client_Forfait
                 SET etat_contrat = 'Actif', debut_contrat = ?, fin_contrat = ?
                 WHERE id = ?
-            """, (contrat.date_debut, contrat.date_fin, contrat.client_id))
+            """, (to_db_date(contrat.date_debut), to_db_date(contrat.date_fin), contrat.client_id))
         elif contrat.etat == "Pause":
             # Si le contrat est en pause, mettre à jour l'état du client
             cursor.execute("""
@@ -1341,7 +1779,7 @@ async def update_contrat_forfait(contrat_id: int, contrat: ContratForfaitModel,
         # Retourner le contrat mis à jour
         cursor.execute("SELECT * FROM Contrat_Forfait WHERE id = ?", (contrat_id,))
         updated_contrat = cursor.fetchone()
-        return dict(updated_contrat)
+        return row_to_dict(updated_contrat)
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
@@ -1349,7 +1787,7 @@ async def update_contrat_forfait(contrat_id: int, contrat: ContratForfaitModel,
         raise HTTPException(status_code=500, detail=f"Erreur lors de la mise à jour du contrat forfait: {str(e)}")
 
 @app.delete("/api/contrats-forfait/{contrat_id}")
-async def delete_contrat_forfait(contrat_id: int, conn = Depends(get_db)):
+def delete_contrat_forfait(contrat_id: int, conn = Depends(get_db)):
     """
     Supprime un contrat forfait
     """
@@ -1398,58 +1836,115 @@ async def delete_contrat_forfait(contrat_id: int, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression du contrat forfait: {str(e)}")
 
 # Bon Passage Forfait endpoints
-@app.get("/api/bon-passage-forfait", response_model=List[BonPassageForfaitModel])
-async def get_bons_passage_forfait(conn = Depends(get_db)):
-    """Récupérer tous les bons de passage forfait"""
+@app.get(
+    "/api/bon-passage-forfait", response_model=Union[List[BonPassageForfaitModel], BonPassageForfaitPage],
+    dependencies=[conditional("Bon_Passage_Forfait")]
+)
+def get_bons_passage_forfait(
+    client_id: Optional[int] = None,
+    contrat_id: Optional[int] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    sort: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    count: bool = False,
+    fields: Optional[str] = None,
+    conn = Depends(get_db)
+):
+    """Récupérer tous les bons de passage forfait, éventuellement d'un client, d'un contrat
+    et entre deux dates (dd/mm/yyyy, incluses). Triés avec `sort` (date ou id, "-" pour
+    l'ordre décroissant), les plus récents d'abord par défaut.
+    Retourne une page si `limit` ou `after` est donné, avec le nombre total de lignes si `count` est vrai."""
+    columns = parse_fields(fields, BonPassageForfaitModel)
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Bon_Passage_Forfait ORDER BY date DESC")
-        bons = cursor.fetchall()
-        return [dict(bon) for bon in bons]
+
+        # Servi par les index sur Bon_Passage_Forfait(date), (client_id, date) et (contrat_id, date)
+        query = ListQuery("Bon_Passage_Forfait", sortable=["date", "id"], default_sort="-date")
+        query.where_equal("client_id", client_id)
+        query.where_equal("contrat_id", contrat_id)
+        query.where_date_range("date", date_from, date_to)
+        query.order_by(sort)
+        return respond(query.fetch(cursor, limit, after, count, columns), columns)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching bons de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
-@app.get("/api/bon-passage-forfait/{bon_id}", response_model=BonPassageForfaitModel)
-async def get_bon_passage_forfait(bon_id: int, conn = Depends(get_db)):
+@app.get(
+    "/api/bon-passage-forfait/{bon_id}", response_model=BonPassageForfaitModel,
+    dependencies=[conditional("Bon_Passage_Forfait")]
+)
+def get_bon_passage_forfait(bon_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Récupérer un bon de passage forfait spécifique"""
+    columns = parse_fields(fields, BonPassageForfaitModel)
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
+        cursor.execute(f"SELECT {select_list(columns)} FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
         bon = cursor.fetchone()
         
         if bon is None:
             raise HTTPException(status_code=404, detail="Bon de passage forfait non trouvé")
             
-        return dict(bon)
+        return respond(row_to_dict(bon), columns)
     except Exception as e:
         print(f"Error fetching bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
-@app.get("/api/clients/{client_id}/bon-passage-forfait", response_model=List[BonPassageForfaitModel])
-async def get_bons_passage_forfait_by_client(client_id: int, conn = Depends(get_db)):
+@app.get(
+    "/api/clients/{client_id}/bon-passage-forfait", response_model=List[BonPassageForfaitModel],
+    dependencies=[conditional("Bon_Passage_Forfait")]
+)
+def get_bons_passage_forfait_by_client(client_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Récupérer tous les bons de passage forfait d'un client spécifique"""
+    columns = parse_fields(fields, BonPassageForfaitModel)
     try:
         cursor = conn.cursor()
         
         # Vérifier si le client existe
-        cursor.execute("SELECT * FROM Client_Forfait WHERE id = ?", (client_id,))
+        cursor.execute("SELECT id FROM Client_Forfait WHERE id = ?", (client_id,))
         client = cursor.fetchone()
         
         if client is None:
             raise HTTPException(status_code=404, detail="Client_Forfait non trouvé")
         
-        cursor.execute("SELECT * FROM Bon_Passage_Forfait WHERE client_id = ? ORDER BY date DESC", (client_id,))
+        cursor.execute(f"SELECT {select_list(columns)} FROM Bon_Passage_Forfait WHERE client_id = ? ORDER BY date DESC, id DESC", (client_id,))
         bons = cursor.fetchall()
         
-        return [dict(bon) for bon in bons]
+        return respond([row_to_dict(bon) for bon in bons], columns)
     except Exception as e:
         print(f"Error fetching bons de passage for client: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
+def legacy_consommables(bon, contrat):
+    """The consommables of a bon sent to POST or PUT /api/bon-passage-forfait.
+
+    These endpoints keep the meaning montant had before the server computed the
+    excess: the total billed, consommables plus the cost of the exces_poids sent,
+    at the prix_exces_poids of the contract. This cost is taken out, the server
+    adds the cost of the excess it computes (see exces_poids.py).
+    """
+    cout_exces = bon.exces_poids * contrat["prix_exces_poids"]
+    if bon.montant < cout_exces:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Le montant doit inclure le coût de l'excès de poids envoyé ({cout_exces})"
+        )
+    return bon.montant - cout_exces
+
 @app.post("/api/bon-passage-forfait", response_model=BonPassageForfaitModel)
-async def create_bon_passage_forfait(bon: BonPassageForfaitModel, conn = Depends(get_db)):
-    """Créer un nouveau bon de passage forfait"""
+def create_bon_passage_forfait(bon: BonPassageForfaitModel, conn = Depends(get_db)):
+    """Créer un nouveau bon de passage forfait.
+
+    Le montant envoyé est le total facturé: les consommables plus le coût de
+    l'exces_poids envoyé, au prix_exces_poids du contrat (400 s'il est inférieur à ce
+    coût). Ce coût est retiré et remplacé par celui de l'excès calculé par le serveur
+    selon le seuil du contrat: le montant enregistré peut différer du montant envoyé.
+    Le document (/api/bon-passage-forfait/{id}/document) calcule le montant à partir
+    des lignes.
+    """
     try:
         cursor = conn.cursor()
         
@@ -1474,27 +1969,34 @@ async def create_bon_passage_forfait(bon: BonPassageForfaitModel, conn = Depends
                 detail="Aucun contrat actif trouvé pour ce client. Un contrat actif est nécessaire pour créer un bon de passage."
             )
         
-        # Calculer l'excès de poids par rapport au poids collecté et au poids forfait du contrat
-        poids_forfait = contrat_actif["poids_forfait"]
-        exces_poids = max(0, bon.poids_collecte - poids_forfait) if poids_forfait > 0 else 0
-        
-        # Insérer le nouveau bon de passage avec montant, exces_poids, poids_collecte et contrat_id
+        # Insérer le nouveau bon de passage, l'excès de poids est calculé ensuite selon le seuil du contrat
         cursor.execute("""
             INSERT INTO Bon_Passage_Forfait (date, client_id, montant, exces_poids, poids_collecte, contrat_id)
-            VALUES (?, ?, ?, ?, ?, ?) RETURNING *
-        """, (bon.date, bon.client_id, bon.montant, exces_poids, bon.poids_collecte, contrat_actif["id"]))
+            VALUES (?, ?, ?, 0, ?, ?)
+        """, (to_db_date(bon.date), bon.client_id, legacy_consommables(bon, contrat_actif), bon.poids_collecte,
+              contrat_actif["id"]))
+        bon_id = cursor.lastrowid
+        exces_poids.passage_added(cursor, contrat_actif, bon_id)
         
+        cursor.execute("SELECT * FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
         new_bon = cursor.fetchone()
         conn.commit()
         
-        return dict(new_bon)
+        return row_to_dict(new_bon)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error creating bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/bon-passage-forfait/{bon_id}", response_model=BonPassageForfaitModel)
-async def update_bon_passage_forfait(bon_id: int, bon: BonPassageForfaitModel, conn = Depends(get_db)):
-    """Mettre à jour un bon de passage forfait"""
+def update_bon_passage_forfait(bon_id: int, bon: BonPassageForfaitModel, conn = Depends(get_db)):
+    """Mettre à jour un bon de passage forfait.
+
+    Le montant envoyé est le total facturé, comme pour la création: le coût de
+    l'exces_poids envoyé, au prix_exces_poids du contrat du bon, est remplacé par celui
+    de l'excès calculé par le serveur.
+    """
     try:
         cursor = conn.cursor()
         
@@ -1519,27 +2021,28 @@ async def update_bon_passage_forfait(bon_id: int, bon: BonPassageForfaitModel, c
         if contrat is None:
             raise HTTPException(status_code=400, detail="Contrat associé au bon de passage introuvable")
         
-        # Calculer l'excès de poids par rapport au poids collecté et au poids forfait du contrat
-        poids_forfait = contrat["poids_forfait"]
-        exces_poids = max(0, bon.poids_collecte - poids_forfait) if poids_forfait > 0 else 0
-        
-        # Mettre à jour le bon de passage avec montant, exces_poids et poids_collecte
+        # Mettre à jour le bon de passage, puis son excès de poids (et celui des bons de
+        # la même période) selon le seuil du contrat
         cursor.execute("""
             UPDATE Bon_Passage_Forfait
-            SET date = ?, client_id = ?, montant = ?, exces_poids = ?, poids_collecte = ?
-            WHERE id = ? RETURNING *
-        """, (bon.date, bon.client_id, bon.montant, exces_poids, bon.poids_collecte, bon_id))
+            SET date = ?, client_id = ?, montant = ? + exces_poids * prix_exces_poids, poids_collecte = ?
+            WHERE id = ?
+        """, (to_db_date(bon.date), bon.client_id, legacy_consommables(bon, contrat), bon.poids_collecte, bon_id))
+        exces_poids.passage_changed(cursor, contrat, bon_id, existing_bon["date"], existing_bon["poids_collecte"])
         
+        cursor.execute("SELECT * FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
         updated_bon = cursor.fetchone()
         conn.commit()
         
-        return dict(updated_bon)
+        return row_to_dict(updated_bon)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error updating bon de passage: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+        raise rule_violation(e) or HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/bon-passage-forfait/{bon_id}")
-async def delete_bon_passage_forfait(bon_id: int, conn = Depends(get_db)):
+def delete_bon_passage_forfait(bon_id: int, conn = Depends(get_db)):
     """Supprimer un bon de passage forfait"""
     try:
         cursor = conn.cursor()
@@ -1553,37 +2056,232 @@ async def delete_bon_passage_forfait(bon_id: int, conn = Depends(get_db)):
         
         # Supprimer le bon de passage (les produits et services seront supprimés en cascade)
         cursor.execute("DELETE FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
+        
+        # Avec un seuil mensuel ou annuel, les bons suivants de la période changent
+        cursor.execute("SELECT * FROM Contrat_Forfait WHERE id = ?", (bon["contrat_id"],))
+        exces_poids.passage_removed(cursor, cursor.fetchone(), bon["date"])
         conn.commit()
         
         return {"message": "Bon de passage forfait supprimé avec succès"}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error deleting bon de passage: {str(e)}")
+        raise rule_violation(e) or HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+# Bon de passage document endpoints: a bon de passage is read with its produits and
+# services in one request and saved with them in one transaction
+def read_bon_passage_document(cursor, bon_id):
+    """Read a bon de passage with its produits and services, None if it does not exist."""
+    cursor.execute("SELECT * FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
+    bon = cursor.fetchone()
+    if bon is None:
+        return None
+
+    document = row_to_dict(bon)
+    cursor.execute("SELECT * FROM Bon_Passage_Forfait_Produits WHERE bon_passage_id = ? ORDER BY id", (bon_id,))
+    document["produits"] = [row_to_dict(row) for row in cursor.fetchall()]
+    cursor.execute("SELECT * FROM Bon_Passage_Forfait_Services WHERE bon_passage_id = ? ORDER BY id", (bon_id,))
+    document["services"] = [row_to_dict(row) for row in cursor.fetchall()]
+    return document
+
+def save_produits_bon_passage(cursor, bon_id, produits):
+    """Save the produits of a document: only the added, changed and removed lines are written.
+
+    The lines keep their id. The triggers record the stock movements of the written
+    lines (see stock.py), an unchanged line writes none.
+    """
+    cursor.execute("SELECT id, produit, qte, prix FROM Bon_Passage_Forfait_Produits WHERE bon_passage_id = ?", (bon_id,))
+    stored = {row["id"]: row for row in cursor.fetchall()}
+
+    inserts = []
+    updates = []
+    kept = set()
+    for line in produits:
+        if line.id is None:
+            inserts.append((line.produit, line.qte, line.prix, bon_id))
+            continue
+        if line.id not in stored or line.id in kept:
+            raise HTTPException(status_code=400, detail=f"Produit {line.id} invalide pour ce bon de passage")
+        kept.add(line.id)
+        old = stored[line.id]
+        if (old["produit"], old["qte"], old["prix"]) != (line.produit, line.qte, line.prix):
+            updates.append((line.produit, line.qte, line.prix, line.id))
+
+    deletes = [(line_id,) for line_id in stored if line_id not in kept]
+
+    # The removed and changed lines go first: the stock they give back can cover a new line
+    cursor.executemany("DELETE FROM Bon_Passage_Forfait_Produits WHERE id = ?", deletes)
+    cursor.executemany("UPDATE Bon_Passage_Forfait_Produits SET produit = ?, qte = ?, prix = ? WHERE id = ?", updates)
+    cursor.executemany(
+        "INSERT INTO Bon_Passage_Forfait_Produits (produit, qte, prix, bon_passage_id) VALUES (?, ?, ?, ?)",
+        inserts
+    )
+
+def save_services_bon_passage(cursor, bon_id, services):
+    """Save the services of a document: only the added, changed and removed lines are written."""
+    cursor.execute("SELECT id, service, qte FROM Bon_Passage_Forfait_Services WHERE bon_passage_id = ?", (bon_id,))
+    stored = {row["id"]: row for row in cursor.fetchall()}
+
+    inserts = []
+    updates = []
+    kept = set()
+    for line in services:
+        if line.id is None:
+            inserts.append((line.service, line.qte, bon_id))
+            continue
+        if line.id not in stored or line.id in kept:
+            raise HTTPException(status_code=400, detail=f"Service {line.id} invalide pour ce bon de passage")
+        kept.add(line.id)
+        old = stored[line.id]
+        if (old["service"], old["qte"]) != (line.service, line.qte):
+            updates.append((line.service, line.qte, line.id))
+
+    deletes = [(line_id,) for line_id in stored if line_id not in kept]
+    cursor.executemany("DELETE FROM Bon_Passage_Forfait_Services WHERE id = ?", deletes)
+    cursor.executemany("UPDATE Bon_Passage_Forfait_Services SET service = ?, qte = ? WHERE id = ?", updates)
+    cursor.executemany(
+        "INSERT INTO Bon_Passage_Forfait_Services (service, qte, bon_passage_id) VALUES (?, ?, ?)",
+        inserts
+    )
+
+def write_bon_passage_document(cursor, bon_id, document):
+    """Write the header and lines of a document to the bon de passage `bon_id`.
+
+    The lines of the document with an id update the lines of the bon, the lines
+    without one are added and the lines of the bon missing from the document are
+    removed. The montant is the total of the produits plus the cost of the excess
+    weight, which the caller updates with exces_poids.py. Neither is taken from the client.
+    """
+    montant_produits = round(sum(line.qte * line.prix for line in document.produits))
+    cursor.execute("""
+        UPDATE Bon_Passage_Forfait
+        SET date = ?, montant = ? + exces_poids * prix_exces_poids, poids_collecte = ?
+        WHERE id = ?
+    """, (to_db_date(document.date), montant_produits, document.poids_collecte, bon_id))
+    save_produits_bon_passage(cursor, bon_id, document.produits)
+    save_services_bon_passage(cursor, bon_id, document.services)
+
+@app.get(
+    "/api/bon-passage-forfait/{bon_id}/document", response_model=BonPassageForfaitDocument,
+    dependencies=[conditional("Bon_Passage_Forfait", "Bon_Passage_Forfait_Produits", "Bon_Passage_Forfait_Services")]
+)
+def get_bon_passage_document(bon_id: int, conn = Depends(get_db)):
+    """Récupérer un bon de passage avec ses produits et services"""
+    try:
+        document = read_bon_passage_document(conn.cursor(), bon_id)
+        if document is None:
+            raise HTTPException(status_code=404, detail="Bon de passage forfait non trouvé")
+        return document
+    except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
+@app.post("/api/bon-passage-forfait/document", response_model=BonPassageForfaitDocument)
+def create_bon_passage_document(document: BonPassageForfaitDocument, conn = Depends(get_db)):
+    """Créer un bon de passage avec ses produits et services en une transaction.
+
+    Le bon est rattaché au contrat actif du client.
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT id FROM Client_Forfait WHERE id = ?", (document.client_id,))
+        if cursor.fetchone() is None:
+            raise HTTPException(status_code=404, detail=f"Client_Forfait avec ID {document.client_id} non trouvé")
+
+        cursor.execute(
+            "SELECT * FROM Contrat_Forfait WHERE client_id = ? AND etat = 'Actif'",
+            (document.client_id,)
+        )
+        contrat = cursor.fetchone()
+        if contrat is None:
+            raise HTTPException(
+                status_code=400,
+                detail="Aucun contrat actif trouvé pour ce client. Un contrat actif est nécessaire pour créer un bon de passage."
+            )
+
+        # The header is inserted first to get its id, write_bon_passage_document sets the totals
+        cursor.execute("""
+            INSERT INTO Bon_Passage_Forfait (date, client_id, montant, exces_poids, poids_collecte, contrat_id)
+            VALUES (?, ?, 0, 0, ?, ?)
+        """, (to_db_date(document.date), document.client_id, document.poids_collecte, contrat["id"]))
+        bon_id = cursor.lastrowid
+        write_bon_passage_document(cursor, bon_id, document)
+        exces_poids.passage_added(cursor, contrat, bon_id)
+
+        saved = read_bon_passage_document(cursor, bon_id)
+        conn.commit()
+        return saved
+    except HTTPException:
+        conn.rollback()
+        raise
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise rule_violation(e) or HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.put("/api/bon-passage-forfait/{bon_id}/document", response_model=BonPassageForfaitDocument)
+def save_bon_passage_document(bon_id: int, document: BonPassageForfaitDocument, conn = Depends(get_db)):
+    """Enregistrer un bon de passage avec ses produits et services en une transaction.
+
+    Le bon garde son client et son contrat. Les lignes avec un id sont mises à jour, celles
+    sans id sont ajoutées et les lignes absentes du document sont supprimées.
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT client_id, contrat_id, date, poids_collecte FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
+        bon = cursor.fetchone()
+        if bon is None:
+            raise HTTPException(status_code=404, detail="Bon de passage forfait non trouvé")
+        if bon["client_id"] != document.client_id:
+            raise HTTPException(status_code=400, detail="Le client d'un bon de passage ne peut pas être changé")
+
+        cursor.execute("SELECT * FROM Contrat_Forfait WHERE id = ?", (bon["contrat_id"],))
+        contrat = cursor.fetchone()
+        if contrat is None:
+            raise HTTPException(status_code=400, detail="Contrat associé au bon de passage introuvable")
+
+        write_bon_passage_document(cursor, bon_id, document)
+        exces_poids.passage_changed(cursor, contrat, bon_id, bon["date"], bon["poids_collecte"])
+
+        saved = read_bon_passage_document(cursor, bon_id)
+        conn.commit()
+        return saved
+    except HTTPException:
+        conn.rollback()
+        raise
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise rule_violation(e) or HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
 # Endpoints pour les produits dans un bon de passage
-@app.get("/api/bon-passage-forfait/{bon_id}/produits", response_model=List[BonPassageForfaitProduitModel])
-async def get_produits_bon_passage(bon_id: int, conn = Depends(get_db)):
+@app.get(
+    "/api/bon-passage-forfait/{bon_id}/produits", response_model=List[BonPassageForfaitProduitModel],
+    dependencies=[conditional("Bon_Passage_Forfait_Produits")]
+)
+def get_produits_bon_passage(bon_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Récupérer tous les produits d'un bon de passage forfait"""
+    columns = parse_fields(fields, BonPassageForfaitProduitModel)
     try:
         cursor = conn.cursor()
         
         # Vérifier si le bon de passage existe
-        cursor.execute("SELECT * FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
+        cursor.execute("SELECT id FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
         bon = cursor.fetchone()
         
         if bon is None:
             raise HTTPException(status_code=404, detail="Bon de passage forfait non trouvé")
         
-        cursor.execute("SELECT * FROM Bon_Passage_Forfait_Produits WHERE bon_passage_id = ?", (bon_id,))
+        cursor.execute(f"SELECT {select_list(columns)} FROM Bon_Passage_Forfait_Produits WHERE bon_passage_id = ?", (bon_id,))
         produits = cursor.fetchall()
         
-        return [dict(produit) for produit in produits]
+        return respond([row_to_dict(produit) for produit in produits], columns)
     except Exception as e:
         print(f"Error fetching produits de bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.post("/api/bon-passage-forfait/{bon_id}/produits", response_model=BonPassageForfaitProduitModel)
-async def create_produit_bon_passage(bon_id: int, produit: BonPassageForfaitProduitModel, conn = Depends(get_db)):
+def create_produit_bon_passage(bon_id: int, produit: BonPassageForfaitProduitModel, conn = Depends(get_db)):
     """Ajouter un produit à un bon de passage forfait"""
     try:
         cursor = conn.cursor()
@@ -1610,19 +2308,22 @@ async def create_produit_bon_passage(bon_id: int, produit: BonPassageForfaitProd
             conn.commit()
             
             print(f"Produit created successfully: {new_produit}")
-            return dict(new_produit)
+            return row_to_dict(new_produit)
         except Exception as sql_error:
             print(f"SQL error creating produit: {str(sql_error)}")
-            raise HTTPException(
-                status_code=400, 
+            # A refused stock movement (see stock.py) gives the message of its trigger
+            raise rule_violation(sql_error) or HTTPException(
+                status_code=400,
                 detail=f"Erreur lors de l'insertion du produit: {str(sql_error)}"
             )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error creating produit de bon de passage: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+        raise rule_violation(e) or HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/bon-passage-forfait/{bon_id}/produits/{produit_id}", response_model=BonPassageForfaitProduitModel)
-async def update_produit_bon_passage(bon_id: int, produit_id: int, produit: BonPassageForfaitProduitModel, conn = Depends(get_db)):
+def update_produit_bon_passage(bon_id: int, produit_id: int, produit: BonPassageForfaitProduitModel, conn = Depends(get_db)):
     """Mettre à jour un produit dans un bon de passage forfait"""
     try:
         cursor = conn.cursor()
@@ -1647,13 +2348,15 @@ async def update_produit_bon_passage(bon_id: int, produit_id: int, produit: BonP
         updated_produit = cursor.fetchone()
         conn.commit()
         
-        return dict(updated_produit)
+        return row_to_dict(updated_produit)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error updating produit de bon de passage: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+        raise rule_violation(e) or HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/bon-passage-forfait/{bon_id}/produits/{produit_id}")
-async def delete_produit_bon_passage(bon_id: int, produit_id: int, conn = Depends(get_db)):
+def delete_produit_bon_passage(bon_id: int, produit_id: int, conn = Depends(get_db)):
     """Supprimer un produit d'un bon de passage forfait"""
     try:
         cursor = conn.cursor()
@@ -1676,34 +2379,40 @@ async def delete_produit_bon_passage(bon_id: int, produit_id: int, conn = Depend
         conn.commit()
         
         return {"message": "Produit supprimé avec succès du bon de passage"}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error deleting produit de bon de passage: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+        raise rule_violation(e) or HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 # Endpoints pour les services dans un bon de passage
-@app.get("/api/bon-passage-forfait/{bon_id}/services", response_model=List[BonPassageForfaitServiceModel])
-async def get_services_bon_passage(bon_id: int, conn = Depends(get_db)):
+@app.get(
+    "/api/bon-passage-forfait/{bon_id}/services", response_model=List[BonPassageForfaitServiceModel],
+    dependencies=[conditional("Bon_Passage_Forfait_Services")]
+)
+def get_services_bon_passage(bon_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Récupérer tous les services d'un bon de passage forfait"""
+    columns = parse_fields(fields, BonPassageForfaitServiceModel)
     try:
         cursor = conn.cursor()
         
         # Vérifier si le bon de passage existe
-        cursor.execute("SELECT * FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
+        cursor.execute("SELECT id FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
         bon = cursor.fetchone()
         
         if bon is None:
             raise HTTPException(status_code=404, detail="Bon de passage forfait non trouvé")
         
-        cursor.execute("SELECT * FROM Bon_Passage_Forfait_Services WHERE bon_passage_id = ?", (bon_id,))
+        cursor.execute(f"SELECT {select_list(columns)} FROM Bon_Passage_Forfait_Services WHERE bon_passage_id = ?", (bon_id,))
         services = cursor.fetchall()
         
-        return [dict(service) for service in services]
+        return respond([row_to_dict(service) for service in services], columns)
     except Exception as e:
         print(f"Error fetching services de bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.post("/api/bon-passage-forfait/{bon_id}/services", response_model=BonPassageForfaitServiceModel)
-async def create_service_bon_passage(bon_id: int, service: BonPassageForfaitServiceModel, conn = Depends(get_db)):
+def create_service_bon_passage(bon_id: int, service: BonPassageForfaitServiceModel, conn = Depends(get_db)):
     """Ajouter un service à un bon de passage forfait"""
     try:
         cursor = conn.cursor()
@@ -1730,7 +2439,7 @@ async def create_service_bon_passage(bon_id: int, service: BonPassageForfaitServ
             conn.commit()
             
             print(f"Service created successfully: {new_service}")
-            return dict(new_service)
+            return row_to_dict(new_service)
         except Exception as sql_error:
             print(f"SQL error creating service: {str(sql_error)}")
             raise HTTPException(
@@ -1742,7 +2451,7 @@ async def create_service_bon_passage(bon_id: int, service: BonPassageForfaitServ
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/bon-passage-forfait/{bon_id}/services/{service_id}", response_model=BonPassageForfaitServiceModel)
-async def update_service_bon_passage(bon_id: int, service_id: int, service: BonPassageForfaitServiceModel, conn = Depends(get_db)):
+def update_service_bon_passage(bon_id: int, service_id: int, service: BonPassageForfaitServiceModel, conn = Depends(get_db)):
     """Mettre à jour un service dans un bon de passage forfait"""
     try:
         cursor = conn.cursor()
@@ -1767,13 +2476,13 @@ async def update_service_bon_passage(bon_id: int, service_id: int, service: BonP
         updated_service = cursor.fetchone()
         conn.commit()
         
-        return dict(updated_service)
+        return row_to_dict(updated_service)
     except Exception as e:
         print(f"Error updating service de bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/bon-passage-forfait/{bon_id}/services/{service_id}")
-async def delete_service_bon_passage(bon_id: int, service_id: int, conn = Depends(get_db)):
+def delete_service_bon_passage(bon_id: int, service_id: int, conn = Depends(get_db)):
     """Supprimer un service d'un bon de passage forfait"""
     try:
         cursor = conn.cursor()
@@ -1799,79 +2508,115 @@ async def delete_service_bon_passage(bon_id: int, service_id: int, conn = Depend
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 # Endpoints pour les versements forfait
-@app.get("/api/versements-forfait", response_model=List[VersementForfaitModel])
-async def get_versements_forfait(conn = Depends(get_db)):
-    """Récupérer tous les versements forfait"""
+@app.get(
+    "/api/versements-forfait", response_model=Union[List[VersementForfaitModel], VersementForfaitPage],
+    dependencies=[conditional("Versement_Forfait")]
+)
+def get_versements_forfait(
+    client_id: Optional[int] = None,
+    contrat_id: Optional[int] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    sort: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    count: bool = False,
+    fields: Optional[str] = None,
+    conn = Depends(get_db)
+):
+    """Récupérer tous les versements forfait, éventuellement d'un client, d'un contrat
+    et entre deux dates (dd/mm/yyyy, incluses). Triés avec `sort` (date ou id, "-" pour
+    l'ordre décroissant), les plus récents d'abord par défaut.
+    Retourne une page si `limit` ou `after` est donné, avec le nombre total de lignes si `count` est vrai."""
+    columns = parse_fields(fields, VersementForfaitModel)
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Versement_Forfait ORDER BY date DESC")
-        versements = cursor.fetchall()
-        
-        return [dict(versement) for versement in versements]
+
+        # Servi par les index sur Versement_Forfait(date), (client_id, date) et (contrat_id, date)
+        query = ListQuery("Versement_Forfait", sortable=["date", "id"], default_sort="-date")
+        query.where_equal("client_id", client_id)
+        query.where_equal("contrat_id", contrat_id)
+        query.where_date_range("date", date_from, date_to)
+        query.order_by(sort)
+        return respond(query.fetch(cursor, limit, after, count, columns), columns)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching versements forfait: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
-@app.get("/api/versements-forfait/{versement_id}", response_model=VersementForfaitModel)
-async def get_versement_forfait(versement_id: int, conn = Depends(get_db)):
+@app.get(
+    "/api/versements-forfait/{versement_id}", response_model=VersementForfaitModel,
+    dependencies=[conditional("Versement_Forfait")]
+)
+def get_versement_forfait(versement_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Récupérer un versement forfait spécifique"""
+    columns = parse_fields(fields, VersementForfaitModel)
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Versement_Forfait WHERE id = ?", (versement_id,))
+        cursor.execute(f"SELECT {select_list(columns)} FROM Versement_Forfait WHERE id = ?", (versement_id,))
         versement = cursor.fetchone()
         
         if versement is None:
             raise HTTPException(status_code=404, detail="Versement forfait non trouvé")
         
-        return dict(versement)
+        return respond(row_to_dict(versement), columns)
     except Exception as e:
         print(f"Error fetching versement forfait: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
-@app.get("/api/clients/{client_id}/versements-forfait", response_model=List[VersementForfaitModel])
-async def get_versements_forfait_by_client(client_id: int, conn = Depends(get_db)):
+@app.get(
+    "/api/clients/{client_id}/versements-forfait", response_model=List[VersementForfaitModel],
+    dependencies=[conditional("Versement_Forfait")]
+)
+def get_versements_forfait_by_client(client_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Récupérer tous les versements forfait d'un client spécifique"""
+    columns = parse_fields(fields, VersementForfaitModel)
     try:
         cursor = conn.cursor()
         
         # Vérifier si le client existe
-        cursor.execute("SELECT * FROM Client_Forfait WHERE id = ?", (client_id,))
+        cursor.execute("SELECT id FROM Client_Forfait WHERE id = ?", (client_id,))
         client = cursor.fetchone()
         
         if client is None:
             raise HTTPException(status_code=404, detail="Client_Forfait non trouvé")
         
-        cursor.execute("SELECT * FROM Versement_Forfait WHERE client_id = ? ORDER BY date DESC", (client_id,))
+        cursor.execute(f"SELECT {select_list(columns)} FROM Versement_Forfait WHERE client_id = ? ORDER BY date DESC, id DESC", (client_id,))
         versements = cursor.fetchall()
         
-        return [dict(versement) for versement in versements]
+        return respond([row_to_dict(versement) for versement in versements], columns)
     except Exception as e:
         print(f"Error fetching versements forfait for client: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
-@app.get("/api/contrats-forfait/{contrat_id}/versements", response_model=List[VersementForfaitModel])
-async def get_versements_forfait_by_contrat(contrat_id: int, conn = Depends(get_db)):
+@app.get(
+    "/api/contrats-forfait/{contrat_id}/versements", response_model=List[VersementForfaitModel],
+    dependencies=[conditional("Versement_Forfait")]
+)
+def get_versements_forfait_by_contrat(contrat_id: int, fields: Optional[str] = None, conn = Depends(get_db)):
     """Récupérer tous les versements forfait d'un contrat spécifique"""
+    columns = parse_fields(fields, VersementForfaitModel)
     try:
         cursor = conn.cursor()
         
         # Vérifier si le contrat existe
-        cursor.execute("SELECT * FROM Contrat_Forfait WHERE id = ?", (contrat_id,))
+        cursor.execute("SELECT id FROM Contrat_Forfait WHERE id = ?", (contrat_id,))
         contrat = cursor.fetchone()
         
         if contrat is None:
             raise HTTPException(status_code=404, detail="Contrat_Forfait non trouvé")
         
-        cursor.execute("SELECT * FROM Versement_Forfait WHERE contrat_id = ? ORDER BY date DESC", (contrat_id,))
+        cursor.execute(f"SELECT {select_list(columns)} FROM Versement_Forfait WHERE contrat_id = ? ORDER BY date DESC, id DESC", (contrat_id,))
         versements = cursor.fetchall()
         
-        return [dict(versement) for versement in versements]
+        return respond([row_to_dict(versement) for versement in versements], columns)
     except Exception as e:
         print(f"Error fetching versements forfait for contrat: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.post("/api/versements-forfait", response_model=VersementForfaitModel)
-async def create_versement_forfait(versement: VersementForfaitModel, conn = Depends(get_db)):
+def create_versement_forfait(versement: VersementForfaitModel, conn = Depends(get_db)):
     """Créer un nouveau versement forfait"""
     try:
         cursor = conn.cursor()
@@ -1898,18 +2643,18 @@ async def create_versement_forfait(versement: VersementForfaitModel, conn = Depe
         cursor.execute("""
             INSERT INTO Versement_Forfait (date, montant, client_id, contrat_id)
             VALUES (?, ?, ?, ?) RETURNING *
-        """, (versement.date, versement.montant, versement.client_id, versement.contrat_id))
+        """, (to_db_date(versement.date), versement.montant, versement.client_id, versement.contrat_id))
         
         new_versement = cursor.fetchone()
         conn.commit()
         
-        return dict(new_versement)
+        return row_to_dict(new_versement)
     except Exception as e:
         print(f"Error creating versement forfait: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/versements-forfait/{versement_id}", response_model=VersementForfaitModel)
-async def update_versement_forfait(versement_id: int, versement: VersementForfaitModel, conn = Depends(get_db)):
+def update_versement_forfait(versement_id: int, versement: VersementForfaitModel, conn = Depends(get_db)):
     """Mettre à jour un versement forfait"""
     try:
         cursor = conn.cursor()
@@ -1944,18 +2689,18 @@ async def update_versement_forfait(versement_id: int, versement: VersementForfai
             UPDATE Versement_Forfait
             SET date = ?, montant = ?, client_id = ?, contrat_id = ?
             WHERE id = ? RETURNING *
-        """, (versement.date, versement.montant, versement.client_id, versement.contrat_id, versement_id))
+        """, (to_db_date(versement.date), versement.montant, versement.client_id, versement.contrat_id, versement_id))
         
         updated_versement = cursor.fetchone()
         conn.commit()
         
-        return dict(updated_versement)
+        return row_to_dict(updated_versement)
     except Exception as e:
         print(f"Error updating versement forfait: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/versements-forfait/{versement_id}")
-async def delete_versement_forfait(versement_id: int, conn = Depends(get_db)):
+def delete_versement_forfait(versement_id: int, conn = Depends(get_db)):
     """Supprimer un versement forfait"""
     try:
         cursor = conn.cursor()
@@ -1975,3 +2720,104 @@ async def delete_versement_forfait(versement_id: int, conn = Depends(get_db)):
     except Exception as e:
         print(f"Error deleting versement forfait: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+# Bulk import endpoint
+@app.post("/api/import/{kind}", response_model=ImportRapport)
+async def import_file(
+    kind: str,
+    dry_run: bool = False,
+    file = Depends(bulk_import.request_file),
+    conn = Depends(get_db)
+):
+    """Importer en masse un fichier CSV ou XLSX, envoyé comme corps de la requête.
+
+    `kind` est clients, contrats, bons-passage ou achats (colonnes attendues: voir
+    bulk_import.py). Les lignes valides sont importées, les autres sont listées dans
+    le rapport avec leur numéro de ligne. Avec dry_run=true, rien n'est écrit.
+    """
+    if kind not in bulk_import.IMPORTERS:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Import inconnu: {kind} ({', '.join(bulk_import.IMPORTERS)})"
+        )
+    try:
+        # The import reads the file and writes for a while: it runs in a thread like
+        # the other endpoints, so the event loop keeps serving the requests
+        return await to_thread.run_sync(bulk_import.run_import, conn, kind, file, dry_run)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error importing {kind}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+# Export endpoints. The rows are streamed (see export.py): the connection given by
+# get_db stays in use until the whole file is sent, FastAPI closing the dependencies
+# after the response.
+def export_file(conn, kind, file_format, date_from, date_to):
+    try:
+        return export.export_response(conn, kind, file_format, date_from, date_to)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error exporting {kind}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.get(
+    "/api/export/bons-passage",
+    dependencies=[conditional("Bon_Passage_Forfait", "Bon_Passage_Forfait_Produits",
+                              "Bon_Passage_Forfait_Services", "Client_Forfait", "Contrat_Forfait")]
+)
+def export_bons_passage(
+    file_format: str = Query("csv", alias="format"),
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    conn = Depends(get_db)
+):
+    """Exporter les bons de passage forfait avec leurs produits et services, en csv ou xlsx,
+    entre deux dates (dd/mm/yyyy, incluses)."""
+    return export_file(conn, "bons-passage", file_format, date_from, date_to)
+
+@app.get(
+    "/api/export/versements-forfait",
+    dependencies=[conditional("Versement_Forfait", "Client_Forfait", "Contrat_Forfait")]
+)
+def export_versements_forfait(
+    file_format: str = Query("csv", alias="format"),
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    conn = Depends(get_db)
+):
+    """Exporter les versements forfait, en csv ou xlsx, entre deux dates (dd/mm/yyyy, incluses)."""
+    return export_file(conn, "versements-forfait", file_format, date_from, date_to)
+
+@app.get("/api/export/achats", dependencies=[conditional("Bon_Achats", "Produits_Bon_Achat")])
+def export_achats(
+    file_format: str = Query("csv", alias="format"),
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    conn = Depends(get_db)
+):
+    """Exporter les bons d'achat avec leurs produits, en csv ou xlsx, entre deux dates (dd/mm/yyyy, incluses)."""
+    return export_file(conn, "achats", file_format, date_from, date_to)
+
+@app.get(
+    "/api/search",
+    response_model=List[ResultatRecherche],
+    dependencies=[conditional("Client_Forfait", "Fournisseur", "Produit", "Service")]
+)
+def search_all(
+    q: str,
+    types: Optional[str] = None,
+    limit: int = search.DEFAULT_LIMIT,
+    conn = Depends(get_db)
+):
+    """Rechercher les clients, fournisseurs, produits et services dont les mots commencent
+    par ceux de q (sans tenir compte des accents ni de la casse), les meilleurs d'abord.
+    types limite la recherche, ex: types=client,fournisseur"""
+    try:
+        return respond(search.search(conn, q, types, limit), None)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error searching {q!r}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, validator, Field
 from datetime import date, datetime
-from typing import Optional
+from typing import Optional, List
 from fastapi import HTTPException
 import re
 
@@ -172,21 +172,22 @@ class ProduitBonAchat(BaseModel):
 
 # Inventaire model
 class Inventaire(BaseModel):
-    """Inventaire model"""
+    """Inventaire model: the stock of a produit, computed from its stock movements"""
     id: Optional[int] = None
     produit: str
-    qte: int
-    prix_dernier: float
+    qte: float
+    # None until the produit is bought with a price
+    prix_dernier: Optional[float] = None
 
     @validator('qte')
     def validate_qte(cls, v):
-        if v <= 0:
-            raise HTTPException(status_code=400, detail="La quantité doit être supérieure à 0")
+        if v < 0:
+            raise HTTPException(status_code=400, detail="La quantité ne peut pas être négative")
         return v
 
     @validator('prix_dernier')
     def validate_prix(cls, v):
-        if v <= 0:
+        if v is not None and v <= 0:
             raise HTTPException(status_code=400, detail="Le prix doit être supérieur à 0")
         return v
 
@@ -217,6 +218,21 @@ class VersementBonAchat(BaseModel):
             )
         return v
 
+# Bon d'achat document: the header with all its produits and versements,
+# read and saved in one request. The lines get their bon_achat_id from the document.
+class ProduitBonAchatLigne(ProduitBonAchat):
+    """Produit d'un document bon d'achat"""
+    bon_achat_id: Optional[int] = None
+
+class VersementBonAchatLigne(VersementBonAchat):
+    """Versement d'un document bon d'achat"""
+    bon_achat_id: Optional[int] = None
+
+class BonAchatDocument(BonAchats):
+    """Bon d'achat complet (montant_total et montant_verse sont calculés par le serveur)"""
+    produits: List[ProduitBonAchatLigne] = []
+    versements: List[VersementBonAchatLigne] = []
+
 # Client model for the Client_Forfait table
 class ClientModel(BaseModel):
     """Client_Forfait model"""
@@ -274,6 +290,8 @@ class ContratForfaitModel(BaseModel):
     poids_forfait: int
     client_id: int
     etat: str = "Actif"
+    # Period of the poids_forfait threshold (see exces_poids.py)
+    seuil_periode: str = "Passage"
     
     @validator('date_debut', 'date_fin')
     def validate_date_format(cls, v):
@@ -339,6 +357,16 @@ class ContratForfaitModel(BaseModel):
             )
         return v
 
+    @validator('seuil_periode')
+    def validate_seuil_periode(cls, v):
+        valid_periodes = ['Passage', 'Mois', 'Année']
+        if v not in valid_periodes:
+            raise HTTPException(
+                status_code=400,
+                detail=f"La période du seuil doit être l'une des suivantes: {', '.join(valid_periodes)}"
+            )
+        return v
+
     class Config:
         schema_extra = {
             "example": {
@@ -348,7 +376,8 @@ class ContratForfaitModel(BaseModel):
                 "prix_exces_poids": 1000,
                 "poids_forfait": 100,
                 "client_id": 1,
-                "etat": "Actif"
+                "etat": "Actif",
+                "seuil_periode": "Passage"
             }
         }
 
@@ -360,6 +389,8 @@ class BonPassageForfaitModel(BaseModel):
     client_id: int
     montant: int = 0
     exces_poids: int = 0
+    # Prix par kg de l'excès de poids, celui du contrat (calculé par le serveur)
+    prix_exces_poids: int = 0
     poids_collecte: int
     contrat_id: Optional[int] = None
     
@@ -473,6 +504,19 @@ class BonPassageForfaitServiceModel(BaseModel):
             }
         }
 
+class BonPassageForfaitProduitLigne(BonPassageForfaitProduitModel):
+    """Produit d'un document bon de passage"""
+    bon_passage_id: Optional[int] = None
+
+class BonPassageForfaitServiceLigne(BonPassageForfaitServiceModel):
+    """Service d'un document bon de passage"""
+    bon_passage_id: Optional[int] = None
+
+class BonPassageForfaitDocument(BonPassageForfaitModel):
+    """Bon de passage complet (exces_poids et montant sont calculés par le serveur)"""
+    produits: List[BonPassageForfaitProduitLigne] = []
+    services: List[BonPassageForfaitServiceLigne] = []
+
 class VersementForfaitModel(BaseModel):
     """Modèle pour les versements de contrats forfait"""
     id: Optional[int] = None
@@ -509,4 +553,183 @@ class VersementForfaitModel(BaseModel):
                 "client_id": 1,
                 "contrat_id": 1
             }
-        }
\ No newline at end of file
+        }
+
+# Pages returned by the list endpoints when called with ?limit= or ?after=
+# (row_count is the number of rows matching the filters, given with ?count=true)
+class ClientPage(BaseModel):
+    """Page de clients"""
+    items: List[ClientModel]
+    next_cursor: Optional[str] = None
+    row_count: Optional[int] = None
+
+class BonAchatsPage(BaseModel):
+    """Page de bons d'achat"""
+    items: List[BonAchats]
+    next_cursor: Optional[str] = None
+    row_count: Optional[int] = None
+
+class InventairePage(BaseModel):
+    """Page de l'inventaire"""
+    items: List[Inventaire]
+    next_cursor: Optional[str] = None
+    row_count: Optional[int] = None
+
+class ContratForfaitPage(BaseModel):
+    """Page de contrats forfait"""
+    items: List[ContratForfaitModel]
+    next_cursor: Optional[str] = None
+    row_count: Optional[int] = None
+
+class BonPassageForfaitPage(BaseModel):
+    """Page de bons de passage forfait"""
+    items: List[BonPassageForfaitModel]
+    next_cursor: Optional[str] = None
+    row_count: Optional[int] = None
+
+class VersementForfaitPage(BaseModel):
+    """Page de versements forfait"""
+    items: List[VersementForfaitModel]
+    next_cursor: Optional[str] = None
+    row_count: Optional[int] = None
+
+# Client profile (GET /api/clients/{id}/profile): everything the ClientProfile page shows
+class ClientProfileBonPassage(BonPassageForfaitModel):
+    """Bon de passage du profil client, avec ses lignes quand ?lines=true"""
+    produits: Optional[List[BonPassageForfaitProduitModel]] = None
+    services: Optional[List[BonPassageForfaitServiceModel]] = None
+
+class ClientProfile(BaseModel):
+    """Profil client: le client, ses contrats, bons de passage et versements.
+
+    Les catalogues (agents, produits, services) sont inclus avec ?catalogs=true.
+    """
+    client: ClientModel
+    contrats: List[ContratForfaitModel]
+    bons_passage: List[ClientProfileBonPassage]
+    versements: List[VersementForfaitModel]
+    agents: Optional[List[Agent]] = None
+    produits: Optional[List[Produit]] = None
+    services: Optional[List[Service]] = None
+
+# Client ledger (GET /api/clients/{id}/ledger) and balances (GET /api/clients/balances).
+# The solde is debit - credit: a positive solde is what the client still owes.
+class LedgerEntry(BaseModel):
+    """Écriture du compte client: un contrat, un bon de passage ou un versement"""
+    date: str
+    type: str
+    reference: int
+    contrat_id: Optional[int] = None
+    debit: int
+    credit: int
+    solde: int
+    solde_contrat: int
+
+class ContratSolde(BaseModel):
+    """Totaux d'un contrat dans le compte client"""
+    contrat_id: Optional[int] = None
+    debit: int
+    credit: int
+    solde: int
+
+class ClientLedger(BaseModel):
+    """Compte d'un client: ses totaux, les totaux de ses contrats et une page de ses écritures"""
+    client_id: int
+    as_of: Optional[str] = None
+    debit: int
+    credit: int
+    solde: int
+    contrats: List[ContratSolde]
+    items: List[LedgerEntry]
+    next_cursor: Optional[str] = None
+    row_count: int
+
+class ClientBalance(BaseModel):
+    """Solde d'un client"""
+    client_id: int
+    nom: str
+    debit: int
+    credit: int
+    solde: int
+
+# Dashboard KPIs (GET /api/dashboard), read from the Dashboard_Totaux and
+# Dashboard_Mois summary tables
+class DashboardKPI(BaseModel):
+    """Indicateurs du tableau de bord"""
+    contrats_actifs: int
+    dette_fournisseurs: float
+    valeur_stock: float
+    # Activity of the month (mm/yyyy)
+    mois: str
+    nb_passages: int
+    poids_collecte: int
+    exces_poids: int
+    montant_exces: int
+    montant_passages: int
+    versements: int
+
+# Stock movements (GET /api/inventaire/mouvements) and stock at a date
+# (GET /api/inventaire/stock), see stock.py
+class MouvementStock(BaseModel):
+    """Mouvement de stock: qte positive en entrée, négative en sortie"""
+    id: int
+    date: str
+    produit: str
+    type: str
+    qte: float
+    prix: Optional[float] = None
+    bon_achat_id: Optional[int] = None
+    bon_passage_id: Optional[int] = None
+    ligne_id: Optional[int] = None
+
+class MouvementStockPage(BaseModel):
+    """Page de mouvements de stock"""
+    items: List[MouvementStock]
+    next_cursor: Optional[str] = None
+    row_count: Optional[int] = None
+
+class StockProduit(BaseModel):
+    """Stock d'un produit à une date"""
+    produit: str
+    qte: float
+
+# Valuation of the stock (GET /api/inventaire/valuation), see valuation.py
+class ValuationProduit(BaseModel):
+    """Stock d'un produit et sa valeur"""
+    produit: str
+    qte: float
+    valeur: float
+    cout_unitaire: Optional[float] = None
+
+class InventaireValuation(BaseModel):
+    """Valeur du stock à une date, par la méthode wac (coût moyen pondéré) ou fifo"""
+    method: str
+    as_of: str
+    valeur_totale: float
+    items: List[ValuationProduit]
+
+# Bulk import of a CSV or XLSX file (POST /api/import/{kind}), see bulk_import.py
+class ImportErreur(BaseModel):
+    """Ligne du fichier refusée par l'import"""
+    ligne: int
+    erreur: str
+
+class ImportRapport(BaseModel):
+    """Rapport d'un import: lignes lues, importées et erreurs par ligne"""
+    kind: str
+    dry_run: bool
+    lignes: int
+    importees: int
+    nb_erreurs: int
+    # Les MAX_ERRORS premières erreurs, toutes sont comptées dans nb_erreurs
+    erreurs: List[ImportErreur]
+    duree_ms: float
+
+class ResultatRecherche(BaseModel):
+    """Résultat de la recherche plein texte: un client, fournisseur, produit ou service"""
+    type: str
+    id: int
+    titre: str
+    details: Optional[str] = None
+    # Score bm25 de la recherche, les meilleurs résultats ont le plus petit
+    rang: float
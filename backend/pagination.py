@@ -0,0 +1,166 @@
+"""Filtering, sorting and keyset (cursor) pagination for the list endpoints.
+
+A page is requested with `?limit=` and the following pages with `?after=<cursor>`.
+The cursor is an opaque string holding the sort key of the last row sent, the next
+page starts right after it: `WHERE (date, id) < (?, ?) ORDER BY date DESC, id DESC`.
+Unlike OFFSET, this reads only the rows of the page from the sort index, however
+deep the page is.
+
+The list endpoints also accept whitelisted filters and a `?sort=` parameter
+(the column name, prefixed with "-" for a descending sort), matching the server
+side mode of the MUI DataGrid. Only columns with an index can be used, and all
+the values are bound as SQL parameters.
+"""
+
+import base64
+import json
+
+from fastapi import HTTPException
+
+from database import row_to_dict, add_date_range
+
+# Number of rows of a page when `after` is given without `limit`
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(values):
+    """Encode the sort key of a row as an opaque cursor."""
+    data = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    """Decode a cursor made by encode_cursor, checking it has `size` values."""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+    return values
+
+
+def is_paginated(limit, after):
+    """A list endpoint returns a page when `limit` or `after` is given."""
+    return limit is not None or after is not None
+
+
+def limit_clause(params, limit, after):
+    """Return the LIMIT clause of a page query.
+
+    One more row than the page size is read to know if there is a next page.
+    """
+    if not is_paginated(limit, after):
+        return ""
+    params.append((limit or DEFAULT_PAGE_SIZE) + 1)
+    return "LIMIT ?"
+
+
+class ListQuery:
+    """The SELECT of a list endpoint, built from whitelisted filters, a sort and a page.
+
+    `sortable` lists the columns the endpoint can be sorted on (each one must be
+    NOT NULL and have an index), `default_sort` is used when `?sort=` is not given.
+    """
+
+    def __init__(self, table, sortable, default_sort):
+        self.table = table
+        self.sortable = sortable
+        self.conditions = []
+        self.params = []
+        self.sort = None
+        self.order_by(default_sort)
+
+    def where_equal(self, column, value):
+        """Filter on `column = value`, ignored when the value is not given."""
+        if value is not None:
+            self.conditions.append(f"{column} = ?")
+            self.params.append(value)
+
+    def where_date_range(self, column, date_from, date_to):
+        """Filter on a date range given in the API format (dd/mm/yyyy, inclusive)."""
+        add_date_range(self.conditions, self.params, column, date_from, date_to)
+
+    def order_by(self, sort):
+        """Sort on a whitelisted column: "date" (ascending) or "-date" (descending)."""
+        if sort is None:
+            return
+        column = sort[1:] if sort.startswith("-") else sort
+        if column not in self.sortable:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Tri impossible sur '{column}'. Colonnes acceptées: {', '.join(self.sortable)}"
+            )
+        self.sort = sort
+        self.descending = sort.startswith("-")
+        # The id makes the sort key unique, so the pages never skip or repeat a row
+        self.key_columns = [column] if column == "id" else [column, "id"]
+
+    def _item(self, row, columns):
+        """Convert a row for the API, keeping only the asked columns."""
+        item = row_to_dict(row)
+        if columns is None:
+            return item
+        return {column: item[column] for column in columns}
+
+    def _where(self, conditions):
+        return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    def fetch(self, cursor, limit=None, after=None, count=False, columns=None):
+        """Run the query and return the list of rows, or a page when `limit` or `after` is given.
+
+        With `count`, the page also gives the total number of rows matching the filters.
+        `columns` limits the columns read and returned (see fields.parse_fields).
+        """
+        # The sort key is always read, the cursor of the next page is made from it
+        select = "*"
+        if columns is not None:
+            select = ", ".join(columns + [column for column in self.key_columns if column not in columns])
+
+        conditions = list(self.conditions)
+        params = list(self.params)
+        paginated = is_paginated(limit, after)
+
+        row_count = None
+        if paginated and count:
+            cursor.execute(f"SELECT COUNT(*) FROM {self.table} {self._where(conditions)}", params)
+            row_count = cursor.fetchone()[0]
+
+        # Rows after the cursor. The cursor also holds the sort it was made with,
+        # a cursor of another sort would give a wrong page.
+        if after is not None:
+            values = decode_cursor(after, len(self.key_columns) + 1)
+            if values[0] != self.sort:
+                raise HTTPException(status_code=400, detail="Le curseur ne correspond pas au tri demandé")
+            operator = "<" if self.descending else ">"
+            key = ", ".join(self.key_columns)
+            placeholders = ", ".join("?" for _ in self.key_columns)
+            conditions.append(f"({key}) {operator} ({placeholders})")
+            params.extend(values[1:])
+
+        direction = "DESC" if self.descending else "ASC"
+        order = ", ".join(f"{column} {direction}" for column in self.key_columns)
+        limit_sql = limit_clause(params, limit, after)
+
+        cursor.execute(
+            f"SELECT {select} FROM {self.table} {self._where(conditions)} ORDER BY {order} {limit_sql}",
+            params
+        )
+        rows = cursor.fetchall()
+
+        if not paginated:
+            return [self._item(row, columns) for row in rows]
+
+        page_size = limit or DEFAULT_PAGE_SIZE
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            next_cursor = encode_cursor([self.sort] + [last[column] for column in self.key_columns])
+        return {
+            "items": [self._item(row, columns) for row in rows],
+            "next_cursor": next_cursor,
+            "row_count": row_count,
+        }
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Rebuild the dashboard KPI store.
+
+The Dashboard_Totaux and Dashboard_Mois tables are kept up to date by triggers
+(see create_db.py and dashboard.py). Run this command after writing to the
+database without the triggers (an import with the triggers dropped, a restored
+backup of the tables, ...) to recompute them from the data. It prints the
+values that had drifted and writes everything in one transaction.
+
+Usage (from the backend directory):
+    python rebuild_dashboard.py [--db path/to/db.sqlite]
+"""
+import argparse
+import sqlite3
+import time
+
+import dashboard
+from database import DB_PATH
+
+
+def read_store(cursor):
+    """Return the values of the KPI store, by table and key (without the key column)."""
+    store = {}
+    cursor.execute("SELECT contrats_actifs, dette_fournisseurs, valeur_stock FROM Dashboard_Totaux")
+    for row in cursor.fetchall():
+        store[("Dashboard_Totaux", 1)] = dict(row)
+    cursor.execute(f"SELECT mois, {', '.join(dashboard.MONTH_COLUMNS)} FROM Dashboard_Mois")
+    for row in cursor.fetchall():
+        store[("Dashboard_Mois", row["mois"])] = {column: row[column] for column in dashboard.MONTH_COLUMNS}
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the dashboard KPI store")
+    parser.add_argument("--db", default=DB_PATH, help="database file")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+
+    start = time.perf_counter()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        before = read_store(cursor)
+        dashboard.rebuild(cursor)
+        after = read_store(cursor)
+        cursor.execute("COMMIT")
+    except BaseException:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    drifts = 0
+    for key in sorted(before.keys() | after.keys(), key=str):
+        old, new = before.get(key, {}), after.get(key, {})
+        for column in sorted(old.keys() | new.keys()):
+            # A missing row reads as zeros, like in the API (a month emptied by deletes
+            # keeps a row of zeros until the rebuild)
+            if old.get(column, 0) != new.get(column, 0):
+                drifts += 1
+                print(f"{key[0]} {key[1]}: {column} {old.get(column, 0)} -> {new.get(column, 0)}")
+
+    print(f"{len(after)} row(s) rebuilt in {time.perf_counter() - start:.2f} s, {drifts} value(s) corrected")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Recompute the excess weight of the bons de passage.
+
+The API recomputes the bons of a contract when its poids_forfait, prix_exces_poids
+or seuil_periode is changed through PUT /api/contrats-forfait/{id}. Run this
+command after changing contracts directly in the database, or to rebuild the
+running totals of Poids_Periode_Forfait. It uses the same code as the API
+(exces_poids.py) and writes everything in one transaction.
+
+Usage (from the backend directory):
+    python recompute_exces_poids.py [--contrat ID] [--db path/to/db.sqlite]
+"""
+import argparse
+import sqlite3
+import time
+
+import exces_poids
+from database import DB_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute the excess weight of the bons de passage")
+    parser.add_argument("--contrat", type=int, help="only this contract (default: all the contracts)")
+    parser.add_argument("--db", default=DB_PATH, help="database file")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    cursor = conn.cursor()
+
+    start = time.perf_counter()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        if args.contrat is None:
+            cursor.execute("SELECT * FROM Contrat_Forfait ORDER BY id")
+        else:
+            cursor.execute("SELECT * FROM Contrat_Forfait WHERE id = ?", (args.contrat,))
+        contrats = cursor.fetchall()
+        if not contrats:
+            raise SystemExit(f"Contrat {args.contrat} non trouvé")
+
+        for contrat in contrats:
+            exces_poids.recompute_contrat(cursor, contrat)
+        cursor.execute("COMMIT")
+    except BaseException:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    print(f"{len(contrats)} contrat(s) recomputed in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Full-text search of the clients, fournisseurs, produits and services: GET /api/search.
+
+Each table has an FTS5 index kept in sync by triggers (see create_db.py), with the
+accents and the case removed. `?q=alg tel` finds the rows having a word starting
+with "alg" and a word starting with "tel" ("Algérie Telecom"), in any indexed
+column. The results of the four tables are ranked together by bm25, a match in
+the name counting more than a match in the other columns.
+
+The matches are found in the index, so a search costs a few milliseconds whatever
+the number of rows, where the pages used to load a whole table to filter it.
+"""
+
+import re
+
+from fastapi import HTTPException
+
+from database import row_to_dict
+
+# The words of the query kept, the others are ignored
+MAX_TERMS = 8
+
+# Number of results returned by default, and at most
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class Source:
+    """A searched table: its FTS5 index, the columns of a result and the weights of bm25."""
+
+    def __init__(self, fts_table, table, titre, details, weights):
+        self.fts_table = fts_table
+        self.table = table
+        self.titre = titre
+        # SQL expression of the second line of a result, NULL when there is nothing to show
+        self.details = details
+        # One weight per indexed column, in the order of create_db.py
+        self.weights = weights
+
+    def sql(self, name):
+        """The best matches of the table, of type `name`, with their rank (lower is better)."""
+        weights = ", ".join(str(weight) for weight in self.weights)
+        # Ranked in the index alone, the rows of the table are only read for the best ones
+        return f"""
+            SELECT '{name}' AS type, src.id, src.{self.titre} AS titre, {self.details} AS details, best.rang
+            FROM (
+                SELECT rowid, bm25({self.fts_table}, {weights}) AS rang
+                FROM {self.fts_table}
+                WHERE {self.fts_table} MATCH :query
+                ORDER BY rang
+                LIMIT :limit
+            ) best
+            JOIN {self.table} src ON src.id = best.rowid"""
+
+
+SOURCES = {
+    "client": Source(
+        "Recherche_Client", "Client_Forfait", "nom",
+        "COALESCE(src.specialite || ' - ', '') || src.tel", [10.0, 2.0, 1.0]
+    ),
+    "fournisseur": Source(
+        "Recherche_Fournisseur", "Fournisseur", "nom",
+        "src.telephone || ' - ' || src.adresse", [10.0, 1.0, 2.0]
+    ),
+    "produit": Source("Recherche_Produit", "Produit", "designation", "NULL", [10.0]),
+    "service": Source("Recherche_Service", "Service", "designation", "NULL", [10.0]),
+}
+
+
+def match_query(q):
+    """The FTS5 query of the text typed by the user: every word, as a prefix.
+
+    The words are quoted, so the FTS5 syntax (AND, OR, NEAR, *, ", column:) typed in
+    the search field is searched as text and never is a syntax error.
+    """
+    terms = re.findall(r"\w+", q)[:MAX_TERMS]
+    if not terms:
+        raise HTTPException(status_code=400, detail="La recherche ne contient aucun mot")
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def parse_types(types):
+    """Return the searched sources of `?types=client,produit`, all of them when None."""
+    if types is None:
+        return list(SOURCES)
+
+    names = []
+    for name in types.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in SOURCES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Type inconnu '{name}'. Types acceptés: {', '.join(SOURCES)}"
+            )
+        if name not in names:
+            names.append(name)
+
+    if not names:
+        raise HTTPException(status_code=400, detail="Le paramètre types ne contient aucun type")
+    return names
+
+
+def build_sql(names):
+    """The query of a search of the sources `names`: the best results of each, then the best of them all."""
+    return " UNION ALL ".join(SOURCES[name].sql(name) for name in names) + " ORDER BY rang LIMIT :limit"
+
+
+def search(conn, q, types=None, limit=DEFAULT_LIMIT):
+    """Return the best `limit` results of the search `q`, as dicts {type, id, titre, details, rang}."""
+    if not 1 <= limit <= MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"La limite doit être entre 1 et {MAX_LIMIT}")
+    names = parse_types(types)
+    params = {"query": match_query(q), "limit": limit}
+
+    cursor = conn.cursor()
+    cursor.execute(build_sql(names), params)
+    return [row_to_dict(row) for row in cursor.fetchall()]
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Take the monthly stock snapshots.
+
+The stock at a date (GET /api/inventaire/stock) is read from the last snapshot
+before it plus the movements after the snapshot (see stock.py). Run this command
+once a month, for example from cron on the 1st: it adds the snapshots of the
+months ended since the last one.
+
+With --rebuild, Inventaire and the existing snapshots are recomputed from the
+stock movements instead, and the values that had drifted are printed. Everything
+is written in one transaction.
+
+Usage (from the backend directory):
+    python snapshot_stock.py [--rebuild] [--db path/to/db.sqlite]
+"""
+import argparse
+import sqlite3
+import time
+
+import stock
+from database import DB_PATH
+
+
+def read_state(cursor):
+    """Return the stock and price of Inventaire, and the snapshots, by key."""
+    state = {}
+    cursor.execute("SELECT produit, qte, prix_dernier FROM Inventaire")
+    for row in cursor.fetchall():
+        state[("Inventaire", row["produit"], "qte")] = row["qte"]
+        state[("Inventaire", row["produit"], "prix_dernier")] = row["prix_dernier"]
+    cursor.execute("SELECT date, produit, qte FROM Stock_Snapshot")
+    for row in cursor.fetchall():
+        state[("Stock_Snapshot", f"{row['date']} {row['produit']}", "qte")] = row["qte"]
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Take the monthly stock snapshots")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="recompute Inventaire and the snapshots from the movements")
+    parser.add_argument("--db", default=DB_PATH, help="database file")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+
+    start = time.perf_counter()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        if args.rebuild:
+            before = read_state(cursor)
+            stock.rebuild(cursor)
+            after = read_state(cursor)
+        else:
+            taken = stock.take_due_snapshots(cursor)
+        cursor.execute("COMMIT")
+    except BaseException:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    if not args.rebuild:
+        print(f"{len(taken)} snapshot(s) taken in {elapsed:.2f} s{': ' + ', '.join(taken) if taken else ''}")
+        return
+
+    drifts = 0
+    for key in sorted(before.keys() | after.keys()):
+        if before.get(key) != after.get(key):
+            drifts += 1
+            print(f"{key[0]} {key[1]}: {key[2]} {before.get(key)} -> {after.get(key)}")
+    print(f"Rebuilt in {elapsed:.2f} s, {drifts} value(s) corrected")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Stock movements (Mouvement_Stock), the inventory and the stock at a date.
+
+Every change of the stock is a row of Mouvement_Stock, never updated nor deleted.
+Its qte is signed: positive when the stock goes in, negative when it goes out.
+The rows are written by the triggers of create_db.py, on every write to the lines
+of the bons:
+- 'Achat': a produit line of a bon d'achat (qte > 0, prix of the line).
+- 'Annulation achat': the line is changed or removed (qte < 0).
+- 'Consommation': a produit line of a bon de passage (qte < 0).
+- 'Annulation consommation': the line is changed or removed (qte > 0).
+A movement is dated by the date of its bon. When the date of a bon changes, its
+lines are cancelled at the old date and entered again at the new one.
+
+Inventaire is a projection of the movements, kept by a trigger: the stock (qte)
+and the last purchase price (prix_dernier) of every produit that ever moved. A
+movement that would take the stock below 0 is refused (STOCK_ERROR): at its date,
+and for a backdated exit at every later movement too.
+
+Stock_Snapshot holds the stock of every produit at the end of each month. The
+stock at a date is read from the last snapshot before it plus the movements
+between them. The trigger adding a movement also updates the snapshots after its
+date, so a backdated movement keeps them exact. take_due_snapshots() adds the
+snapshots of the months ended since the last one: run snapshot_stock.py monthly.
+"""
+
+import calendar
+from datetime import date as Date
+
+# Message of the trigger refusing a negative stock (see create_db.py)
+STOCK_ERROR = "Stock insuffisant: la quantité en stock ne peut pas devenir négative"
+
+# Date before all the movements, used when there is no snapshot yet
+NO_SNAPSHOT = "0000-00-00"
+
+# The stock of every produit at the end of :as_of (yyyy-mm-dd): the last
+# snapshot at or before it, plus the movements after the snapshot
+LAST_SNAPSHOT_SQL = f"SELECT COALESCE(MAX(date), '{NO_SNAPSHOT}') FROM Stock_Snapshot WHERE date <= :as_of"
+STOCK_AS_OF_SQL = f"""
+    SELECT produit, SUM(qte) AS qte FROM (
+        SELECT produit, qte FROM Stock_Snapshot WHERE date = ({LAST_SNAPSHOT_SQL})
+        UNION ALL
+        SELECT produit, qte FROM Mouvement_Stock WHERE date > ({LAST_SNAPSHOT_SQL}) AND date <= :as_of
+    )
+    GROUP BY produit
+    ORDER BY produit
+"""
+
+# Recompute the projection from the movements. The writes go through the
+# triggers of Inventaire, so the dashboard follows.
+REBUILD_INVENTAIRE_SQL = [
+    "DELETE FROM Inventaire WHERE produit NOT IN (SELECT produit FROM Mouvement_Stock)",
+    """
+    INSERT INTO Inventaire (produit, qte, prix_dernier)
+    SELECT produit, SUM(qte), (
+        SELECT prix FROM Mouvement_Stock achat
+        WHERE achat.produit = m.produit AND achat.type = 'Achat' AND achat.prix IS NOT NULL
+        ORDER BY achat.id DESC LIMIT 1
+    )
+    FROM Mouvement_Stock m
+    GROUP BY produit
+    ON CONFLICT (produit) DO UPDATE SET qte = excluded.qte, prix_dernier = excluded.prix_dernier
+    """,
+]
+
+
+def month_end(year, month):
+    """The last day (yyyy-mm-dd) of a month."""
+    return f"{year:04d}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+
+
+def stock_as_of(cursor, as_of):
+    """Return the stock of every produit at the end of the day `as_of` (yyyy-mm-dd)."""
+    cursor.execute(STOCK_AS_OF_SQL, {"as_of": as_of})
+    return [{"produit": row["produit"], "qte": row["qte"]} for row in cursor.fetchall()]
+
+
+def take_snapshot(cursor, snapshot_date):
+    """Store the stock of every produit at the end of `snapshot_date`."""
+    cursor.execute(
+        f"INSERT OR REPLACE INTO Stock_Snapshot (date, produit, qte) SELECT :as_of, produit, qte FROM ({STOCK_AS_OF_SQL})",
+        {"as_of": snapshot_date}
+    )
+
+
+def take_due_snapshots(cursor, today=None):
+    """Take the snapshots of the months ended since the last snapshot, return their dates.
+
+    Without a snapshot yet, the months start at the first movement.
+    """
+    today = today or Date.today().isoformat()
+    cursor.execute("SELECT MAX(date) FROM Stock_Snapshot")
+    last = cursor.fetchone()[0]
+    if last is None:
+        cursor.execute("SELECT MIN(date) FROM Mouvement_Stock")
+        first = cursor.fetchone()[0]
+        if first is None:
+            return []
+        year, month = int(first[:4]), int(first[5:7])
+    else:
+        # The month after the last snapshot
+        year, month = int(last[:4]), int(last[5:7]) + 1
+        if month == 13:
+            year, month = year + 1, 1
+
+    taken = []
+    while month_end(year, month) < today:
+        take_snapshot(cursor, month_end(year, month))
+        taken.append(month_end(year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return taken
+
+
+def rebuild(cursor):
+    """Recompute Inventaire and the existing snapshots from the movements."""
+    for sql in REBUILD_INVENTAIRE_SQL:
+        cursor.execute(sql)
+    cursor.execute("SELECT DISTINCT date FROM Stock_Snapshot ORDER BY date")
+    dates = [row[0] for row in cursor.fetchall()]
+    cursor.execute("DELETE FROM Stock_Snapshot")
+    # In date order: each snapshot is computed from the one before it
+    for snapshot_date in dates:
+        take_snapshot(cursor, snapshot_date)
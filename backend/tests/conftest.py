@@ -0,0 +1,6 @@
+"""The backend modules are imported flat, as when the server runs from backend/."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,53 @@
+"""The queries of the API are served by an index (check_query_plans.py)."""
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import check_query_plans
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    """A database made by create_db.py, in a temporary directory."""
+    work_dir = tmp_path_factory.mktemp("create_db")
+    os.makedirs(work_dir / "backend" / "db")
+    subprocess.run(
+        [sys.executable, os.path.join(os.path.dirname(BACKEND), "create_db.py")],
+        cwd=work_dir, env=dict(os.environ, PYTHONPATH=BACKEND), check=True, capture_output=True
+    )
+    conn = sqlite3.connect(work_dir / "backend" / "db" / "db.sqlite")
+    yield conn
+    conn.close()
+
+
+def failures(results):
+    return [query for query, scans, allow_scan in results if scans and not allow_scan]
+
+
+def test_queries_are_served_by_an_index(conn):
+    results, built = check_query_plans.check(conn)
+    assert failures(results) == []
+    assert built == []
+
+
+def test_queries_of_main_are_read_from_the_source(conn, tmp_path):
+    # A query missing from QUERIES is checked all the same
+    source = tmp_path / "main.py"
+    source.write_text(
+        'cursor.execute("SELECT * FROM Client_Forfait WHERE tel = ?", (tel,))\n'
+        'cursor.execute(f"SELECT {select_list(columns)} FROM Agents WHERE id = ?", (agent_id,))\n'
+        'cursor.execute(f"SELECT * FROM Produit WHERE {column} = ?", (value,))\n'
+        'raise HTTPException(status_code=404, detail="Client non trouvé")\n'
+    )
+    queries, built = check_query_plans.code_queries(source)
+    assert queries == ["SELECT * FROM Client_Forfait WHERE tel = ?", "SELECT * FROM Agents WHERE id = ?"]
+    assert built == [3]
+
+    results, built = check_query_plans.check(conn, source)
+    assert failures(results) == ["SELECT * FROM Client_Forfait WHERE tel = ?"]
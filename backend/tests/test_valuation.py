@@ -0,0 +1,105 @@
+"""Cost layers of the stock valuation (valuation.py)."""
+
+import sqlite3
+
+import valuation
+from valuation import CostLayers, ValuationCache
+
+
+def movement(id, date, type, qte, prix=None, bon_passage_id=None, ligne_id=None):
+    return {"id": id, "produit": "Kit", "date": date, "type": type, "qte": qte, "prix": prix,
+            "bon_passage_id": bon_passage_id, "ligne_id": ligne_id}
+
+
+def kit_stock():
+    """7 Kits bought at 8000, then 7 at 20000."""
+    layers = CostLayers()
+    layers.apply(movement(1, "2024-01-01", "Achat", 7, 8000))
+    layers.apply(movement(2, "2024-01-02", "Achat", 7, 20000))
+    return layers
+
+
+def test_consumption_takes_the_oldest_units():
+    layers = kit_stock()
+    layers.apply(movement(3, "2024-01-03", "Consommation", -7, bon_passage_id=1, ligne_id=1))
+    assert layers.value("fifo") == 140000
+    assert layers.value("wac") == 98000
+
+
+def test_cancelled_consumption_gives_back_its_layers():
+    # A save of an unchanged line: consumed, cancelled, consumed again
+    layers = kit_stock()
+    layers.apply(movement(3, "2024-01-03", "Consommation", -7, bon_passage_id=1, ligne_id=1))
+    layers.apply(movement(4, "2024-01-03", "Annulation consommation", 7, bon_passage_id=1, ligne_id=1))
+    assert layers.value("fifo") == layers.value("wac") == 7 * 8000 + 7 * 20000
+    layers.apply(movement(5, "2024-01-03", "Consommation", -7, bon_passage_id=1, ligne_id=1))
+    assert layers.qte == 7
+    assert layers.value("fifo") == 140000
+    assert layers.value("wac") == 98000
+
+
+def test_cancelled_consumption_goes_back_before_newer_layers():
+    layers = kit_stock()
+    layers.apply(movement(3, "2024-01-03", "Consommation", -7, bon_passage_id=1, ligne_id=1))
+    layers.apply(movement(4, "2024-01-04", "Consommation", -2, bon_passage_id=2, ligne_id=2))
+    layers.apply(movement(5, "2024-01-05", "Achat", 1, 30000))
+    # The 7 units of the first bon are the oldest again: the next consumption takes them
+    layers.apply(movement(6, "2024-01-03", "Annulation consommation", 7, bon_passage_id=1, ligne_id=1))
+    layers.apply(movement(7, "2024-01-06", "Consommation", -7, bon_passage_id=3, ligne_id=3))
+    assert layers.qte == 6
+    assert layers.value("fifo") == 5 * 20000 + 30000
+
+
+def test_bon_moved_to_an_earlier_date():
+    # The consumption at the new date comes before the cancellation at the old one
+    layers = kit_stock()
+    layers.apply(movement(3, "2024-01-10", "Consommation", -3, bon_passage_id=1, ligne_id=1))
+    layers.apply(movement(5, "2024-01-05", "Consommation", -3, bon_passage_id=1, ligne_id=1))
+    layers.apply(movement(4, "2024-01-10", "Annulation consommation", 3, bon_passage_id=1, ligne_id=1))
+    assert layers.qte == 11
+    assert layers.value("fifo") == 4 * 8000 + 7 * 20000
+
+
+def test_cancellation_of_a_dropped_consumption_is_reported():
+    layers = kit_stock()
+    layers.limit_consumptions(1)
+    layers.apply(movement(3, "2024-01-03", "Consommation", -2, bon_passage_id=1, ligne_id=1))
+    layers.apply(movement(4, "2024-01-04", "Consommation", -2, bon_passage_id=2, ligne_id=2))
+    assert list(layers.consumptions) == [(2, 2)]
+    assert not layers.missed
+
+    # The line of the last consumption is still given back its layers
+    layers.apply(movement(5, "2024-01-04", "Annulation consommation", 2, bon_passage_id=2, ligne_id=2))
+    assert not layers.missed
+    layers.apply(movement(6, "2024-01-03", "Annulation consommation", 2, bon_passage_id=1, ligne_id=1))
+    assert layers.missed
+
+
+def test_cache_computes_again_a_produit_whose_consumption_was_dropped(monkeypatch):
+    monkeypatch.setattr(valuation, "MAX_CONSUMPTIONS", 1)
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE Mouvement_Stock (id INTEGER PRIMARY KEY, produit TEXT, date TEXT, type TEXT,
+            qte REAL, prix REAL, bon_passage_id INTEGER, ligne_id INTEGER)
+    """)
+
+    def add(*movements):
+        conn.executemany("INSERT INTO Mouvement_Stock VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+            (m["id"], m["produit"], m["date"], m["type"], m["qte"], m["prix"], m["bon_passage_id"], m["ligne_id"])
+            for m in movements
+        ])
+
+    cache = ValuationCache()
+    add(movement(1, "2024-01-01", "Achat", 7, 8000), movement(2, "2024-01-02", "Achat", 7, 20000),
+        movement(3, "2024-01-03", "Consommation", -3, bon_passage_id=1, ligne_id=1),
+        movement(4, "2024-01-03", "Consommation", -1, bon_passage_id=2, ligne_id=2))
+    assert cache.valuation(conn.cursor(), "fifo", "9999-12-31")[0]["valeur"] == 164000
+    assert list(cache.produits["Kit"].consumptions) == [(2, 2)]
+
+    # The first line saved again: its consumption was dropped from the cache, the
+    # average cost would put its units back as the newest ones
+    add(movement(5, "2024-01-03", "Annulation consommation", 3, bon_passage_id=1, ligne_id=1),
+        movement(6, "2024-01-03", "Consommation", -3, bon_passage_id=1, ligne_id=1))
+    assert cache.valuation(conn.cursor(), "fifo", "9999-12-31")[0]["valeur"] == 164000
+    assert cache.valuation(conn.cursor(), "wac", "9999-12-31")[0]["valeur"] == 140000
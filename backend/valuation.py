@@ -0,0 +1,282 @@
+"""Valuation of the stock (GET /api/inventaire/valuation).
+
+The value of the stock of a produit is computed from its stock movements (see
+stock.py), in (date, id) order, with one of two methods:
+- 'wac' (weighted average cost): every unit in stock costs the average price paid
+  for the units in stock, which is recomputed at each purchase.
+- 'fifo' (first in, first out): the stock is a list of cost layers, one per
+  purchase. A consumption takes the oldest units first, the value is the sum of
+  the layers left.
+Both methods are computed in the same pass over the movements.
+
+A purchase without a price enters at the average cost of the stock. A cancelled
+purchase leaves at its own price, taken from the newest layers of that price. A
+cancelled consumption (a bon de passage line changed or removed) gives back what
+the consumption took: its units go back to the layers they came from, at their
+place in the FIFO order, and the value it removed goes back to the WAC value.
+Changing nothing on a line (cancelled and consumed again) changes no value.
+The cached layers keep the consumptions of the last MAX_CONSUMPTIONS lines saved
+per produit. A cancellation of an older line (an old bon edited) makes its produit
+computed again from its movements.
+
+The cost layers of every produit are kept in memory with the id of the last
+movement they include. As the movements are append-only, a request only reads
+the movements added since then, and only for the produits they touch: a movement
+dated after the last one is applied to the cached layers, a backdated movement
+makes its produit computed again. A date before the last movement of a produit
+computes that produit for the date, without using nor changing the cache.
+"""
+
+import bisect
+import threading
+
+METHODS = ("wac", "fifo")
+
+# Quantities below this are rounding errors of REAL sums
+EPSILON = 1e-9
+
+# Consumptions kept per produit in the cache, to give back what a cancellation takes
+MAX_CONSUMPTIONS = 1000
+
+# The movements of some produits, in the order they are applied.
+# Served by the index on Mouvement_Stock(produit, date) (the id is in the index).
+MOVEMENTS_SQL = """
+    SELECT id, produit, date, type, qte, prix, bon_passage_id, ligne_id FROM Mouvement_Stock
+    WHERE produit IN ({produits}) AND date <= ?
+    ORDER BY produit, date, id
+"""
+
+# The movements of a produit added since a movement id
+NEW_MOVEMENTS_SQL = """
+    SELECT id, produit, date, type, qte, prix, bon_passage_id, ligne_id FROM Mouvement_Stock
+    WHERE produit = ? AND id > ?
+    ORDER BY date, id
+"""
+
+# The produits with a movement added since a movement id
+CHANGED_SQL = """
+    SELECT produit, MIN(date) AS first_date FROM Mouvement_Stock
+    WHERE id > ? GROUP BY produit
+"""
+
+
+class CostLayers:
+    """The stock of one produit and its cost, with both valuation methods."""
+
+    def __init__(self):
+        self.qte = 0.0
+        self.wac_value = 0.0
+        self.layers = []       # [position, qte, unit cost], oldest first
+        self.positions = 0     # position of the next layer
+        self.consumptions = {}  # (bon_passage_id, ligne_id) -> [(date, wac value, taken)]
+        self.max_consumptions = None  # None keeps them all (see limit_consumptions)
+        self.dropped = False   # consumptions were dropped to keep max_consumptions
+        self.missed = False    # a cancellation did not find its dropped consumption
+        self.last_cost = 0.0   # unit cost of the last priced purchase
+        self.last_date = None
+        self.last_id = 0
+
+    def average_cost(self):
+        if self.qte > EPSILON:
+            return self.wac_value / self.qte
+        return self.last_cost
+
+    def apply(self, movement):
+        """Apply a movement (a Mouvement_Stock row)."""
+        qte = movement["qte"]
+        line = (movement["bon_passage_id"], movement["ligne_id"])
+        if movement["type"] == "Annulation consommation" and self.consumptions.get(line):
+            self._cancel_consumption(line, movement["date"], qte)
+        elif qte > 0:
+            if movement["type"] == "Annulation consommation" and self.dropped:
+                self.missed = True
+            if movement["type"] == "Achat" and movement["prix"] is not None:
+                cost = movement["prix"]
+                self.last_cost = cost
+            else:
+                cost = self.average_cost()
+            self.wac_value += qte * cost
+            self._add_layer(qte, cost)
+        elif movement["type"] == "Annulation achat" and movement["prix"] is not None:
+            self.wac_value -= -qte * movement["prix"]
+            self._take_newest(-qte, movement["prix"])
+        else:
+            wac_value = -qte * self.average_cost()
+            self.wac_value -= wac_value
+            taken = self._take_oldest(-qte)
+            if movement["type"] == "Consommation" and movement["ligne_id"] is not None:
+                # Kept until the line is cancelled, to give back what was taken
+                self.consumptions.setdefault(line, []).append((movement["date"], wac_value, taken))
+                self.limit_consumptions(self.max_consumptions)
+
+        self.qte += qte
+        if self.qte <= EPSILON:
+            # Nothing left in stock: drop the rounding errors of the sums
+            self.wac_value = 0.0
+        self.last_date = movement["date"]
+        self.last_id = max(self.last_id, movement["id"])
+
+    def limit_consumptions(self, max_consumptions):
+        """Keep the consumptions of the last max_consumptions lines consumed, None keeps them all."""
+        self.max_consumptions = max_consumptions
+        if max_consumptions is None:
+            return
+        while len(self.consumptions) > max_consumptions:
+            # The dict is in the order the lines were consumed, a line saved again goes last
+            del self.consumptions[next(iter(self.consumptions))]
+            self.dropped = True
+
+    def _add_layer(self, qte, cost):
+        self.layers.append([self.positions, qte, cost])
+        self.positions += 1
+
+    def _take_oldest(self, qte):
+        """Take qte units from the oldest layers, return the [position, qte, cost] taken."""
+        taken = []
+        while qte > EPSILON and self.layers:
+            layer = self.layers[0]
+            part = min(qte, layer[1])
+            taken.append((layer[0], part, layer[2]))
+            layer[1] -= part
+            qte -= part
+            if layer[1] <= EPSILON:
+                del self.layers[0]
+        return taken
+
+    def _take_newest(self, qte, cost):
+        """Take the units of a cancelled purchase: the newest layers of its price first."""
+        for layer in reversed(self.layers):
+            if qte <= EPSILON:
+                break
+            if layer[2] == cost:
+                part = min(qte, layer[1])
+                layer[1] -= part
+                qte -= part
+        while qte > EPSILON and self.layers:
+            layer = self.layers[-1]
+            part = min(qte, layer[1])
+            layer[1] -= part
+            qte -= part
+            if layer[1] <= EPSILON:
+                self.layers.pop()
+        self.layers = [layer for layer in self.layers if layer[1] > EPSILON]
+
+    def _cancel_consumption(self, line, date, qte):
+        """Give back the units and the value taken by the consumption of a line.
+
+        The cancellation is dated like the consumption it cancels (see create_db.py);
+        when a bon changes date the new consumption can come first, so the date picks it.
+        """
+        consumptions = self.consumptions[line]
+        index = next((i for i, consumption in enumerate(consumptions) if consumption[0] == date), 0)
+        _, wac_value, taken = consumptions.pop(index)
+        if not consumptions:
+            del self.consumptions[line]
+
+        self.wac_value += wac_value
+        for position, part, cost in taken:
+            # Back to its layer, or to a layer at its place if the layer was emptied
+            index = bisect.bisect_left(self.layers, [position])
+            if index < len(self.layers) and self.layers[index][0] == position:
+                self.layers[index][1] += part
+            else:
+                self.layers.insert(index, [position, part, cost])
+        rest = qte - sum(part for _, part, _ in taken)
+        if rest > EPSILON:
+            # Units the consumption did not find in the layers: at the average cost
+            cost = self.average_cost()
+            self.wac_value += rest * cost
+            self._add_layer(rest, cost)
+
+    def value(self, method):
+        if method == "wac":
+            return self.wac_value
+        return sum(qte * cost for _, qte, cost in self.layers)
+
+
+class ValuationCache:
+    """The cost layers of every produit, up to the last movement read."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.produits = {}  # produit -> CostLayers of all its movements
+        self.last_id = 0    # all the movements up to this id are in self.produits
+
+    def clear(self):
+        self.produits = {}
+        self.last_id = 0
+
+    def _compute(self, cursor, produits, as_of):
+        """Compute the cost layers of produits from their movements up to as_of (yyyy-mm-dd)."""
+        result = {produit: CostLayers() for produit in produits}
+        # Bounded IN lists, one streaming pass per batch
+        produits = list(produits)
+        for start in range(0, len(produits), 500):
+            batch = produits[start:start + 500]
+            cursor.execute(MOVEMENTS_SQL.format(produits=", ".join("?" * len(batch))), batch + [as_of])
+            for movement in cursor:
+                result[movement["produit"]].apply(movement)
+        return result
+
+    def _refresh(self, cursor):
+        """Bring the cache up to the last movement, reading only the new movements."""
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM Mouvement_Stock")
+        last_id = cursor.fetchone()[0]
+        if last_id < self.last_id:
+            # Another database (recreated): start again
+            self.clear()
+        if last_id == self.last_id:
+            return
+
+        cursor.execute(CHANGED_SQL, (self.last_id,))
+        changed = cursor.fetchall()
+        recompute = []
+        for row in changed:
+            layers = self.produits.get(row["produit"])
+            if layers is None or row["first_date"] < layers.last_date:
+                # New produit, or a movement backdated before the cached ones
+                recompute.append(row["produit"])
+                continue
+            cursor.execute(NEW_MOVEMENTS_SQL, (row["produit"], layers.last_id))
+            for movement in cursor.fetchall():
+                layers.apply(movement)
+            if layers.missed:
+                # A cancellation of a consumption no longer kept: computed again, exactly
+                recompute.append(row["produit"])
+        computed = self._compute(cursor, recompute, "9999-12-31")
+        for layers in computed.values():
+            layers.limit_consumptions(MAX_CONSUMPTIONS)
+        self.produits.update(computed)
+        self.last_id = last_id
+
+    def valuation(self, cursor, method, as_of):
+        """Return the quantity and value of the stock of every produit at the end of as_of."""
+        with self.lock:
+            self._refresh(cursor)
+            # A produit moved after as_of is computed for the date, the others are cached
+            current = {}
+            past = []
+            for produit, layers in self.produits.items():
+                if layers.last_date <= as_of:
+                    current[produit] = layers
+                else:
+                    past.append(produit)
+            current.update(self._compute(cursor, past, as_of))
+
+            # Read while locked: another request can apply new movements to the cached layers
+            items = []
+            for produit in sorted(current):
+                layers = current[produit]
+                if layers.last_date is None:
+                    continue  # No movement up to as_of
+                qte = round(layers.qte, 6)
+                valeur = round(layers.value(method), 2) if qte > 0 else 0.0
+                items.append({
+                    "produit": produit,
+                    "qte": qte,
+                    "valeur": valeur,
+                    "cout_unitaire": round(valeur / qte, 2) if qte > 0 else None,
+                })
+        return items
+
+cache = ValuationCache()
@@ -4,6 +4,8 @@ Script to create an SQLite database in the db directory
 """
 import sqlite3
 import os
+import sys
+import time
 
 # Make sure the backend/db directory exists
 os.makedirs('backend/db', exist_ok=True)
@@ -15,6 +17,15 @@ cursor = conn.cursor()
 # Add this line to enable foreign key constraints
 cursor.execute('PRAGMA foreign_keys = ON;')
 
+# The tables are recreated below. Drop the triggers of an existing database first,
+# so dropping a table (and its ON DELETE CASCADE) does not write to the others.
+for (trigger,) in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+    cursor.execute(f'DROP TRIGGER {trigger}')
+
+# All the dates are stored as ISO text (yyyy-mm-dd): they sort chronologically,
+# compare correctly and can be served by an index. The API converts them from/to
+# the dd/mm/yyyy format used by the frontend (see backend/database.py).
+
 # Drop the Agents table if it exists to ensure a clean state
 cursor.execute('DROP TABLE IF EXISTS Agents')
 
@@ -92,22 +103,12 @@ cursor.execute('''
 CREATE TABLE Inventaire (
     id INTEGER PRIMARY KEY,
     produit TEXT NOT NULL UNIQUE,
-    qte INTEGER NOT NULL CHECK (qte > 0),
-    prix_dernier REAL NOT NULL CHECK (prix_dernier > 0)
+    qte REAL NOT NULL DEFAULT 0 CHECK (qte >= 0),
+    -- NULL until the produit is bought with a price
+    prix_dernier REAL CHECK (prix_dernier IS NULL OR prix_dernier > 0)
 )
 ''')
-
-# Sample data for inventory
-inventaire_data = [
-    (1, 'Conteneur pour déchets 240L', 10, 15000.00),
-    (2, 'Sacs poubelle industriels 100L', 250, 200.00),
-    (3, 'Kit de nettoyage professionnel', 5, 8000.00)
-]
-
-cursor.executemany('''
-INSERT INTO Inventaire (id, produit, qte, prix_dernier)
-VALUES (?, ?, ?, ?)
-''', inventaire_data)
+# Inventaire is filled from the stock movements of the sample bons d'achat (see below)
 
 # Create Fournisseurs table
 cursor.execute('DROP TABLE IF EXISTS Fournisseur')
@@ -138,25 +139,26 @@ cursor.execute('DROP TABLE IF EXISTS Bon_Achats')
 cursor.execute('''
 CREATE TABLE Bon_Achats (
     id INTEGER PRIMARY KEY,
-    date TEXT NOT NULL,
+    date TEXT NOT NULL CHECK (date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'),
     fournisseur TEXT NOT NULL,
     montant_total REAL DEFAULT 0,
-    montant_verse REAL DEFAULT 0
+    -- Sum of the versements, maintained by the triggers of Versement_Bon_Achat
+    montant_verse REAL NOT NULL DEFAULT 0
 )
 ''')
 
 # Sample data for bon_achats
 bon_achats_data = [
-    (1, '15/03/2024', 'EcoSolutions Algérie', 15200.00, 0),
-    (2, '16/03/2024', 'GreenTech SARL', 8000.00, 0),
-    (3, '17/03/2024', 'EnviroServices Maghreb', 45000.00, 0),
-    (4, '20/03/2024', 'RecyclAlgeria', 40000.00, 0),
-    (5, '22/03/2024', 'EcoSolutions Algérie', 8000.00, 0),
-    (6, '25/03/2024', 'GreenTech SARL', 150000.00, 0),
-    (7, '27/03/2024', 'EnviroServices Maghreb', 30000.00, 0),
-    (8, '29/03/2024', 'RecyclAlgeria', 32000.00, 0),
-    (9, '01/04/2024', 'EcoSolutions Algérie', 30000.00, 0),
-    (10, '03/04/2024', 'GreenTech SARL', 25000.00, 0)
+    (1, '2024-03-15', 'EcoSolutions Algérie', 15200.00, 0),
+    (2, '2024-03-16', 'GreenTech SARL', 8000.00, 0),
+    (3, '2024-03-17', 'EnviroServices Maghreb', 45000.00, 0),
+    (4, '2024-03-20', 'RecyclAlgeria', 40000.00, 0),
+    (5, '2024-03-22', 'EcoSolutions Algérie', 8000.00, 0),
+    (6, '2024-03-25', 'GreenTech SARL', 150000.00, 0),
+    (7, '2024-03-27', 'EnviroServices Maghreb', 30000.00, 0),
+    (8, '2024-03-29', 'RecyclAlgeria', 32000.00, 0),
+    (9, '2024-04-01', 'EcoSolutions Algérie', 30000.00, 0),
+    (10, '2024-04-03', 'GreenTech SARL', 25000.00, 0)
 ]
 
 cursor.executemany('''
@@ -208,6 +210,56 @@ CREATE TABLE Versement_Bon_Achat (
 )
 ''')
 
+# Bon_Achats.montant_verse is the sum of the versements of the bon. The triggers
+# below keep it up to date by adding the change of each write, and refuse a
+# versement that would take it above montant_total before it is written.
+# backend/main.py checks the same rule first to return a detailed message,
+# OVERPAYMENT_ERROR must match the message of the RAISE.
+cursor.execute('''
+CREATE TRIGGER trg_versement_bon_achat_overpay_insert
+BEFORE INSERT ON Versement_Bon_Achat
+WHEN (SELECT montant_verse + NEW.montant > COALESCE(montant_total, 0) FROM Bon_Achats WHERE id = NEW.bon_achat_id)
+BEGIN
+    SELECT RAISE(ABORT, 'Le montant versé ne peut pas dépasser le montant total du bon d''achat');
+END
+''')
+# Only a change that raises the montant_verse of a bon is checked: lowering a
+# versement is always allowed, even on a bon already above its total.
+cursor.execute('''
+CREATE TRIGGER trg_versement_bon_achat_overpay_update
+BEFORE UPDATE OF montant, bon_achat_id ON Versement_Bon_Achat
+WHEN (NEW.bon_achat_id != OLD.bon_achat_id OR NEW.montant > OLD.montant)
+    AND (SELECT montant_verse + NEW.montant
+                - CASE WHEN NEW.bon_achat_id = OLD.bon_achat_id THEN OLD.montant ELSE 0 END
+                > COALESCE(montant_total, 0)
+         FROM Bon_Achats WHERE id = NEW.bon_achat_id)
+BEGIN
+    SELECT RAISE(ABORT, 'Le montant versé ne peut pas dépasser le montant total du bon d''achat');
+END
+''')
+cursor.execute('''
+CREATE TRIGGER trg_versement_bon_achat_insert
+AFTER INSERT ON Versement_Bon_Achat
+BEGIN
+    UPDATE Bon_Achats SET montant_verse = montant_verse + NEW.montant WHERE id = NEW.bon_achat_id;
+END
+''')
+cursor.execute('''
+CREATE TRIGGER trg_versement_bon_achat_delete
+AFTER DELETE ON Versement_Bon_Achat
+BEGIN
+    UPDATE Bon_Achats SET montant_verse = montant_verse - OLD.montant WHERE id = OLD.bon_achat_id;
+END
+''')
+cursor.execute('''
+CREATE TRIGGER trg_versement_bon_achat_update
+AFTER UPDATE OF montant, bon_achat_id ON Versement_Bon_Achat
+BEGIN
+    UPDATE Bon_Achats SET montant_verse = montant_verse - OLD.montant WHERE id = OLD.bon_achat_id;
+    UPDATE Bon_Achats SET montant_verse = montant_verse + NEW.montant WHERE id = NEW.bon_achat_id;
+END
+''')
+
 # Create Client_Forfait table (formerly Client)
 cursor.execute('DROP TABLE IF EXISTS Client_Forfait')
 cursor.execute('''
@@ -243,12 +295,14 @@ cursor.execute('DROP TABLE IF EXISTS Contrat_Forfait')
 cursor.execute('''
 CREATE TABLE Contrat_Forfait (
     id INTEGER PRIMARY KEY,
-    date_debut TEXT NOT NULL,
-    date_fin TEXT NOT NULL,
+    date_debut TEXT NOT NULL CHECK (date_debut GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'),
+    date_fin TEXT NOT NULL CHECK (date_fin GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'),
     montant INTEGER NOT NULL CHECK (montant > 0),
     prix_exces_poids INTEGER NOT NULL CHECK (prix_exces_poids > 0),
     poids_forfait INTEGER NOT NULL CHECK (poids_forfait > 0),
     etat TEXT NOT NULL DEFAULT 'Actif' CHECK (etat IN ('Actif', 'Pause', 'Terminé')),
+    -- Period of the poids_forfait threshold: each passage, or the total of a month / year
+    seuil_periode TEXT NOT NULL DEFAULT 'Passage' CHECK (seuil_periode IN ('Passage', 'Mois', 'Année')),
     client_id INTEGER NOT NULL,
     FOREIGN KEY (client_id) REFERENCES Client_Forfait(id) ON DELETE CASCADE,
     CHECK (date_fin > date_debut)
@@ -258,27 +312,27 @@ CREATE TABLE Contrat_Forfait (
 # Sample data for terminated contracts
 contrat_data = [
     # Terminated contracts for Algérie Telecom (Client ID 1)
-    ('01/01/2023', '30/06/2023', 100000, 500, 100, 'Terminé', 1),
-    ('01/07/2023', '31/12/2023', 120000, 600, 100, 'Terminé', 1),
+    ('2023-01-01', '2023-06-30', 100000, 500, 100, 'Terminé', 1),
+    ('2023-07-01', '2023-12-31', 120000, 600, 100, 'Terminé', 1),
     
     # Terminated contracts for SEAAL (Client ID 2)
-    ('01/03/2023', '31/08/2023', 150000, 700, 100, 'Terminé', 2),
+    ('2023-03-01', '2023-08-31', 150000, 700, 100, 'Terminé', 2),
     
     # Terminated contracts for Clinique El Azhar (Client ID 3)
-    ('01/01/2023', '30/04/2023', 80000, 400, 100, 'Terminé', 3),
-    ('01/05/2023', '31/08/2023', 85000, 450, 100, 'Terminé', 3),
-    ('01/09/2023', '31/12/2023', 90000, 500, 100, 'Terminé', 3),
+    ('2023-01-01', '2023-04-30', 80000, 400, 100, 'Terminé', 3),
+    ('2023-05-01', '2023-08-31', 85000, 450, 100, 'Terminé', 3),
+    ('2023-09-01', '2023-12-31', 90000, 500, 100, 'Terminé', 3),
     
     # Terminated contract for El Watan (Client ID 4)
-    ('01/01/2023', '31/03/2023', 60000, 300, 100, 'Terminé', 4),
-    ('01/04/2023', '30/06/2023', 65000, 350, 100, 'Terminé', 4),
-    ('01/07/2023', '30/09/2023', 70000, 400, 100, 'Terminé', 4),
-    ('01/10/2023', '31/12/2023', 75000, 450, 100, 'Terminé', 4),
+    ('2023-01-01', '2023-03-31', 60000, 300, 100, 'Terminé', 4),
+    ('2023-04-01', '2023-06-30', 65000, 350, 100, 'Terminé', 4),
+    ('2023-07-01', '2023-09-30', 70000, 400, 100, 'Terminé', 4),
+    ('2023-10-01', '2023-12-31', 75000, 450, 100, 'Terminé', 4),
     
     # Terminated contract for Air Algérie (Client ID 5)
-    ('01/01/2023', '31/03/2023', 200000, 1000, 100, 'Terminé', 5),
-    ('01/04/2023', '30/06/2023', 220000, 1100, 100, 'Terminé', 5),
-    ('01/07/2023', '31/12/2023', 240000, 1200, 100, 'Terminé', 5)
+    ('2023-01-01', '2023-03-31', 200000, 1000, 100, 'Terminé', 5),
+    ('2023-04-01', '2023-06-30', 220000, 1100, 100, 'Terminé', 5),
+    ('2023-07-01', '2023-12-31', 240000, 1200, 100, 'Terminé', 5)
 ]
 
 cursor.executemany('''
@@ -291,9 +345,11 @@ cursor.execute('DROP TABLE IF EXISTS Bon_Passage_Forfait')
 cursor.execute('''
 CREATE TABLE Bon_Passage_Forfait (
     id INTEGER PRIMARY KEY,
-    date TEXT NOT NULL,
+    date TEXT NOT NULL CHECK (date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'),
     montant INTEGER NOT NULL CHECK (montant >= 0),
     exces_poids INTEGER NOT NULL CHECK (exces_poids >= 0),
+    -- Price per kg the excess was billed with (montant includes exces_poids * prix_exces_poids)
+    prix_exces_poids INTEGER NOT NULL DEFAULT 0 CHECK (prix_exces_poids >= 0),
     poids_collecte INTEGER NOT NULL CHECK (poids_collecte > 0),
     client_id INTEGER NOT NULL,
     contrat_id INTEGER NOT NULL,
@@ -302,6 +358,22 @@ CREATE TABLE Bon_Passage_Forfait (
 )
 ''')
 
+# Create Poids_Periode_Forfait table: running totals of the contracts with a monthly
+# or yearly threshold, one row per contract and period (yyyy-mm or yyyy).
+# Maintained by backend/exces_poids.py.
+cursor.execute('DROP TABLE IF EXISTS Poids_Periode_Forfait')
+cursor.execute('''
+CREATE TABLE Poids_Periode_Forfait (
+    contrat_id INTEGER NOT NULL,
+    periode TEXT NOT NULL,
+    poids_collecte INTEGER NOT NULL CHECK (poids_collecte >= 0),
+    exces_poids INTEGER NOT NULL CHECK (exces_poids >= 0),
+    derniere_date TEXT NOT NULL,
+    PRIMARY KEY (contrat_id, periode),
+    FOREIGN KEY (contrat_id) REFERENCES Contrat_Forfait(id) ON DELETE CASCADE
+) WITHOUT ROWID
+''')
+
 # Create Bon_Passage_Forfait_Produits table
 cursor.execute('DROP TABLE IF EXISTS Bon_Passage_Forfait_Produits')
 cursor.execute('''
@@ -332,7 +404,7 @@ cursor.execute('DROP TABLE IF EXISTS Versement_Forfait')
 cursor.execute('''
 CREATE TABLE Versement_Forfait (
     id INTEGER PRIMARY KEY,
-    date TEXT NOT NULL,
+    date TEXT NOT NULL CHECK (date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'),
     montant INTEGER NOT NULL CHECK (montant > 0),
     client_id INTEGER NOT NULL,
     contrat_id INTEGER NOT NULL,
@@ -341,6 +413,368 @@ CREATE TABLE Versement_Forfait (
 )
 ''')
 
+# Indexes, designed from the queries made by backend/main.py.
+# The UNIQUE columns (Produit.designation, Service.designation, Fournisseur.nom,
+# Inventaire.produit, ...) already have an automatic index.
+# backend/check_query_plans.py checks that every query of the API uses an index.
+indexes = [
+    # Lists sorted by date and filtered by date range
+    'CREATE INDEX idx_bon_achats_date ON Bon_Achats(date)',
+    'CREATE INDEX idx_bon_passage_forfait_date ON Bon_Passage_Forfait(date)',
+    'CREATE INDEX idx_versement_forfait_date ON Versement_Forfait(date)',
+    'CREATE INDEX idx_contrat_forfait_date_debut ON Contrat_Forfait(date_debut)',
+
+    # Lines of a bon d'achat (list, stock movements of a new date, ON DELETE CASCADE)
+    'CREATE INDEX idx_produits_bon_achat_bon ON Produits_Bon_Achat(bon_achat_id)',
+    # The versements of a bon (listing, ON DELETE CASCADE)
+    'CREATE INDEX idx_versement_bon_achat_bon ON Versement_Bon_Achat(bon_achat_id, montant)',
+
+    # Clients sorted by name and unique name checks
+    'CREATE INDEX idx_client_forfait_nom ON Client_Forfait(nom)',
+    # Clients of an agent / with a contract state, sorted by name (list filters)
+    'CREATE INDEX idx_client_forfait_agent_nom ON Client_Forfait(agent, nom)',
+    'CREATE INDEX idx_client_forfait_etat_nom ON Client_Forfait(etat_contrat, nom)',
+
+    # Bons d'achat of a fournisseur, newest first (list filter)
+    'CREATE INDEX idx_bon_achats_fournisseur_date ON Bon_Achats(fournisseur, date)',
+
+    # Contracts of a client, and the active (or paused) contract of a client
+    'CREATE INDEX idx_contrat_forfait_client_etat ON Contrat_Forfait(client_id, etat)',
+    # Contracts in a given state (list filter)
+    'CREATE INDEX idx_contrat_forfait_etat ON Contrat_Forfait(etat)',
+
+    # Bons de passage of a client / of a contract, newest first
+    'CREATE INDEX idx_bon_passage_forfait_client_date ON Bon_Passage_Forfait(client_id, date)',
+    'CREATE INDEX idx_bon_passage_forfait_contrat_date ON Bon_Passage_Forfait(contrat_id, date)',
+
+    # Lines of a bon de passage (list and ON DELETE CASCADE)
+    'CREATE INDEX idx_bon_passage_forfait_produits_bon ON Bon_Passage_Forfait_Produits(bon_passage_id)',
+    'CREATE INDEX idx_bon_passage_forfait_services_bon ON Bon_Passage_Forfait_Services(bon_passage_id)',
+
+    # Versements of a client / of a contract, newest first
+    'CREATE INDEX idx_versement_forfait_client_date ON Versement_Forfait(client_id, date)',
+    'CREATE INDEX idx_versement_forfait_contrat_date ON Versement_Forfait(contrat_id, date)',
+]
+
+for index in indexes:
+    cursor.execute(index)
+
+sys.path.insert(0, 'backend')
+import stock
+
+# Stock movements, see backend/stock.py. Append-only: the rows are never updated
+# nor deleted, a change of a line is recorded as its cancellation plus a new movement.
+cursor.execute('DROP TABLE IF EXISTS Mouvement_Stock')
+cursor.execute('''
+CREATE TABLE Mouvement_Stock (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL CHECK (date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'),
+    produit TEXT NOT NULL,
+    type TEXT NOT NULL CHECK (type IN ('Achat', 'Annulation achat', 'Consommation', 'Annulation consommation')),
+    -- Positive when the stock goes in, negative when it goes out
+    qte REAL NOT NULL CHECK (qte != 0),
+    -- Unit purchase price, NULL for a consumption or a purchase line without price
+    prix REAL CHECK (prix IS NULL OR prix > 0),
+    -- The bon and the line the movement comes from. No foreign keys: the movements
+    -- are kept when the bon is deleted.
+    bon_achat_id INTEGER,
+    bon_passage_id INTEGER,
+    ligne_id INTEGER
+)
+''')
+# Stock of every produit at the end of a month, see backend/stock.py
+cursor.execute('DROP TABLE IF EXISTS Stock_Snapshot')
+cursor.execute('''
+CREATE TABLE Stock_Snapshot (
+    date TEXT NOT NULL,
+    produit TEXT NOT NULL,
+    qte REAL NOT NULL,
+    PRIMARY KEY (date, produit)
+) WITHOUT ROWID
+''')
+
+stock_indexes = [
+    # Movements in a date range (stock at a date, after the last snapshot)
+    'CREATE INDEX idx_mouvement_stock_date ON Mouvement_Stock(date)',
+    # Movements of a produit, newest first (list filter)
+    'CREATE INDEX idx_mouvement_stock_produit_date ON Mouvement_Stock(produit, date)',
+    # The last movement of a line, dating its cancellation
+    'CREATE INDEX idx_mouvement_stock_achat ON Mouvement_Stock(bon_achat_id, ligne_id) WHERE bon_achat_id IS NOT NULL',
+    'CREATE INDEX idx_mouvement_stock_passage ON Mouvement_Stock(bon_passage_id, ligne_id) WHERE bon_passage_id IS NOT NULL',
+]
+for index in stock_indexes:
+    cursor.execute(index)
+
+for action in ('UPDATE', 'DELETE'):
+    cursor.execute(f'''
+    CREATE TRIGGER trg_mouvement_stock_{action.lower()}
+    BEFORE {action} ON Mouvement_Stock
+    BEGIN
+        SELECT RAISE(ABORT, 'Les mouvements de stock ne peuvent pas être modifiés');
+    END
+    ''')
+
+# Inventaire and the snapshots follow every movement. A movement taking the stock
+# below 0 is refused before it is written: at its own date and at every movement
+# after it, for a backdated exit. The stock at the date is the current stock less
+# the movements after the date; the running sum of these movements gives the
+# lowest stock after it. Both read the movements after the date only (index on
+# (produit, date)), none for an exit dated today.
+cursor.execute(f'''
+CREATE TRIGGER trg_mouvement_stock_negatif
+BEFORE INSERT ON Mouvement_Stock
+WHEN NEW.qte < 0 AND COALESCE((SELECT qte FROM Inventaire WHERE produit = NEW.produit), 0) + NEW.qte + COALESCE((
+    SELECT MIN(MIN(apres), 0) - MAX(total) FROM (
+        SELECT SUM(qte) OVER (ORDER BY date, id) AS apres, SUM(qte) OVER () AS total
+        FROM Mouvement_Stock WHERE produit = NEW.produit AND date > NEW.date
+    )
+), 0) < 0
+BEGIN
+    SELECT RAISE(ABORT, '{stock.STOCK_ERROR}');
+END
+''')
+cursor.execute('''
+CREATE TRIGGER trg_mouvement_stock_insert
+AFTER INSERT ON Mouvement_Stock
+BEGIN
+    -- One statement, whatever the concurrent writes. The CHECK (qte >= 0) applies to
+    -- the inserted row before the conflict is found, so an exit inserts 0: it always
+    -- conflicts anyway, trg_mouvement_stock_negatif refuses an exit without stock.
+    INSERT INTO Inventaire (produit, qte, prix_dernier)
+    VALUES (NEW.produit, MAX(NEW.qte, 0), CASE WHEN NEW.type = 'Achat' THEN NEW.prix END)
+    ON CONFLICT (produit) DO UPDATE SET
+        qte = qte + NEW.qte,
+        prix_dernier = COALESCE(excluded.prix_dernier, prix_dernier);
+
+    -- The snapshots after a backdated movement
+    INSERT INTO Stock_Snapshot (date, produit, qte)
+    SELECT DISTINCT date, NEW.produit, NEW.qte FROM Stock_Snapshot WHERE date >= NEW.date
+    ON CONFLICT (date, produit) DO UPDATE SET qte = qte + excluded.qte;
+END
+''')
+
+# The produit lines of the bons and the movements they make:
+# (bon table, bon column, movement of a line, its cancellation, sign of the line's qte, price column)
+stock_lines = {
+    'Produits_Bon_Achat': ('Bon_Achats', 'bon_achat_id', 'Achat', 'Annulation achat', '', 'prix'),
+    'Bon_Passage_Forfait_Produits': ('Bon_Passage_Forfait', 'bon_passage_id', 'Consommation', 'Annulation consommation', '-', None),
+}
+
+
+def line_movement(bon_column, prix, row, type, sign, date):
+    """Insert the movement of one line (row: NEW or OLD) at a date."""
+    return f'''
+    INSERT INTO Mouvement_Stock (date, produit, type, qte, prix, {bon_column}, ligne_id)
+    VALUES ({date}, {row}.produit, '{type}', {sign}{row}.qte, {f"{row}.{prix}" if prix else "NULL"}, {row}.{bon_column}, {row}.id);
+    '''
+
+
+def bon_movements(table, bon_column, prix, type, sign, date):
+    """Insert the movements of all the lines of the bon NEW.id at a date."""
+    return f'''
+    INSERT INTO Mouvement_Stock (date, produit, type, qte, prix, {bon_column}, ligne_id)
+    SELECT {date}, produit, '{type}', {sign}qte, {prix or "NULL"}, {bon_column}, id
+    FROM {table} WHERE {bon_column} = NEW.id;
+    '''
+
+
+for table, (bon_table, bon_column, entry, cancel, sign, prix) in stock_lines.items():
+    name = table.lower()
+    cancel_sign = '' if sign == '-' else '-'
+    # The movement adding to the stock goes first, so the stock never goes below 0 in between
+    purchase = sign == ''
+
+    # A line is dated by its bon. Its cancellation takes the date of its last movement:
+    # the bon may already be deleted (ON DELETE CASCADE).
+    bon_date = f'(SELECT date FROM {bon_table} WHERE id = NEW.{bon_column})'
+    line_date = (f'(SELECT date FROM Mouvement_Stock WHERE {bon_column} = OLD.{bon_column} '
+                 f'AND ligne_id = OLD.id ORDER BY id DESC LIMIT 1)')
+    add_new = line_movement(bon_column, prix, 'NEW', entry, sign, bon_date)
+    cancel_old = line_movement(bon_column, prix, 'OLD', cancel, cancel_sign, line_date)
+    changed = 'OLD.produit IS NOT NEW.produit OR OLD.qte != NEW.qte'
+    if prix:
+        changed += f' OR OLD.{prix} IS NOT NEW.{prix}'
+
+    cursor.execute(f'CREATE TRIGGER trg_stock_{name}_insert AFTER INSERT ON {table} BEGIN {add_new} END')
+    cursor.execute(f'CREATE TRIGGER trg_stock_{name}_delete AFTER DELETE ON {table} BEGIN {cancel_old} END')
+    cursor.execute(f'''
+    CREATE TRIGGER trg_stock_{name}_update AFTER UPDATE ON {table} WHEN {changed}
+    BEGIN {add_new + cancel_old if purchase else cancel_old + add_new} END
+    ''')
+
+    # A new date of the bon moves the movements of its lines
+    add_new = bon_movements(table, bon_column, prix, entry, sign, 'NEW.date')
+    cancel_old = bon_movements(table, bon_column, prix, cancel, cancel_sign, 'OLD.date')
+    cursor.execute(f'''
+    CREATE TRIGGER trg_stock_{bon_table.lower()}_date AFTER UPDATE OF date ON {bon_table} WHEN OLD.date != NEW.date
+    BEGIN {add_new + cancel_old if purchase else cancel_old + add_new} END
+    ''')
+
+# Movements of the sample bons d'achat, which fill Inventaire
+cursor.execute('''
+INSERT INTO Mouvement_Stock (date, produit, type, qte, prix, bon_achat_id, ligne_id)
+SELECT b.date, p.produit, 'Achat', p.qte, p.prix, p.bon_achat_id, p.id
+FROM Produits_Bon_Achat p JOIN Bon_Achats b ON b.id = p.bon_achat_id
+ORDER BY b.date, p.id
+''')
+stock.take_due_snapshots(cursor)
+
+# Dashboard KPI store, read by GET /api/dashboard (see backend/dashboard.py).
+# The triggers below update it on every write to the summarized tables.
+cursor.execute('DROP TABLE IF EXISTS Dashboard_Totaux')
+cursor.execute('''
+CREATE TABLE Dashboard_Totaux (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    contrats_actifs INTEGER NOT NULL DEFAULT 0,
+    dette_fournisseurs REAL NOT NULL DEFAULT 0,
+    valeur_stock REAL NOT NULL DEFAULT 0
+)
+''')
+cursor.execute('DROP TABLE IF EXISTS Dashboard_Mois')
+cursor.execute('''
+CREATE TABLE Dashboard_Mois (
+    mois TEXT PRIMARY KEY,
+    nb_passages INTEGER NOT NULL DEFAULT 0,
+    poids_collecte INTEGER NOT NULL DEFAULT 0,
+    exces_poids INTEGER NOT NULL DEFAULT 0,
+    montant_exces INTEGER NOT NULL DEFAULT 0,
+    montant_passages INTEGER NOT NULL DEFAULT 0,
+    versements INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID
+''')
+
+
+def add_passage_month(row, sign):
+    """Add (sign '') or remove (sign '-') a bon de passage from the totals of its month."""
+    return f'''
+    INSERT INTO Dashboard_Mois (mois, nb_passages, poids_collecte, exces_poids, montant_exces, montant_passages)
+    VALUES (substr({row}.date, 1, 7), {sign}1, {sign}{row}.poids_collecte, {sign}{row}.exces_poids,
+            {sign}{row}.exces_poids * {row}.prix_exces_poids, {sign}{row}.montant)
+    ON CONFLICT (mois) DO UPDATE SET
+        nb_passages = nb_passages + excluded.nb_passages,
+        poids_collecte = poids_collecte + excluded.poids_collecte,
+        exces_poids = exces_poids + excluded.exces_poids,
+        montant_exces = montant_exces + excluded.montant_exces,
+        montant_passages = montant_passages + excluded.montant_passages;
+    '''
+
+
+def add_versement_month(row, sign):
+    """Add (sign '') or remove (sign '-') a versement forfait from the totals of its month."""
+    return f'''
+    INSERT INTO Dashboard_Mois (mois, versements) VALUES (substr({row}.date, 1, 7), {sign}{row}.montant)
+    ON CONFLICT (mois) DO UPDATE SET versements = versements + excluded.versements;
+    '''
+
+
+def add_to_totals(column, expression):
+    return f"UPDATE Dashboard_Totaux SET {column} = {column} + ({expression}) WHERE id = 1;"
+
+
+# An UPDATE removes the old row and adds the new one
+dashboard_triggers = {
+    'Bon_Passage_Forfait': (
+        add_passage_month('NEW', ''),
+        add_passage_month('OLD', '-'),
+    ),
+    'Versement_Forfait': (
+        add_versement_month('NEW', ''),
+        add_versement_month('OLD', '-'),
+    ),
+    'Contrat_Forfait': (
+        add_to_totals('contrats_actifs', "NEW.etat = 'Actif'"),
+        add_to_totals('contrats_actifs', "-(OLD.etat = 'Actif')"),
+    ),
+    'Bon_Achats': (
+        add_to_totals('dette_fournisseurs', 'NEW.montant_total - NEW.montant_verse'),
+        add_to_totals('dette_fournisseurs', '-(OLD.montant_total - OLD.montant_verse)'),
+    ),
+    'Inventaire': (
+        add_to_totals('valeur_stock', 'NEW.qte * COALESCE(NEW.prix_dernier, 0)'),
+        add_to_totals('valeur_stock', '-(OLD.qte * COALESCE(OLD.prix_dernier, 0))'),
+    ),
+}
+
+for table, (add_new, remove_old) in dashboard_triggers.items():
+    name = table.lower()
+    cursor.execute(f'CREATE TRIGGER trg_dashboard_{name}_insert AFTER INSERT ON {table} BEGIN {add_new} END')
+    cursor.execute(f'CREATE TRIGGER trg_dashboard_{name}_delete AFTER DELETE ON {table} BEGIN {remove_old} END')
+    cursor.execute(f'CREATE TRIGGER trg_dashboard_{name}_update AFTER UPDATE ON {table} BEGIN {remove_old} {add_new} END')
+
+# Fill the KPI store with the sample data
+import dashboard
+dashboard.rebuild(cursor)
+
+# Version of the tables read by the API, bumped on every write to them. The
+# catalog cache (backend/catalog.py) and the ETags of the GET endpoints
+# (backend/etag.py) are computed from it. The versions start at the creation time
+# in ms, so they never repeat when the database is created again.
+cursor.execute('DROP TABLE IF EXISTS Table_Version')
+cursor.execute('''
+CREATE TABLE Table_Version (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID
+''')
+versioned_tables = [
+    'Agents', 'Produit', 'Service', 'Fournisseur', 'Inventaire',
+    'Bon_Achats', 'Produits_Bon_Achat', 'Versement_Bon_Achat',
+    'Client_Forfait', 'Contrat_Forfait', 'Bon_Passage_Forfait', 'Bon_Passage_Forfait_Produits',
+    'Bon_Passage_Forfait_Services', 'Versement_Forfait',
+    'Mouvement_Stock', 'Stock_Snapshot', 'Dashboard_Totaux', 'Dashboard_Mois',
+]
+created_at = int(time.time() * 1000)
+for table in versioned_tables:
+    cursor.execute('INSERT INTO Table_Version (name, version) VALUES (?, ?)', (table, created_at))
+    for action in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+        CREATE TRIGGER trg_version_{table.lower()}_{action.lower()}
+        AFTER {action} ON {table}
+        BEGIN
+            UPDATE Table_Version SET version = version + 1 WHERE name = '{table}';
+        END
+        ''')
+
+# Full-text search index of the clients, fournisseurs, produits and services, for
+# GET /api/search (backend/search.py). One FTS5 table per table, "external content":
+# the index only keeps the words, the text is read from the table itself (content=).
+# The unicode61 tokenizer removes the accents and the case ("algerie" finds
+# "Algérie"), the prefix indexes answer the prefix queries ("alg*") of 2 and 3
+# letters directly. The triggers keep the index in sync with every write.
+search_tables = [
+    # (FTS5 table, indexed table, indexed columns)
+    ('Recherche_Client', 'Client_Forfait', ['nom', 'specialite', 'tel']),
+    ('Recherche_Fournisseur', 'Fournisseur', ['nom', 'telephone', 'adresse']),
+    ('Recherche_Produit', 'Produit', ['designation']),
+    ('Recherche_Service', 'Service', ['designation']),
+]
+for fts_table, table, columns in search_tables:
+    column_list = ', '.join(columns)
+    old_values = ', '.join(f'OLD.{column}' for column in columns)
+    new_values = ', '.join(f'NEW.{column}' for column in columns)
+    cursor.execute(f'DROP TABLE IF EXISTS {fts_table}')
+    cursor.execute(f'''
+    CREATE VIRTUAL TABLE {fts_table} USING fts5(
+        {column_list},
+        content = '{table}', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    ''')
+    # An external content index is updated by deleting the old words ('delete' with
+    # the old values) and inserting the new ones
+    add_new = f'INSERT INTO {fts_table} (rowid, {column_list}) VALUES (NEW.id, {new_values});'
+    remove_old = (f"INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) "
+                  f"VALUES ('delete', OLD.id, {old_values});")
+    name = table.lower()
+    cursor.execute(f'CREATE TRIGGER trg_recherche_{name}_insert AFTER INSERT ON {table} BEGIN {add_new} END')
+    cursor.execute(f'CREATE TRIGGER trg_recherche_{name}_delete AFTER DELETE ON {table} BEGIN {remove_old} END')
+    cursor.execute(f'''
+    CREATE TRIGGER trg_recherche_{name}_update AFTER UPDATE OF id, {column_list} ON {table}
+    BEGIN {remove_old} {add_new} END
+    ''')
+    # Index the rows already in the table
+    cursor.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+
 # Commit the changes and close the connection
 conn.commit()
 conn.close()
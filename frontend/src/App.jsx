@@ -24,6 +24,7 @@ import Bon_Achats from './pages/Bon_Achats';
 import Inventaire from './pages/Inventaire';
 import VersementsForfait from './pages/VersementsForfait';
 import BonsPassageForfait from './pages/BonsPassageForfait';
+import SearchBar from './components/SearchBar';
 import { theme } from './theme';
 
 /**
@@ -105,6 +106,7 @@ function AppContent() {
           <Typography variant="h6" component="div" sx={{ flexGrow: 1, fontWeight: 'bold' }}>
             VITALECOSYSTEM
           </Typography>
+          <SearchBar />
           {showReturnButton && (
             <Button
               color="inherit"
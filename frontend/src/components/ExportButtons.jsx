@@ -0,0 +1,33 @@
+import React from 'react';
+import { Box, Button } from '@mui/material';
+import { FileDownload as FileDownloadIcon } from '@mui/icons-material';
+
+/**
+ * Buttons downloading an export of the API as CSV or Excel.
+ *
+ * - url: the export endpoint, e.g. 'http://localhost:8000/api/export/achats'
+ * - dateRange: the `from`/`to` dates (dd/mm/yyyy) of the exported rows, from useServerDataGrid
+ *
+ * The file is streamed by the server and saved by the browser (Content-Disposition: attachment).
+ */
+const ExportButtons = ({ url, dateRange = {} }) => {
+  const exportUrl = (fileFormat) => {
+    const params = new URLSearchParams({ format: fileFormat });
+    if (dateRange.from) params.set('from', dateRange.from);
+    if (dateRange.to) params.set('to', dateRange.to);
+    return `${url}?${params}`;
+  };
+
+  return (
+    <Box sx={{ display: 'flex', gap: 1 }}>
+      <Button variant="outlined" startIcon={<FileDownloadIcon />} component="a" href={exportUrl('csv')}>
+        CSV
+      </Button>
+      <Button variant="outlined" startIcon={<FileDownloadIcon />} component="a" href={exportUrl('xlsx')}>
+        Excel
+      </Button>
+    </Box>
+  );
+};
+
+export default ExportButtons;
@@ -0,0 +1,105 @@
+import React, { useState, useEffect } from 'react';
+import { useNavigate } from 'react-router-dom';
+import { Autocomplete, TextField, Box, Typography, CircularProgress } from '@mui/material';
+
+// The page opened for each type of result
+const TYPES = {
+  client: { label: 'Clients', path: (result) => `/clients/${result.id}` },
+  fournisseur: { label: 'Fournisseurs', path: () => '/fournisseurs' },
+  produit: { label: 'Produits', path: () => '/produits-services' },
+  service: { label: 'Services', path: () => '/produits-services' }
+};
+
+/**
+ * Search field of the header: finds the clients, fournisseurs, produits and services
+ * with GET /api/search as the user types, and opens the page of the chosen result.
+ * The search runs on the server, no table is loaded in the browser.
+ */
+const SearchBar = () => {
+  const navigate = useNavigate();
+  const [input, setInput] = useState('');
+  const [results, setResults] = useState([]);
+  const [loading, setLoading] = useState(false);
+
+  useEffect(() => {
+    // Search from 2 letters, once the user stopped typing for a moment
+    if (input.trim().length < 2) {
+      setResults([]);
+      return undefined;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      setLoading(true);
+      try {
+        const params = new URLSearchParams({ q: input, limit: '15' });
+        const response = await fetch(`http://localhost:8000/api/search?${params}`);
+        if (!response.ok) throw new Error('Erreur lors de la recherche');
+        const data = await response.json();
+        // Grouped by type (groupBy needs the groups together), the type of the best result first
+        const order = [...new Set(data.map((result) => result.type))];
+        if (!cancelled) setResults([...data].sort((a, b) => order.indexOf(a.type) - order.indexOf(b.type)));
+      } catch (err) {
+        console.error('Error searching:', err);
+        if (!cancelled) setResults([]);
+      } finally {
+        if (!cancelled) setLoading(false);
+      }
+    }, 250);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [input]);
+
+  return (
+    <Autocomplete
+      sx={{ width: 350, mr: 2 }}
+      size="small"
+      options={results}
+      loading={loading}
+      // The results are already filtered and ranked by the server
+      filterOptions={(options) => options}
+      groupBy={(result) => TYPES[result.type].label}
+      getOptionLabel={(result) => result.titre}
+      isOptionEqualToValue={(option, value) => option.type === value.type && option.id === value.id}
+      inputValue={input}
+      onInputChange={(event, value) => setInput(value)}
+      value={null}
+      onChange={(event, result) => {
+        if (!result) return;
+        setInput('');
+        navigate(TYPES[result.type].path(result));
+      }}
+      noOptionsText={input.trim().length < 2 ? 'Tapez au moins 2 lettres' : 'Aucun résultat'}
+      loadingText="Recherche..."
+      renderOption={(props, result) => (
+        <Box component="li" {...props} key={`${result.type}-${result.id}`}>
+          <Box>
+            <Typography variant="body2" sx={{ fontWeight: 'bold' }}>{result.titre}</Typography>
+            {result.details && (
+              <Typography variant="caption" color="text.secondary">{result.details}</Typography>
+            )}
+          </Box>
+        </Box>
+      )}
+      renderInput={(params) => (
+        <TextField
+          {...params}
+          placeholder="Rechercher un client, fournisseur, produit..."
+          sx={{ backgroundColor: 'white', borderRadius: 1 }}
+          InputProps={{
+            ...params.InputProps,
+            endAdornment: (
+              <>
+                {loading && <CircularProgress color="inherit" size={18} />}
+                {params.InputProps.endAdornment}
+              </>
+            )
+          }}
+        />
+      )}
+    />
+  );
+};
+
+export default SearchBar;
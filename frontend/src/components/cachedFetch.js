@@ -0,0 +1,26 @@
+// Conditional GETs. The API sends an ETag with the responses of its GET endpoints,
+// which changes when the tables read by the endpoint change. The last body of each
+// URL is kept with its ETag and sent back in If-None-Match: when nothing changed the
+// server answers 304 without running the query, and the kept body is used.
+const responses = new Map(); // url -> { etag, body }
+
+/**
+ * fetch() for the GET requests of the API. Returns a Response like fetch(), with
+ * the kept body (status 200) when the server answers 304.
+ */
+export const cachedFetch = async (url) => {
+  const cached = responses.get(url);
+  const response = await fetch(url, cached ? { headers: { 'If-None-Match': cached.etag } } : undefined);
+
+  if (response.status === 304 && cached) {
+    return new Response(cached.body, { status: 200, headers: { 'Content-Type': 'application/json' } });
+  }
+
+  const etag = response.headers.get('ETag');
+  if (response.ok && etag) {
+    responses.set(url, { etag, body: await response.clone().text() });
+  } else {
+    responses.delete(url);
+  }
+  return response;
+};
@@ -0,0 +1,182 @@
+import { useState, useEffect, useRef } from 'react';
+import {
+  getGridStringOperators,
+  getGridDateOperators,
+  getGridSingleSelectOperators
+} from '@mui/x-data-grid';
+import { format } from 'date-fns';
+import { cachedFetch } from './cachedFetch';
+
+// Filter operators the list endpoints can run on the server.
+// Give them to a column with `filterOperators`, the other columns use `filterable: false`.
+export const equalsOperators = getGridStringOperators().filter((operator) => operator.value === 'equals');
+export const isOperators = getGridSingleSelectOperators().filter((operator) => operator.value === 'is');
+export const dateRangeOperators = getGridDateOperators().filter(
+  (operator) => ['is', 'onOrAfter', 'onOrBefore'].includes(operator.value)
+);
+
+// Parse a dd/mm/yyyy date from the API, for the columns of type 'date'
+export const parseApiDate = (value) => {
+  if (!value) return null;
+  const [day, month, year] = value.split('/');
+  return new Date(Number(year), Number(month) - 1, Number(day));
+};
+
+// Format the value of a date filter (yyyy-mm-dd text or Date) as dd/mm/yyyy for the API
+const toApiDate = (value) => {
+  const date = value instanceof Date ? value : new Date(`${value}T00:00:00`);
+  if (isNaN(date.getTime())) return null;
+  return format(date, 'dd/MM/yyyy');
+};
+
+// Convert the filter model of the DataGrid to the query parameters of the endpoint
+const filterParams = (filterModel, filterFields, dateField) => {
+  const params = {};
+  filterModel.items.forEach((item) => {
+    if (item.value === undefined || item.value === null || item.value === '') return;
+
+    if (item.field === dateField) {
+      const date = toApiDate(item.value);
+      if (!date) return;
+      if (item.operator === 'is' || item.operator === 'onOrAfter') params.from = date;
+      if (item.operator === 'is' || item.operator === 'onOrBefore') params.to = date;
+    } else if (filterFields[item.field]) {
+      params[filterFields[item.field]] = item.value;
+    }
+  });
+  return params;
+};
+
+/**
+ * Loads the rows of a DataGrid one page at a time from a list endpoint of the API.
+ * Pagination, sorting and filtering all run on the server (the DataGrid server mode):
+ * the browser only receives the rows of the current page.
+ *
+ * - url: the list endpoint, e.g. 'http://localhost:8000/api/clients'
+ * - defaultSort: the `sort` parameter used when no column is sorted, e.g. '-date'
+ * - filterFields: the filterable columns and their query parameter, e.g. { agent: 'agent' }
+ * - dateField: the date column filtered with the `from`/`to` parameters
+ *
+ * The sortable columns must have the name of a column the endpoint can sort on.
+ * Returns the props to give to the DataGrid, the error, a reload function and the
+ * `from`/`to` of the current date filter (for the export of the same rows).
+ */
+export const useServerDataGrid = ({
+  url,
+  defaultSort,
+  filterFields = {},
+  dateField = null,
+  initialSortModel = [],
+  pageSize = 10
+}) => {
+  const [rows, setRows] = useState([]);
+  const [rowCount, setRowCount] = useState(0);
+  const [loading, setLoading] = useState(true);
+  const [error, setError] = useState(null);
+  const [paginationModel, setPaginationModel] = useState({ page: 0, pageSize });
+  const [sortModel, setSortModel] = useState(initialSortModel);
+  const [filterModel, setFilterModel] = useState({ items: [] });
+  const [reloadCount, setReloadCount] = useState(0);
+  // The `after` cursor of each page already loaded (the first page has none)
+  const cursors = useRef([null]);
+
+  const handlePaginationModelChange = (model) => {
+    // A new page size, or a page whose cursor is unknown, starts again from the first page
+    if (model.pageSize !== paginationModel.pageSize || model.page >= cursors.current.length) {
+      cursors.current = [null];
+      setPaginationModel({ page: 0, pageSize: model.pageSize });
+    } else {
+      setPaginationModel(model);
+    }
+  };
+
+  // A new sort or filter gives other pages: forget the cursors
+  const handleSortModelChange = (model) => {
+    cursors.current = [null];
+    setSortModel(model);
+    setPaginationModel({ ...paginationModel, page: 0 });
+  };
+
+  const handleFilterModelChange = (model) => {
+    cursors.current = [null];
+    setFilterModel(model);
+    setPaginationModel({ ...paginationModel, page: 0 });
+  };
+
+  // Load the current page again (after a creation or a deletion)
+  const reload = () => setReloadCount((count) => count + 1);
+
+  useEffect(() => {
+    // Ignore the answer of a request made for a previous page, sort or filter
+    let cancelled = false;
+
+    const fetchPage = async () => {
+      setLoading(true);
+      const params = new URLSearchParams(filterParams(filterModel, filterFields, dateField));
+      params.set('limit', paginationModel.pageSize);
+      params.set('count', 'true');
+      if (sortModel.length > 0) {
+        params.set('sort', (sortModel[0].sort === 'desc' ? '-' : '') + sortModel[0].field);
+      } else {
+        params.set('sort', defaultSort);
+      }
+      const after = cursors.current[paginationModel.page];
+      if (after) params.set('after', after);
+
+      try {
+        const response = await cachedFetch(`${url}?${params}`);
+        if (!response.ok) {
+          let message = `Erreur HTTP ${response.status}`;
+          try {
+            const errorData = await response.json();
+            message = errorData.detail || message;
+          } catch (e) {
+            // Keep the default message
+          }
+          throw new Error(message);
+        }
+        const data = await response.json();
+        if (cancelled) return;
+        cursors.current[paginationModel.page + 1] = data.next_cursor;
+        setRows(data.items);
+        setRowCount(data.row_count);
+        setError(null);
+      } catch (error) {
+        if (cancelled) return;
+        console.error('Error fetching page:', error);
+        setError(error.message);
+      } finally {
+        if (!cancelled) setLoading(false);
+      }
+    };
+
+    fetchPage();
+    return () => {
+      cancelled = true;
+    };
+  }, [url, paginationModel, sortModel, filterModel, reloadCount]);
+
+  // The date range of the current filter, as the `from`/`to` parameters
+  const { from, to } = filterParams(filterModel, {}, dateField);
+
+  return {
+    error,
+    reload,
+    dateRange: { from, to },
+    gridProps: {
+      rows,
+      rowCount,
+      loading,
+      paginationMode: 'server',
+      sortingMode: 'server',
+      filterMode: 'server',
+      paginationModel,
+      onPaginationModelChange: handlePaginationModelChange,
+      sortModel,
+      onSortModelChange: handleSortModelChange,
+      filterModel,
+      onFilterModelChange: handleFilterModelChange,
+      pageSizeOptions: [10, 25, 50]
+    }
+  };
+};
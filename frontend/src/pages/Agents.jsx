@@ -29,6 +29,7 @@ import {
   CalendarMonth as CalendarIcon,
   Save as SaveIcon
 } from '@mui/icons-material';
+import { cachedFetch } from '../components/cachedFetch';
 
 /**
  * Agents component - Displays a list of agents in a grid with CRUD operations
@@ -141,7 +142,7 @@ const Agents = () => {
   const checkApiHealth = async () => {
     try {
       setLoading(true);
-      const response = await fetch('http://localhost:8000/api/agents');
+      const response = await cachedFetch('http://localhost:8000/api/agents');
       if (response.status === 500) {
         const data = await response.json();
         throw new Error(data.detail || 'Erreur de serveur');
@@ -157,7 +158,7 @@ const Agents = () => {
   const fetchAgents = async () => {
     try {
       setLoading(true);
-      const response = await fetch('http://localhost:8000/api/agents');
+      const response = await cachedFetch('http://localhost:8000/api/agents');
       const data = await handleApiError(response);
       setAgents(data);
     } catch (error) {
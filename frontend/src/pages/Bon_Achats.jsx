@@ -36,9 +36,16 @@ import { LocalizationProvider } from '@mui/x-date-pickers/LocalizationProvider';
 import { DatePicker } from '@mui/x-date-pickers/DatePicker';
 import { format } from 'date-fns';
 import fr from 'date-fns/locale/fr';
+import {
+  useServerDataGrid,
+  isOperators,
+  dateRangeOperators,
+  parseApiDate
+} from '../components/useServerDataGrid';
+import { cachedFetch } from '../components/cachedFetch';
+import ExportButtons from '../components/ExportButtons';
 
 const Bon_Achats = () => {
-  const [bonAchats, setBonAchats] = useState([]);
   const [fournisseurs, setFournisseurs] = useState([]);
   const [produits, setProduits] = useState([]);
   const [openDialog, setOpenDialog] = useState(false);
@@ -49,7 +56,6 @@ const Bon_Achats = () => {
     produits: [],
     versements: []
   });
-  const [loading, setLoading] = useState(true);
   const [snackbar, setSnackbar] = useState({ open: false, message: '', severity: 'success' });
   const [error, setError] = useState(null);
   const [editableFields, setEditableFields] = useState({
@@ -59,30 +65,23 @@ const Bon_Achats = () => {
     versements: false
   });
 
+  // Bons d'achats loaded one page at a time, filtered and sorted by the API
+  const bonAchatsGrid = useServerDataGrid({
+    url: 'http://localhost:8000/api/bon-achats',
+    defaultSort: '-date',
+    filterFields: { fournisseur: 'fournisseur' },
+    dateField: 'date',
+    initialSortModel: [{ field: 'date', sort: 'desc' }]
+  });
+
   useEffect(() => {
-    fetchBonAchats();
     fetchFournisseurs();
     fetchProduits();
   }, []);
 
-  const fetchBonAchats = async () => {
-    try {
-      const response = await fetch('http://localhost:8000/api/bon-achats');
-      if (!response.ok) throw new Error('Erreur lors du chargement des bons d\'achats');
-      const data = await response.json();
-      setBonAchats(data);
-    } catch (error) {
-      console.error('Erreur:', error);
-      showSnackbar('Erreur lors du chargement des bons d\'achats', 'error');
-      setError('Erreur lors du chargement des bons d\'achats');
-    } finally {
-      setLoading(false);
-    }
-  };
-
   const fetchFournisseurs = async () => {
     try {
-      const response = await fetch('http://localhost:8000/api/fournisseurs');
+      const response = await cachedFetch('http://localhost:8000/api/fournisseurs?fields=id,nom');
       if (!response.ok) throw new Error('Erreur lors du chargement des fournisseurs');
       const data = await response.json();
       setFournisseurs(data);
@@ -94,7 +93,7 @@ const Bon_Achats = () => {
 
   const fetchProduits = async () => {
     try {
-      const response = await fetch('http://localhost:8000/api/produits');
+      const response = await cachedFetch('http://localhost:8000/api/produits?fields=id,designation');
       if (!response.ok) throw new Error('Erreur lors du chargement des produits');
       const data = await response.json();
       setProduits(data);
@@ -107,8 +106,7 @@ const Bon_Achats = () => {
   const handleOpenDialog = (bon = null) => {
     if (bon) {
       setSelectedBon(bon);
-      fetchBonAchatProducts(bon.id);
-      fetchBonAchatVersements(bon.id);
+      fetchBonAchatDocument(bon.id);
       setFormData({
         date: new Date(bon.date.split('/').reverse().join('-')),
         fournisseur: bon.fournisseur,
@@ -139,38 +137,22 @@ const Bon_Achats = () => {
     setOpenDialog(true);
   };
 
-  const fetchBonAchatProducts = async (bonId) => {
+  // Load the produits and versements of a bon d'achat in one request
+  const fetchBonAchatDocument = async (bonId) => {
     try {
-      const response = await fetch(`http://localhost:8000/api/bon-achats/${bonId}/produits`);
-      if (!response.ok) throw new Error('Erreur lors du chargement des produits du bon d\'achat');
+      const response = await cachedFetch(`http://localhost:8000/api/bon-achats/${bonId}/document`);
+      if (!response.ok) throw new Error('Erreur lors du chargement du bon d\'achat');
       const data = await response.json();
       setFormData(prev => ({
         ...prev,
-        produits: data.map(p => ({ 
+        produits: data.produits.map(p => ({ 
           id: p.id,
           produit: p.produit, 
           qte: p.qte.toString(), 
           prix: p.prix?.toString() || '',
           isEditing: false
-        }))
-      }));
-    } catch (error) {
-      console.error('Erreur:', error);
-      showSnackbar('Erreur lors du chargement des produits du bon d\'achat', 'error');
-    }
-  };
-
-  const fetchBonAchatVersements = async (bonId) => {
-    try {
-      const response = await fetch(`http://localhost:8000/api/bon-achats/${bonId}/versements`);
-      if (!response.ok) throw new Error('Erreur lors du chargement des versements du bon d\'achat');
-      
-      const data = await response.json();
-      console.log('Versements loaded:', data);
-      
-      setFormData(prev => ({
-        ...prev,
-        versements: data.map(v => ({ 
+        })),
+        versements: data.versements.map(v => ({ 
           id: v.id,
           montant: v.montant.toString(), 
           type: v.type,
@@ -179,7 +161,7 @@ const Bon_Achats = () => {
       }));
     } catch (error) {
       console.error('Erreur:', error);
-      showSnackbar('Erreur lors du chargement des versements du bon d\'achat', 'error');
+      showSnackbar('Erreur lors du chargement des produits et versements du bon d\'achat', 'error');
     }
   };
 
@@ -279,122 +261,51 @@ const Bon_Achats = () => {
         return;
       }
 
-      const formattedDate = format(formData.date, 'dd/MM/yyyy');
-      
-      const bonData = {
-        date: formattedDate,
+      // The whole bon d'achat (header, produits and versements) is saved in one
+      // request: the server only writes what changed, in a single transaction.
+      // The lines keep their id, the new lines have none.
+      const bonDocument = {
+        date: format(formData.date, 'dd/MM/yyyy'),
         fournisseur: formData.fournisseur,
-        montant_total: totalAmount,
-        montant_verse: totalVersements
+        produits: formData.produits
+          .filter(p => p.produit && p.qte)
+          .map(p => ({
+            id: p.id,
+            produit: p.produit,
+            qte: parseInt(p.qte),
+            prix: p.prix ? parseFloat(p.prix) : null
+          })),
+        versements: formData.versements
+          .filter(v => v.montant && parseFloat(v.montant) > 0)
+          .map(v => ({
+            id: v.id,
+            montant: parseFloat(v.montant),
+            type: v.type
+          }))
       };
 
-      let bonId;
-
-      if (selectedBon) {
-        // When editing, keep track of the ID
-        bonId = selectedBon.id;
-
-        // Update the existing bon d'achat instead of delete-recreate
-        const updateResponse = await fetch(`http://localhost:8000/api/bon-achats/${bonId}`, {
-          method: 'PUT',
+      const response = await fetch(
+        selectedBon
+          ? `http://localhost:8000/api/bon-achats/${selectedBon.id}/document`
+          : 'http://localhost:8000/api/bon-achats/document',
+        {
+          method: selectedBon ? 'PUT' : 'POST',
           headers: {
             'Content-Type': 'application/json',
           },
-          body: JSON.stringify(bonData),
-        });
-
-        if (!updateResponse.ok) throw new Error('Erreur lors de la mise à jour du bon d\'achat');
-        
-        // Get all existing versements
-        const versementsResponse = await fetch(`http://localhost:8000/api/bon-achats/${bonId}/versements`);
-        if (versementsResponse.ok) {
-          const existingVersements = await versementsResponse.json();
-          
-          // Delete all existing versements
-          for (const versement of existingVersements) {
-            await fetch(`http://localhost:8000/api/bon-achats/${bonId}/versements/${versement.id}`, {
-              method: 'DELETE',
-            });
-          }
-        }
-        
-        // Delete all existing products (they will be re-added)
-        const produitsResponse = await fetch(`http://localhost:8000/api/bon-achats/${bonId}/produits`);
-        if (produitsResponse.ok) {
-          const existingProduits = await produitsResponse.json();
-          
-          for (const produit of existingProduits) {
-            await fetch(`http://localhost:8000/api/bon-achats/${bonId}/produits/${produit.id}`, {
-              method: 'DELETE',
-            });
-          }
+          body: JSON.stringify(bonDocument),
         }
-      } else {
-        // Adding a new bon d'achat
-        const response = await fetch('http://localhost:8000/api/bon-achats', {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(bonData),
-        });
-
-        if (!response.ok) throw new Error('Erreur lors de l\'enregistrement');
-        
-        const savedBon = await response.json();
-        bonId = savedBon.id;
-      }
-
-      // Save products
-      const validProducts = formData.produits.filter(p => p.produit && p.qte);
-      for (const product of validProducts) {
-        await fetch(`http://localhost:8000/api/bon-achats/${bonId}/produits`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify({
-            produit: product.produit,
-            qte: parseInt(product.qte),
-            prix: product.prix ? parseFloat(product.prix) : null,
-            bon_achat_id: bonId
-          }),
-        });
-      }
+      );
 
-      // Save versements 
-      console.log('Saving versements...');
-      const validVersements = formData.versements.filter(v => v.montant && parseFloat(v.montant) > 0);
-      
-      // Log the versements being saved
-      console.log('Valid versements to save:', validVersements);
-      
-      for (const versement of validVersements) {
+      if (!response.ok) {
+        let message = 'Erreur lors de l\'enregistrement du bon d\'achat';
         try {
-          const versementResponse = await fetch(`http://localhost:8000/api/bon-achats/${bonId}/versements`, {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-              montant: parseFloat(versement.montant),
-              type: versement.type,
-              bon_achat_id: bonId
-            }),
-          });
-          
-          if (!versementResponse.ok) {
-            const errorData = await versementResponse.json();
-            console.error('Error saving versement:', errorData);
-            throw new Error(`Erreur lors de l'enregistrement du versement: ${errorData.detail || versementResponse.statusText}`);
-          }
-          
-          console.log('Versement saved successfully');
-        } catch (error) {
-          console.error('Error in versement save:', error);
-          showSnackbar(`Erreur lors de l'enregistrement d'un versement: ${error.message}`, 'error');
-          // Continue with other versements even if one fails
+          const errorData = await response.json();
+          message = errorData.detail || message;
+        } catch (e) {
+          // Keep the default message
         }
+        throw new Error(message);
       }
 
       showSnackbar(
@@ -405,7 +316,7 @@ const Bon_Achats = () => {
       );
 
       handleCloseDialog();
-      fetchBonAchats();
+      bonAchatsGrid.reload();
     } catch (error) {
       console.error('Erreur:', error);
       showSnackbar(error.message, 'error');
@@ -424,7 +335,7 @@ const Bon_Achats = () => {
       if (!response.ok) throw new Error('Erreur lors de la suppression');
 
       showSnackbar('Bon d\'achat supprimé avec succès', 'success');
-      fetchBonAchats();
+      bonAchatsGrid.reload();
     } catch (error) {
       console.error('Erreur:', error);
       showSnackbar(error.message, 'error');
@@ -444,6 +355,7 @@ const Bon_Achats = () => {
       field: 'id',
       headerName: 'ID',
       width: 90,
+      filterable: false,
       headerAlign: 'center',
       align: 'center',
       headerClassName: 'super-app-theme--header',
@@ -452,6 +364,10 @@ const Bon_Achats = () => {
       field: 'date',
       headerName: 'Date',
       width: 130,
+      type: 'date',
+      valueGetter: (params) => parseApiDate(params.value),
+      valueFormatter: (params) => (params.value ? format(params.value, 'dd/MM/yyyy') : ''),
+      filterOperators: dateRangeOperators,
       headerAlign: 'center',
       align: 'center',
       headerClassName: 'super-app-theme--header',
@@ -461,6 +377,10 @@ const Bon_Achats = () => {
       headerName: 'Fournisseur',
       width: 200,
       flex: 1,
+      sortable: false,
+      type: 'singleSelect',
+      valueOptions: fournisseurs.map((fournisseur) => fournisseur.nom),
+      filterOperators: isOperators,
       headerAlign: 'center',
       align: 'center',
       headerClassName: 'super-app-theme--header',
@@ -469,6 +389,8 @@ const Bon_Achats = () => {
       field: 'montant_total',
       headerName: 'Montant Total',
       width: 150,
+      sortable: false,
+      filterable: false,
       headerAlign: 'right',
       align: 'right',
       headerClassName: 'super-app-theme--header',
@@ -478,6 +400,8 @@ const Bon_Achats = () => {
       field: 'montant_verse',
       headerName: 'Montant Versé',
       width: 150,
+      sortable: false,
+      filterable: false,
       headerAlign: 'right',
       align: 'right',
       headerClassName: 'super-app-theme--header',
@@ -520,27 +444,28 @@ const Bon_Achats = () => {
         <Typography variant="h4" sx={{ fontWeight: 'bold' }}>
           Bons d'achats
         </Typography>
-        <Button
-          variant="contained"
-          startIcon={<AddIcon />}
-          onClick={() => handleOpenDialog()}
-        >
-          Nouveau Bon d'achat
-        </Button>
+        <Box sx={{ display: 'flex', gap: 1 }}>
+          <ExportButtons url="http://localhost:8000/api/export/achats" dateRange={bonAchatsGrid.dateRange} />
+          <Button
+            variant="contained"
+            startIcon={<AddIcon />}
+            onClick={() => handleOpenDialog()}
+          >
+            Nouveau Bon d'achat
+          </Button>
+        </Box>
       </Box>
 
-      {error && (
+      {(error || bonAchatsGrid.error) && (
         <Alert severity="error" sx={{ mb: 3 }}>
-          {error}
+          {error || `Erreur lors du chargement des bons d'achats: ${bonAchatsGrid.error}`}
         </Alert>
       )}
 
       <Box sx={{ height: 600, width: '100%' }}>
         <DataGrid
-          rows={bonAchats}
+          {...bonAchatsGrid.gridProps}
           columns={columns}
-          pageSize={10}
-          rowsPerPageOptions={[5, 10, 25]}
           autoHeight
           disableColumnSelector
           hideFooterSelectedRowCount
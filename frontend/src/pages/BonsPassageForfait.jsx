@@ -10,45 +10,53 @@ import {
 import { DataGrid, frFR } from '@mui/x-data-grid';
 import { format, parse } from 'date-fns';
 import fr from 'date-fns/locale/fr';
+import {
+  useServerDataGrid,
+  isOperators,
+  dateRangeOperators,
+  parseApiDate
+} from '../components/useServerDataGrid';
+import { cachedFetch } from '../components/cachedFetch';
+import ExportButtons from '../components/ExportButtons';
 
 /**
  * BonsPassageForfait page displays all bons de passage forfait in a DataGrid
  */
 const BonsPassageForfait = () => {
-  const [bonsPassage, setBonsPassage] = useState([]);
   const [clients, setClients] = useState([]);
   const [contracts, setContracts] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
-  // Fetch all necessary data when component mounts
+  // Rows loaded one page at a time, filtered and sorted by the API
+  const grid = useServerDataGrid({
+    url: 'http://localhost:8000/api/bon-passage-forfait',
+    defaultSort: '-date',
+    filterFields: { client_id: 'client_id' },
+    dateField: 'date',
+    initialSortModel: [{ field: 'date', sort: 'desc' }]
+  });
+
+  // Fetch the clients and contracts shown in the rows when component mounts
   useEffect(() => {
     const fetchData = async () => {
       setLoading(true);
       try {
-        // Fetch bons de passage
-        const bonsPassageResponse = await fetch('http://localhost:8000/api/bon-passage-forfait');
-        if (!bonsPassageResponse.ok) {
-          throw new Error(`Erreur HTTP ${bonsPassageResponse.status}`);
-        }
-        const bonsPassageData = await bonsPassageResponse.json();
-
         // Fetch clients
-        const clientsResponse = await fetch('http://localhost:8000/api/clients');
+        const clientsResponse = await cachedFetch('http://localhost:8000/api/clients?fields=id,nom');
         if (!clientsResponse.ok) {
           throw new Error(`Erreur HTTP ${clientsResponse.status}`);
         }
         const clientsData = await clientsResponse.json();
         
         // Fetch contracts
-        const contractsResponse = await fetch('http://localhost:8000/api/contrats-forfait');
+        const contractsResponse = await cachedFetch('http://localhost:8000/api/contrats-forfait?fields=id,date_debut,date_fin');
         if (!contractsResponse.ok) {
           throw new Error(`Erreur HTTP ${contractsResponse.status}`);
         }
         const contractsData = await contractsResponse.json();
 
         // Update state with fetched data
-        setBonsPassage(bonsPassageData);
         setClients(clientsData);
         setContracts(contractsData);
         setError(null);
@@ -70,20 +78,30 @@ const BonsPassageForfait = () => {
       headerName: 'Date', 
       width: 120,
       headerClassName: 'super-app-theme--header',
+      type: 'date',
+      valueGetter: (params) => parseApiDate(params.value),
+      valueFormatter: (params) => (params.value ? format(params.value, 'dd/MM/yyyy') : ''),
+      filterOperators: dateRangeOperators,
     },
     { 
-      field: 'client_name', 
+      field: 'client_id', 
       headerName: 'Client', 
       width: 200, 
       flex: 1,
       headerClassName: 'super-app-theme--header',
-      valueGetter: (params) => {
-        const client = clients.find(c => c.id === params.row.client_id);
-        return client ? client.nom : `Client ID: ${params.row.client_id}`;
+      sortable: false,
+      type: 'singleSelect',
+      valueOptions: clients.map((client) => ({ value: client.id, label: client.nom })),
+      filterOperators: isOperators,
+      valueFormatter: (params) => {
+        const client = clients.find(c => c.id === params.value);
+        return client ? client.nom : `Client ID: ${params.value}`;
       }
     },
     { 
       field: 'poids_collecte', 
+      sortable: false,
+      filterable: false,
       headerName: 'Poids collecté', 
       width: 150,
       headerClassName: 'super-app-theme--header',
@@ -91,6 +109,8 @@ const BonsPassageForfait = () => {
     },
     { 
       field: 'exces_poids', 
+      sortable: false,
+      filterable: false,
       headerName: 'Excès de poids', 
       width: 150,
       headerClassName: 'super-app-theme--header',
@@ -98,6 +118,8 @@ const BonsPassageForfait = () => {
     },
     { 
       field: 'montant', 
+      sortable: false,
+      filterable: false,
       headerName: 'Montant', 
       width: 150,
       headerClassName: 'super-app-theme--header',
@@ -106,6 +128,8 @@ const BonsPassageForfait = () => {
     },
     {
       field: 'contract_info',
+      sortable: false,
+      filterable: false,
       headerName: 'Contrat',
       width: 200,
       flex: 1,
@@ -139,27 +163,25 @@ const BonsPassageForfait = () => {
 
   return (
     <Container maxWidth="xl" sx={{ mt: 4, mb: 4 }}>
-      <Typography variant="h4" sx={{ mb: 4, fontWeight: 'bold' }}>
-        Bons de Passage
-      </Typography>
+      <Box sx={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', mb: 4 }}>
+        <Typography variant="h4" sx={{ fontWeight: 'bold' }}>
+          Bons de Passage
+        </Typography>
+        <ExportButtons url="http://localhost:8000/api/export/bons-passage" dateRange={grid.dateRange} />
+      </Box>
 
       <Paper elevation={3} sx={{ width: '100%', mb: 4, p: 3 }}>
+        {grid.error && (
+          <Alert severity="error" sx={{ mb: 2 }}>
+            Erreur lors de la récupération des bons de passage: {grid.error}
+          </Alert>
+        )}
         <Box sx={{ height: 650, width: '100%' }}>
           <DataGrid
-            rows={bonsPassage}
+            {...grid.gridProps}
             columns={columns}
-            initialState={{
-              pagination: {
-                paginationModel: { pageSize: 10 },
-              },
-              sorting: {
-                sortModel: [{ field: 'date', sort: 'desc' }],
-              },
-            }}
-            pageSizeOptions={[10, 25, 50]}
             disableRowSelectionOnClick
             disableColumnSelector
-            disableColumnFilter
             hideFooterSelectedRowCount
             localeText={frFR.components.MuiDataGrid.defaultProps.localeText}
             sx={{
@@ -51,6 +51,7 @@ import { format, parse } from 'date-fns';
 import fr from 'date-fns/locale/fr';
 import { useParams, useNavigate } from 'react-router-dom';
 import VersementForfaitDialog from '../components/VersementForfaitDialog';
+import { cachedFetch } from '../components/cachedFetch';
 
 /**
  * ClientProfile component displays a full page with client details, editable fields,
@@ -102,6 +103,7 @@ const ClientProfile = () => {
     montant: 0,
     prix_exces_poids: 0,
     poids_forfait: 0,
+    seuil_periode: 'Passage',
     client_id: null,
     etat: 'Actif'
   });
@@ -131,12 +133,14 @@ const ClientProfile = () => {
     const fetchClientData = async () => {
       setLoading(true);
       try {
-        // Fetch client
-        const clientResponse = await fetch(`http://localhost:8000/api/clients/${id}`);
-        if (!clientResponse.ok) {
-          throw new Error(`Erreur HTTP: ${clientResponse.status}`);
+        // Fetch the client, its contracts, bons de passage and versements and the
+        // dropdown lists in one request
+        const profileResponse = await cachedFetch(`http://localhost:8000/api/clients/${id}/profile?catalogs=true`);
+        if (!profileResponse.ok) {
+          throw new Error(`Erreur HTTP: ${profileResponse.status}`);
         }
-        const clientData = await clientResponse.json();
+        const profile = await profileResponse.json();
+        const clientData = profile.client;
         setClient(clientData);
         
         // Initialize form data with client data
@@ -177,38 +181,12 @@ const ClientProfile = () => {
           client_id: clientData.id
         }));
 
-        // Fetch agents for dropdown
-        const agentsResponse = await fetch('http://localhost:8000/api/agents');
-        if (!agentsResponse.ok) {
-          throw new Error(`Erreur HTTP: ${agentsResponse.status}`);
-        }
-        const agentsData = await agentsResponse.json();
-        setAgents(agentsData);
-
-        // Fetch produits for consumables dropdown
-        const produitsResponse = await fetch('http://localhost:8000/api/produits');
-        if (!produitsResponse.ok) {
-          throw new Error(`Erreur HTTP: ${produitsResponse.status}`);
-        }
-        const produitsData = await produitsResponse.json();
-        setProduits(produitsData);
-
-        // Fetch services for services dropdown
-        const servicesResponse = await fetch('http://localhost:8000/api/services');
-        if (!servicesResponse.ok) {
-          throw new Error(`Erreur HTTP: ${servicesResponse.status}`);
-        }
-        const servicesData = await servicesResponse.json();
-        setServicesData(servicesData);
-
-        // Fetch bons de passage for this client
-        await fetchBonsPassage(clientData.id);
-        
-        // Fetch contracts for this client
-        await fetchContracts(clientData.id);
-        
-        // Fetch versements for this client
-        await fetchVersements(clientData.id);
+        setAgents(profile.agents);
+        setProduits(profile.produits);
+        setServicesData(profile.services);
+        setBonsPassage(profile.bons_passage);
+        applyContracts(profile.contrats);
+        setVersements(profile.versements);
 
         setError(null);
       } catch (error) {
@@ -227,7 +205,7 @@ const ClientProfile = () => {
   // Fetch bons de passage for this client
   const fetchBonsPassage = async (clientId) => {
     try {
-      const response = await fetch(`http://localhost:8000/api/clients/${clientId}/bon-passage-forfait`);
+      const response = await cachedFetch(`http://localhost:8000/api/clients/${clientId}/bon-passage-forfait`);
       if (!response.ok) {
         throw new Error(`Erreur HTTP: ${response.status}`);
       }
@@ -242,32 +220,37 @@ const ClientProfile = () => {
   // Fetch contracts for this client
   const fetchContracts = async (clientId) => {
     try {
-      const response = await fetch(`http://localhost:8000/api/clients/${clientId}/contrats-forfait`);
+      const response = await cachedFetch(`http://localhost:8000/api/clients/${clientId}/contrats-forfait`);
       if (!response.ok) {
         throw new Error(`Erreur HTTP: ${response.status}`);
       }
       const data = await response.json();
-      setContracts(data);
-      
-      // Find active contract to get prix_exces_poids
-      const activeContract = data.find(contract => contract.etat === 'Actif');
-      if (activeContract) {
-        setPrixExcesPoids(activeContract.prix_exces_poids);
-        console.log('Active contract found, prix_exces_poids:', activeContract.prix_exces_poids);
-      } else {
-        setPrixExcesPoids(0);
-        console.log('No active contract found');
-      }
+      applyContracts(data);
     } catch (error) {
       console.error('Error fetching contracts:', error);
       showSnackbar(`Erreur lors du chargement des contrats: ${error.message}`, 'error');
     }
   };
 
+  // Store the contracts of the client and the prix_exces_poids of the active one
+  const applyContracts = (data) => {
+    setContracts(data);
+    
+    // Find active contract to get prix_exces_poids
+    const activeContract = data.find(contract => contract.etat === 'Actif');
+    if (activeContract) {
+      setPrixExcesPoids(activeContract.prix_exces_poids);
+      console.log('Active contract found, prix_exces_poids:', activeContract.prix_exces_poids);
+    } else {
+      setPrixExcesPoids(0);
+      console.log('No active contract found');
+    }
+  };
+
   // Fetch versements for this client
   const fetchVersements = async (clientId) => {
     try {
-      const response = await fetch(`http://localhost:8000/api/clients/${clientId}/versements-forfait`);
+      const response = await cachedFetch(`http://localhost:8000/api/clients/${clientId}/versements-forfait`);
       if (!response.ok) {
         throw new Error(`Erreur HTTP: ${response.status}`);
       }
@@ -458,6 +441,49 @@ const ClientProfile = () => {
     setBonPassageData({ ...bonPassageData, services: newServices });
   };
 
+  // Build the bon de passage document sent to the API: the header with its produits
+  // and services. exces_poids and montant are computed by the server from the contract.
+  const buildBonPassageDocument = () => ({
+    date: format(bonPassageData.date, 'dd/MM/yyyy'),
+    client_id: client.id,
+    poids_collecte: parseInt(bonPassageData.poids_collecte) || 0,
+    // The lines read from the server keep their id: the server only writes the changed lines
+    produits: bonPassageData.consommables.map(consommable => ({
+      id: consommable.id,
+      produit: consommable.produit,
+      qte: parseFloat(consommable.qte),
+      prix: parseInt(consommable.prix)
+    })),
+    services: bonPassageData.services.map(service => ({
+      id: service.id,
+      service: service.service,
+      qte: service.qte ? parseFloat(service.qte) : null
+    }))
+  });
+
+  // Send a bon de passage document, the bon and its lines are saved in one transaction
+  const saveBonPassageDocument = async (url, method) => {
+    const response = await fetch(url, {
+      method,
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(buildBonPassageDocument()),
+    });
+
+    if (!response.ok) {
+      let message = `Erreur HTTP ${response.status}`;
+      try {
+        const errorData = await response.json();
+        message = errorData.detail || message;
+      } catch (e) {
+        // Keep the default message
+      }
+      throw new Error(message);
+    }
+    return response.json();
+  };
+
   const handleSubmitBonPassage = async () => {
     try {
       if (!bonPassageData.client_id) {
@@ -489,93 +515,7 @@ const ClientProfile = () => {
         return;
       }
 
-      const formattedDate = format(bonPassageData.date, 'dd/MM/yyyy');
-      
-      // Calculate total using our helper function
-      const totalMontant = calculateTotal();
-      
-      // Ensure exces_poids is never null
-      const excesPoids = parseInt(bonPassageData.exces_poids) || 0;
-      const poidsCollecte = parseInt(bonPassageData.poids_collecte) || 0;
-      
-      console.log(`Total montant: ${totalMontant} (includes excess weight cost)`);
-      
-      // Create bon passage with explicit non-null values
-      const bonPassageResponse = await fetch('http://localhost:8000/api/bon-passage-forfait', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          date: formattedDate,
-          client_id: bonPassageData.client_id,
-          montant: totalMontant,
-          exces_poids: excesPoids,
-          poids_collecte: poidsCollecte
-        }),
-      });
-
-      if (!bonPassageResponse.ok) {
-        const errorText = await bonPassageResponse.text();
-        console.error('Error response from server:', errorText);
-        throw new Error(`Erreur lors de la création du bon de passage: ${errorText}`);
-      }
-
-      const savedBonPassage = await bonPassageResponse.json();
-      const bonPassageId = savedBonPassage.id;
-
-      console.log('Created bon passage with ID:', bonPassageId);
-
-      // Add consommables
-      for (const consommable of bonPassageData.consommables) {
-        const produitData = {
-          produit: consommable.produit,
-          qte: parseFloat(consommable.qte),
-          prix: parseInt(consommable.prix),
-          bon_passage_id: bonPassageId
-        };
-        
-        console.log('Sending produit data:', produitData);
-        
-        const produitResponse = await fetch(`http://localhost:8000/api/bon-passage-forfait/${bonPassageId}/produits`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(produitData),
-        });
-        
-        if (!produitResponse.ok) {
-          const errorText = await produitResponse.text();
-          console.error('Error adding produit:', errorText);
-          throw new Error(`Erreur lors de l'ajout du produit: ${errorText}`);
-        }
-      }
-
-      // Add services
-      for (const service of bonPassageData.services) {
-        const serviceData = {
-          service: service.service,
-          qte: service.qte ? parseFloat(service.qte) : null,
-          bon_passage_id: bonPassageId
-        };
-        
-        console.log('Sending service data:', serviceData);
-        
-        const serviceResponse = await fetch(`http://localhost:8000/api/bon-passage-forfait/${bonPassageId}/services`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(serviceData),
-        });
-        
-        if (!serviceResponse.ok) {
-          const errorText = await serviceResponse.text();
-          console.error('Error adding service:', errorText);
-          throw new Error(`Erreur lors de l'ajout du service: ${errorText}`);
-        }
-      }
+      await saveBonPassageDocument('http://localhost:8000/api/bon-passage-forfait/document', 'POST');
 
       showSnackbar('Bon de passage créé avec succès', 'success');
       handleCloseBonPassageDialog();
@@ -600,52 +540,36 @@ const ClientProfile = () => {
       services: []
     });
     
-    // Fetch products and services for this bon
-    fetchBonPassageProducts(bon.id);
-    fetchBonPassageServices(bon.id);
+    // Fetch the products and services of this bon
+    fetchBonPassageDocument(bon.id);
     
     setOpenViewBonPassageDialog(true);
   };
 
-  // Fetch products for a specific bon de passage
-  const fetchBonPassageProducts = async (bonId) => {
+  // Fetch a bon de passage with its products and services
+  const fetchBonPassageDocument = async (bonId) => {
     try {
-      const response = await fetch(`http://localhost:8000/api/bon-passage-forfait/${bonId}/produits`);
+      const response = await cachedFetch(`http://localhost:8000/api/bon-passage-forfait/${bonId}/document`);
       if (!response.ok) {
         throw new Error(`Erreur HTTP: ${response.status}`);
       }
       const data = await response.json();
       setBonPassageData(prev => ({
         ...prev,
-        consommables: data.map(p => ({ 
+        consommables: data.produits.map(p => ({ 
+          id: p.id,
           produit: p.produit, 
           qte: p.qte, 
           prix: p.prix
-        }))
-      }));
-    } catch (error) {
-      console.error('Error fetching bon passage products:', error);
-      showSnackbar(`Erreur: ${error.message}`, 'error');
-    }
-  };
-
-  // Fetch services for a specific bon de passage
-  const fetchBonPassageServices = async (bonId) => {
-    try {
-      const response = await fetch(`http://localhost:8000/api/bon-passage-forfait/${bonId}/services`);
-      if (!response.ok) {
-        throw new Error(`Erreur HTTP: ${response.status}`);
-      }
-      const data = await response.json();
-      setBonPassageData(prev => ({
-        ...prev,
-        services: data.map(s => ({ 
+        })),
+        services: data.services.map(s => ({ 
+          id: s.id,
           service: s.service, 
           qte: s.qte
         }))
       }));
     } catch (error) {
-      console.error('Error fetching bon passage services:', error);
+      console.error('Error fetching bon passage document:', error);
       showSnackbar(`Erreur: ${error.message}`, 'error');
     }
   };
@@ -679,7 +603,7 @@ const ClientProfile = () => {
     setSelectedBonPassage(null);
   };
 
-  // Handle modifying a bon de passage (delete old one & create new one)
+  // Handle modifying a bon de passage (the bon and its lines are saved in one request)
   const handleModifyBonPassage = async () => {
     try {
       if (!selectedBonPassage) {
@@ -701,98 +625,10 @@ const ClientProfile = () => {
         return;
       }
 
-      const formattedDate = format(bonPassageData.date, 'dd/MM/yyyy');
-      
-      // Calculate total from consommables
-      let totalMontant = bonPassageData.consommables.reduce((sum, item) => {
-        const quantity = parseFloat(item.qte) || 0;
-        const price = parseFloat(item.prix) || 0;
-        return sum + (quantity * price);
-      }, 0);
-      
-      // Ensure poids_collecte is not null
-      const poidsCollecte = parseInt(bonPassageData.poids_collecte) || 0;
-      
-      // Add cost of excess weight to total
-      const coutExcesPoids = parseInt(bonPassageData.exces_poids) * prix_exces_poids;
-      totalMontant += coutExcesPoids;
-      
-      console.log(`Excess weight: ${bonPassageData.exces_poids}kg at ${prix_exces_poids}/kg = ${coutExcesPoids}`);
-      console.log(`Total montant: ${totalMontant} (includes excess weight cost)`);
-      
-      // Delete old bon passage
-      const deleteResponse = await fetch(`http://localhost:8000/api/bon-passage-forfait/${selectedBonPassage.id}`, {
-        method: 'DELETE'
-      });
-      
-      if (!deleteResponse.ok) {
-        throw new Error(`Erreur lors de la suppression: ${deleteResponse.status}`);
-      }
-
-      // Create new bon passage with modified data
-      const createResponse = await fetch('http://localhost:8000/api/bon-passage-forfait', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          date: formattedDate,
-          client_id: client.id,
-          montant: totalMontant,
-          exces_poids: bonPassageData.exces_poids,
-          poids_collecte: poidsCollecte
-        }),
-      });
-
-      if (!createResponse.ok) {
-        throw new Error(`Erreur lors de la création: ${createResponse.status}`);
-      }
-
-      const newBonPassage = await createResponse.json();
-      const bonPassageId = newBonPassage.id;
-
-      // Add consommables
-      for (const consommable of bonPassageData.consommables) {
-        const produitData = {
-          produit: consommable.produit,
-          qte: parseFloat(consommable.qte),
-          prix: parseInt(consommable.prix),
-          bon_passage_id: bonPassageId
-        };
-        
-        const produitResponse = await fetch(`http://localhost:8000/api/bon-passage-forfait/${bonPassageId}/produits`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(produitData),
-        });
-        
-        if (!produitResponse.ok) {
-          throw new Error(`Erreur lors de l'ajout du produit: ${produitResponse.status}`);
-        }
-      }
-
-      // Add services
-      for (const service of bonPassageData.services) {
-        const serviceData = {
-          service: service.service,
-          qte: service.qte ? parseFloat(service.qte) : null,
-          bon_passage_id: bonPassageId
-        };
-        
-        const serviceResponse = await fetch(`http://localhost:8000/api/bon-passage-forfait/${bonPassageId}/services`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(serviceData),
-        });
-        
-        if (!serviceResponse.ok) {
-          throw new Error(`Erreur lors de l'ajout du service: ${serviceResponse.status}`);
-        }
-      }
+      await saveBonPassageDocument(
+        `http://localhost:8000/api/bon-passage-forfait/${selectedBonPassage.id}/document`,
+        'PUT'
+      );
 
       showSnackbar('Bon de passage modifié avec succès', 'success');
       handleCloseViewBonPassageDialog();
@@ -821,6 +657,7 @@ const ClientProfile = () => {
         montant: 0,
         prix_exces_poids: 0,
         poids_forfait: 0,
+        seuil_periode: 'Passage',
         client_id: client.id,
         etat: 'Actif'
       });
@@ -862,6 +699,7 @@ const ClientProfile = () => {
       montant: contract.montant,
       prix_exces_poids: contract.prix_exces_poids,
       poids_forfait: contract.poids_forfait,
+      seuil_periode: contract.seuil_periode,
       client_id: contract.client_id,
       etat: contract.etat
     });
@@ -930,7 +768,7 @@ const ClientProfile = () => {
       await fetchContracts(client.id);
       
       // Update client data to reflect contract changes
-      const clientResponse = await fetch(`http://localhost:8000/api/clients/${client.id}`);
+      const clientResponse = await cachedFetch(`http://localhost:8000/api/clients/${client.id}`);
       if (!clientResponse.ok) {
         throw new Error(`Erreur HTTP: ${clientResponse.status}`);
       }
@@ -950,6 +788,7 @@ const ClientProfile = () => {
         montant: 0,
         prix_exces_poids: 0,
         poids_forfait: 0,
+        seuil_periode: 'Passage',
         client_id: client.id,
         etat: 'Actif'
       });
@@ -987,7 +826,7 @@ const ClientProfile = () => {
       await fetchContracts(client.id);
       
       // Update client data to reflect contract changes
-      const clientResponse = await fetch(`http://localhost:8000/api/clients/${client.id}`);
+      const clientResponse = await cachedFetch(`http://localhost:8000/api/clients/${client.id}`);
       if (!clientResponse.ok) {
         throw new Error(`Erreur HTTP: ${clientResponse.status}`);
       }
@@ -1008,6 +847,21 @@ const ClientProfile = () => {
     }
   };
 
+  // True when the active contract has a monthly or yearly weight threshold
+  const seuilCumulatif = () => {
+    const activeContract = contracts.find(c => c.etat === 'Actif');
+    return Boolean(activeContract) && activeContract.seuil_periode !== 'Passage';
+  };
+
+  const excesPoidsHelperText = () => {
+    if (!seuilCumulatif()) {
+      return 'Calculé automatiquement selon le poids collecté et le forfait';
+    }
+    const activeContract = contracts.find(c => c.etat === 'Actif');
+    const periode = activeContract.seuil_periode === 'Mois' ? 'du mois' : "de l'année";
+    return `Calculé à l'enregistrement selon le poids cumulé ${periode}`;
+  };
+
   // Calculate the total amount including excess weight cost
   const calculateTotal = () => {
     // Calculate base amount from consommables
@@ -1577,6 +1431,12 @@ const ClientProfile = () => {
                         headerClassName: 'super-app-theme--header',
                         valueFormatter: (params) => `${params.value} kg`
                       },
+                      { 
+                        field: 'seuil_periode', 
+                        headerName: 'Période seuil', 
+                        width: 130,
+                        headerClassName: 'super-app-theme--header'
+                      },
                       { 
                         field: 'etat', 
                         headerName: 'État', 
@@ -1698,8 +1558,11 @@ const ClientProfile = () => {
                     // Get contract's poids_forfait (from the active contract)
                     const activeContract = contracts.find(c => c.etat === 'Actif');
                     const poidsForfait = activeContract ? activeContract.poids_forfait : 0;
-                    // Calculate excess weight
-                    const excesPoids = Math.max(0, poidsCollecte - poidsForfait);
+                    // Calculate excess weight (a monthly or yearly threshold is computed
+                    // by the server when the bon is saved)
+                    const excesPoids = seuilCumulatif()
+                      ? bonPassageData.exces_poids
+                      : Math.max(0, poidsCollecte - poidsForfait);
                     
                     setBonPassageData({
                       ...bonPassageData,
@@ -1729,7 +1592,7 @@ const ClientProfile = () => {
                   InputProps={{
                     endAdornment: <InputAdornment position="end">kg</InputAdornment>,
                   }}
-                  helperText="Calculé automatiquement selon le poids collecté et le forfait"
+                  helperText={excesPoidsHelperText()}
                 />
               </Grid>
               
@@ -1970,8 +1833,11 @@ const ClientProfile = () => {
                     // Get contract's poids_forfait (from the active contract)
                     const activeContract = contracts.find(c => c.etat === 'Actif');
                     const poidsForfait = activeContract ? activeContract.poids_forfait : 0;
-                    // Calculate excess weight
-                    const excesPoids = Math.max(0, poidsCollecte - poidsForfait);
+                    // Calculate excess weight (a monthly or yearly threshold is computed
+                    // by the server when the bon is saved)
+                    const excesPoids = seuilCumulatif()
+                      ? bonPassageData.exces_poids
+                      : Math.max(0, poidsCollecte - poidsForfait);
                     
                     setBonPassageData({
                       ...bonPassageData,
@@ -1999,7 +1865,7 @@ const ClientProfile = () => {
                   InputProps={{
                     endAdornment: <InputAdornment position="end">kg</InputAdornment>,
                   }}
-                  helperText="Calculé automatiquement selon le poids collecté et le forfait"
+                  helperText={excesPoidsHelperText()}
                 />
               </Grid>
               
@@ -2262,6 +2128,22 @@ const ClientProfile = () => {
                 inputProps={{ min: "1" }}
               />
             </Grid>
+            <Grid item xs={12} md={6}>
+              <FormControl fullWidth margin="normal">
+                <InputLabel id="seuil-periode-label">Période du seuil</InputLabel>
+                <Select
+                  labelId="seuil-periode-label"
+                  id="seuil-periode"
+                  value={contractData.seuil_periode}
+                  label="Période du seuil"
+                  onChange={(e) => setContractData({ ...contractData, seuil_periode: e.target.value })}
+                >
+                  <MenuItem value="Passage">Par passage</MenuItem>
+                  <MenuItem value="Mois">Par mois (cumulé)</MenuItem>
+                  <MenuItem value="Année">Par année (cumulé)</MenuItem>
+                </Select>
+              </FormControl>
+            </Grid>
             {isEditingContract && (
               <Grid item xs={12} md={6}>
                 <FormControl fullWidth margin="normal">
@@ -3,7 +3,6 @@ import {
   Box,
   Typography,
   Paper,
-  CircularProgress,
   Alert,
   Button,
   Dialog,
@@ -31,16 +30,15 @@ import { DatePicker } from '@mui/x-date-pickers/DatePicker';
 import { format } from 'date-fns';
 import fr from 'date-fns/locale/fr';
 import { useNavigate } from 'react-router-dom';
+import { useServerDataGrid, isOperators } from '../components/useServerDataGrid';
+import { cachedFetch } from '../components/cachedFetch';
 
 /**
  * Clients component - Manages clients data with creation and deletion operations
  */
 const Clients = () => {
   const navigate = useNavigate();
-  const [loading, setLoading] = useState(true);
-  const [clients, setClients] = useState([]);
   const [agents, setAgents] = useState([]);
-  const [error, setError] = useState(null);
   const [isAddingClient, setIsAddingClient] = useState(false);
   const [deleteConfirmOpen, setDeleteConfirmOpen] = useState(false);
   const [clientToDelete, setClientToDelete] = useState(null);
@@ -57,12 +55,20 @@ const Clients = () => {
   const [snackbar, setSnackbar] = useState({ open: false, message: '', severity: 'success' });
   const [formErrors, setFormErrors] = useState({});
 
+  // Clients loaded one page at a time, filtered and sorted by the API
+  const clientsGrid = useServerDataGrid({
+    url: 'http://localhost:8000/api/clients',
+    defaultSort: 'nom',
+    filterFields: { agent: 'agent', etat_contrat: 'etat_contrat' }
+  });
+
   // Define the columns for DataGrid with delete actions
   const columns = [
     { 
       field: 'id', 
       headerName: 'ID', 
       width: 70,
+      filterable: false,
       headerClassName: 'super-app-theme--header'
     },
     { 
@@ -70,6 +76,7 @@ const Clients = () => {
       headerName: 'Nom', 
       width: 200,
       flex: 1,
+      filterable: false,
       headerClassName: 'super-app-theme--header'
     },
     {
@@ -77,18 +84,24 @@ const Clients = () => {
       headerName: 'Spécialité',
       width: 150,
       flex: 1,
+      sortable: false,
+      filterable: false,
       headerClassName: 'super-app-theme--header'
     },
     {
       field: 'tel',
       headerName: 'Tél',
       width: 120,
+      sortable: false,
+      filterable: false,
       headerClassName: 'super-app-theme--header'
     },
     {
       field: 'mode',
       headerName: 'Mode',
       width: 100,
+      sortable: false,
+      filterable: false,
       headerClassName: 'super-app-theme--header',
       valueFormatter: (params) => `${params.value} jours`
     },
@@ -96,12 +109,20 @@ const Clients = () => {
       field: 'agent',
       headerName: 'Agent',
       width: 150,
+      sortable: false,
+      type: 'singleSelect',
+      valueOptions: agents.map((agent) => agent.nom),
+      filterOperators: isOperators,
       headerClassName: 'super-app-theme--header'
     },
     {
       field: 'etat_contrat',
       headerName: 'État Contrat',
       width: 120,
+      sortable: false,
+      type: 'singleSelect',
+      valueOptions: ['Actif', 'Pause', 'Terminé'],
+      filterOperators: isOperators,
       headerClassName: 'super-app-theme--header',
       renderCell: (params) => {
         let color;
@@ -125,12 +146,16 @@ const Clients = () => {
       field: 'debut_contrat',
       headerName: 'Début Contrat',
       width: 130,
+      sortable: false,
+      filterable: false,
       headerClassName: 'super-app-theme--header'
     },
     {
       field: 'fin_contrat',
       headerName: 'Fin Contrat',
       width: 130,
+      sortable: false,
+      filterable: false,
       headerClassName: 'super-app-theme--header'
     },
     {
@@ -171,26 +196,10 @@ const Clients = () => {
     return response.json();
   };
 
-  // Fetch clients from the API
-  const fetchClients = async () => {
-    setLoading(true);
-    try {
-      const response = await fetch('http://localhost:8000/api/clients');
-      const data = await handleApiError(response);
-      setClients(data);
-      setError(null);
-    } catch (error) {
-      console.error('Error fetching clients:', error);
-      setError(`Erreur lors du chargement des clients: ${error.message}`);
-    } finally {
-      setLoading(false);
-    }
-  };
-
   // Fetch agents for the dropdown
   const fetchAgents = async () => {
     try {
-      const response = await fetch('http://localhost:8000/api/agents');
+      const response = await cachedFetch('http://localhost:8000/api/agents?fields=id,nom');
       const data = await handleApiError(response);
       setAgents(data);
     } catch (error) {
@@ -200,7 +209,6 @@ const Clients = () => {
   };
 
   useEffect(() => {
-    fetchClients();
     fetchAgents();
   }, []);
 
@@ -254,7 +262,7 @@ const Clients = () => {
       await handleApiError(response);
       
       // Refresh the clients list
-      await fetchClients();
+      clientsGrid.reload();
       
       // Reset form and close dialog
       setNewClient({
@@ -291,7 +299,7 @@ const Clients = () => {
       await handleApiError(response);
       
       // Refresh the data
-      await fetchClients();
+      clientsGrid.reload();
       
       // Close dialog and show success message
       setDeleteConfirmOpen(false);
@@ -314,14 +322,6 @@ const Clients = () => {
     navigate(`/clients/${client.id}`);
   };
 
-  if (loading) {
-    return (
-      <Box sx={{ display: 'flex', justifyContent: 'center', alignItems: 'center', height: '80vh' }}>
-        <CircularProgress />
-      </Box>
-    );
-  }
-
   return (
     <Box sx={{ width: '100%' }}>
       <Box 
@@ -344,18 +344,16 @@ const Clients = () => {
         </Button>
       </Box>
 
-      {error && (
+      {clientsGrid.error && (
         <Alert severity="error" sx={{ mb: 3 }}>
-          {error}
+          Erreur lors du chargement des clients: {clientsGrid.error}
         </Alert>
       )}
 
       <Box sx={{ height: 650, width: '100%' }}>
         <DataGrid
-          rows={clients}
+          {...clientsGrid.gridProps}
           columns={columns}
-          pageSize={10}
-          rowsPerPageOptions={[5, 10, 25]}
           autoHeight
           disableColumnSelector
           hideFooterSelectedRowCount
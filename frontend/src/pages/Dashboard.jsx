@@ -17,6 +17,7 @@ import {
   Engineering as AgentsIcon,
   Category as ProduitsServicesIcon,
 } from '@mui/icons-material';
+import { cachedFetch } from '../components/cachedFetch';
 
 /**
  * Dashboard component - Main entry point of the application.
@@ -25,6 +26,48 @@ import {
  */
 const Dashboard = () => {
   const navigate = useNavigate();
+  const [loading, setLoading] = useState(true);
+  const [kpi, setKpi] = useState(null);
+  const [error, setError] = useState(null);
+
+  useEffect(() => {
+    fetchDashboard();
+  }, []);
+
+  // The KPIs are read from a summary table kept up to date by the backend,
+  // a single request whatever the size of the data
+  const fetchDashboard = async () => {
+    try {
+      setLoading(true);
+      const response = await cachedFetch('http://localhost:8000/api/dashboard');
+
+      if (!response.ok) {
+        throw new Error(`Erreur HTTP: ${response.status}`);
+      }
+
+      const data = await response.json();
+      setKpi(data);
+      setError(null);
+    } catch (error) {
+      console.error('Erreur lors du chargement du tableau de bord:', error);
+      setError(`Erreur lors du chargement du tableau de bord: ${error.message}`);
+      setKpi(null);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  // KPI cards, the activity is the one of the current month
+  const kpiCards = kpi ? [
+    { title: 'Contrats actifs', value: kpi.contrats_actifs.toLocaleString() },
+    { title: `Passages (${kpi.mois})`, value: kpi.nb_passages.toLocaleString() },
+    { title: `Poids collecté (${kpi.mois})`, value: `${kpi.poids_collecte.toLocaleString()} kg` },
+    { title: `Excès de poids (${kpi.mois})`, value: `${kpi.exces_poids.toLocaleString()} kg / ${kpi.montant_exces.toLocaleString()} DA` },
+    { title: `Montant des passages (${kpi.mois})`, value: `${kpi.montant_passages.toLocaleString()} DA` },
+    { title: `Versements (${kpi.mois})`, value: `${kpi.versements.toLocaleString()} DA` },
+    { title: 'Dette fournisseurs', value: `${kpi.dette_fournisseurs.toLocaleString()} DA` },
+    { title: 'Valeur du stock', value: `${kpi.valeur_stock.toLocaleString()} DA` },
+  ] : [];
 
   // Define the main navigation cards
   const mainCards = [
@@ -66,6 +109,34 @@ const Dashboard = () => {
         Tableau de Bord
       </Typography>
 
+      {error && (
+        <Alert severity="error" sx={{ mb: 2 }}>
+          {error}
+        </Alert>
+      )}
+
+      {/* KPI cards */}
+      {loading ? (
+        <Box sx={{ display: 'flex', justifyContent: 'center', mb: 4 }}>
+          <CircularProgress />
+        </Box>
+      ) : (
+        <Grid container spacing={2} sx={{ mb: 4 }}>
+          {kpiCards.map((card, index) => (
+            <Grid item xs={12} sm={6} md={3} key={index}>
+              <Paper sx={{ p: 2, height: '100%' }}>
+                <Typography variant="body2" color="text.secondary">
+                  {card.title}
+                </Typography>
+                <Typography variant="h6" sx={{ fontWeight: 'bold' }}>
+                  {card.value}
+                </Typography>
+              </Paper>
+            </Grid>
+          ))}
+        </Grid>
+      )}
+
       {/* Grid of main navigation cards */}
       <Grid container spacing={4}>
         {mainCards.map((card, index) => (
@@ -20,6 +20,7 @@ import {
   Edit as EditIcon, 
   Delete as DeleteIcon 
 } from '@mui/icons-material';
+import { cachedFetch } from '../components/cachedFetch';
 
 /**
  * Fournisseurs component - Manages suppliers data with CRUD operations
@@ -107,7 +108,7 @@ const Fournisseurs = () => {
     setLoading(true);
     try {
       // Fetch suppliers
-      const response = await fetch('http://localhost:8000/api/fournisseurs');
+      const response = await cachedFetch('http://localhost:8000/api/fournisseurs');
       const data = await handleApiError(response);
       setFournisseurs(data);
       setError(null);
@@ -7,6 +7,7 @@ import {
   Alert
 } from '@mui/material';
 import { DataGrid, frFR } from '@mui/x-data-grid';
+import { cachedFetch } from '../components/cachedFetch';
 
 /**
  * Inventaire component - Displays a list of products in inventory with quantities and last prices
@@ -23,7 +24,7 @@ const Inventaire = () => {
   const fetchInventory = async () => {
     try {
       setLoading(true);
-      const response = await fetch('http://localhost:8000/api/inventaire');
+      const response = await cachedFetch('http://localhost:8000/api/inventaire');
       
       if (!response.ok) {
         throw new Error(`Erreur HTTP: ${response.status}`);
@@ -63,7 +64,8 @@ const Inventaire = () => {
       width: 220,
       align: 'right',
       headerAlign: 'right',
-      valueFormatter: (params) => `${params.value.toFixed(2)} DA`,
+      // No price until the produit is bought with one
+      valueFormatter: (params) => (params.value == null ? '-' : `${params.value.toFixed(2)} DA`),
     }
   ];
 
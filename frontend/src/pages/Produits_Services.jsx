@@ -27,6 +27,7 @@ import {
   Edit as EditIcon, 
   Delete as DeleteIcon 
 } from '@mui/icons-material';
+import { cachedFetch } from '../components/cachedFetch';
 
 /**
  * Produits_Services component - Displays tabs for products and services
@@ -153,12 +154,12 @@ const Produits_Services = () => {
     setLoading(true);
     try {
       // Fetch products
-      const productsResponse = await fetch('http://localhost:8000/api/produits');
+      const productsResponse = await cachedFetch('http://localhost:8000/api/produits');
       const productsData = await handleApiError(productsResponse);
       setProducts(productsData);
 
       // Fetch services
-      const servicesResponse = await fetch('http://localhost:8000/api/services');
+      const servicesResponse = await cachedFetch('http://localhost:8000/api/services');
       const servicesData = await handleApiError(servicesResponse);
       setServices(servicesData);
 
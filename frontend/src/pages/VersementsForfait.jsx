@@ -10,45 +10,53 @@ import {
 import { DataGrid, frFR } from '@mui/x-data-grid';
 import { format, parse } from 'date-fns';
 import fr from 'date-fns/locale/fr';
+import {
+  useServerDataGrid,
+  isOperators,
+  dateRangeOperators,
+  parseApiDate
+} from '../components/useServerDataGrid';
+import { cachedFetch } from '../components/cachedFetch';
+import ExportButtons from '../components/ExportButtons';
 
 /**
  * VersementsForfait page displays all versements forfait in a DataGrid
  */
 const VersementsForfait = () => {
-  const [versements, setVersements] = useState([]);
   const [clients, setClients] = useState([]);
   const [contracts, setContracts] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
-  // Fetch all necessary data when component mounts
+  // Rows loaded one page at a time, filtered and sorted by the API
+  const grid = useServerDataGrid({
+    url: 'http://localhost:8000/api/versements-forfait',
+    defaultSort: '-date',
+    filterFields: { client_id: 'client_id' },
+    dateField: 'date',
+    initialSortModel: [{ field: 'date', sort: 'desc' }]
+  });
+
+  // Fetch the clients and contracts shown in the rows when component mounts
   useEffect(() => {
     const fetchData = async () => {
       setLoading(true);
       try {
-        // Fetch versements
-        const versementsResponse = await fetch('http://localhost:8000/api/versements-forfait');
-        if (!versementsResponse.ok) {
-          throw new Error(`Erreur HTTP ${versementsResponse.status}`);
-        }
-        const versementsData = await versementsResponse.json();
-
         // Fetch clients
-        const clientsResponse = await fetch('http://localhost:8000/api/clients');
+        const clientsResponse = await cachedFetch('http://localhost:8000/api/clients?fields=id,nom');
         if (!clientsResponse.ok) {
           throw new Error(`Erreur HTTP ${clientsResponse.status}`);
         }
         const clientsData = await clientsResponse.json();
         
         // Fetch contracts
-        const contractsResponse = await fetch('http://localhost:8000/api/contrats-forfait');
+        const contractsResponse = await cachedFetch('http://localhost:8000/api/contrats-forfait?fields=id,date_debut,date_fin,montant');
         if (!contractsResponse.ok) {
           throw new Error(`Erreur HTTP ${contractsResponse.status}`);
         }
         const contractsData = await contractsResponse.json();
 
         // Update state with fetched data
-        setVersements(versementsData);
         setClients(clientsData);
         setContracts(contractsData);
         setError(null);
@@ -70,20 +78,30 @@ const VersementsForfait = () => {
       headerName: 'Date', 
       width: 120,
       headerClassName: 'super-app-theme--header',
+      type: 'date',
+      valueGetter: (params) => parseApiDate(params.value),
+      valueFormatter: (params) => (params.value ? format(params.value, 'dd/MM/yyyy') : ''),
+      filterOperators: dateRangeOperators,
     },
     { 
-      field: 'client_name', 
+      field: 'client_id', 
       headerName: 'Client', 
       width: 250, 
       flex: 1,
       headerClassName: 'super-app-theme--header',
-      valueGetter: (params) => {
-        const client = clients.find(c => c.id === params.row.client_id);
-        return client ? client.nom : `Client ID: ${params.row.client_id}`;
+      sortable: false,
+      type: 'singleSelect',
+      valueOptions: clients.map((client) => ({ value: client.id, label: client.nom })),
+      filterOperators: isOperators,
+      valueFormatter: (params) => {
+        const client = clients.find(c => c.id === params.value);
+        return client ? client.nom : `Client ID: ${params.value}`;
       }
     },
     { 
       field: 'contract_info', 
+      sortable: false,
+      filterable: false,
       headerName: 'Contrat', 
       width: 250, 
       flex: 1,
@@ -97,6 +115,8 @@ const VersementsForfait = () => {
     },
     { 
       field: 'montant', 
+      sortable: false,
+      filterable: false,
       headerName: 'Montant', 
       width: 150,
       headerClassName: 'super-app-theme--header',
@@ -125,27 +145,25 @@ const VersementsForfait = () => {
 
   return (
     <Container maxWidth="xl" sx={{ mt: 4, mb: 4 }}>
-      <Typography variant="h4" sx={{ mb: 4, fontWeight: 'bold' }}>
-        Versements Forfaits
-      </Typography>
+      <Box sx={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', mb: 4 }}>
+        <Typography variant="h4" sx={{ fontWeight: 'bold' }}>
+          Versements Forfaits
+        </Typography>
+        <ExportButtons url="http://localhost:8000/api/export/versements-forfait" dateRange={grid.dateRange} />
+      </Box>
 
       <Paper elevation={3} sx={{ width: '100%', mb: 4, p: 3 }}>
+        {grid.error && (
+          <Alert severity="error" sx={{ mb: 2 }}>
+            Erreur lors de la récupération des versements: {grid.error}
+          </Alert>
+        )}
         <Box sx={{ height: 650, width: '100%' }}>
           <DataGrid
-            rows={versements}
+            {...grid.gridProps}
             columns={columns}
-            initialState={{
-              pagination: {
-                paginationModel: { pageSize: 10 },
-              },
-              sorting: {
-                sortModel: [{ field: 'date', sort: 'desc' }],
-              },
-            }}
-            pageSizeOptions={[10, 25, 50]}
             disableRowSelectionOnClick
             disableColumnSelector
-            disableColumnFilter
             hideFooterSelectedRowCount
             localeText={frFR.components.MuiDataGrid.defaultProps.localeText}
             sx={{
@@ -1,3 +1,20 @@
+# Start the FastAPI backend.
+#
+# Usage:
+#   .\start_backend.ps1                 Development: one process, reloads on code changes
+#   .\start_backend.ps1 -Workers 4      Production: 4 worker processes, no reload
+#
+# Several workers share the same SQLite database file. This is safe because every
+# connection uses WAL mode and a busy timeout (see backend/database.py). The
+# database settings can be changed with environment variables, for example:
+#   $env:DB_POOL_SIZE = "8"             Connections (and worker threads) per process
+#   $env:DB_BUSY_TIMEOUT_MS = "5000"    How long a writer waits for the lock
+#   $env:DB_CACHE_SIZE_KIB = "20000"    Page cache per connection
+#   $env:DB_MMAP_SIZE = "268435456"     Memory mapped part of the database file
+param(
+    [int]$Workers = 0
+)
+
 # Save the current directory
 $originalLocation = Get-Location
 
@@ -7,20 +24,26 @@ Set-Location backend
 # Activate the virtual environment
 .\venv\Scripts\Activate.ps1
 
-try { 
+try {
     # Start the FastAPI server using uvicorn
     # Using host 127.0.0.1 to allow local access and port 8000
-    uvicorn main:app --host 127.0.0.1 --port 8000 --reload
+    if ($Workers -gt 0) {
+        # Multi-process mode (--reload cannot be combined with --workers)
+        uvicorn main:app --host 127.0.0.1 --port 8000 --workers $Workers
+    }
+    else {
+        uvicorn main:app --host 127.0.0.1 --port 8000 --reload
+    }
 }
 finally {
     # This block will run even when CTRL+C is pressed
-    
+
     # Deactivate the virtual environment
     deactivate
-    
+
     # Clear the screen
     Clear-Host
-    
+
     # Return to the original directory
     Set-Location $originalLocation
 }